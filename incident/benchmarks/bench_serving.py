@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Compare les deux modes de service de l'API Incidents sur les mêmes routes :
+# - "wsgi" : application Flask (serveur Werkzeug, un thread par requête)
+# - "asgi" : asgi:app sous uvicorn (redis.asyncio, une seule boucle d'événements)
+# Utilisation : python benchmarks/bench_serving.py [requêtes] [concurrence] [attentes_longues]
+# Les deux serveurs sont lancés sur les ports 5100 et 5200 avec le Redis configuré (REDIS_*) ;
+# un incident INC-xxx et une entrée du stream des changements sont créés pour le test.
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+HOST = "127.0.0.1"
+SERVERS = {
+    "wsgi": (5100, [sys.executable, "-m", "flask", "--app", "main", "run", "--with-threads", "--port", "5100"]),
+    "asgi": (5200, [sys.executable, "-m", "uvicorn", "asgi:app", "--port", "5200", "--log-level", "warning"]),
+}
+
+
+async def http(port, method, path, body=None):
+    # Requête HTTP/1.1 minimale (une connexion par requête) ; retourne (statut, corps, durée)
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(HOST, port)
+    head = f"{method} {path} HTTP/1.1\r\nHost: {HOST}:{port}\r\nConnection: close\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    writer.write(head.encode() + b"\r\n" + (body or b""))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b" ", 2)[1])
+    return status, response.split(b"\r\n\r\n", 1)[1], time.perf_counter() - start
+
+
+async def gather_limited(count, concurrency, factory):
+    # Exécute 'count' requêtes avec au plus 'concurrency' en cours
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                return await factory()
+            except OSError:
+                return 0, b"", 0.0
+
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+def summary(label, results, elapsed):
+    latencies = sorted(duration for status, _, duration in results if status == 200)
+    errors = len(results) - len(latencies)
+    p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float("nan")
+    print(f"  {label:<26} {len(results) / elapsed:9.0f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  erreurs {errors}")
+
+
+async def scenario(port, requests, concurrency, waiters):
+    body = json.dumps({"title": "Benchmark de service", "sev": "low"}).encode()
+    status, content, _ = await http(port, "POST", "/api/v1/incidents", body)
+    incident_id = json.loads(content)["id"]
+
+    start = time.perf_counter()
+    results = await gather_limited(requests, concurrency,
+                                   lambda: http(port, "GET", f"/api/v1/incidents/{incident_id}"))
+    summary("lecture par ID", results, time.perf_counter() - start)
+
+    # Clients lents : attentes longues ouvertes, puis lectures pendant l'attente
+    polls = [asyncio.create_task(http(port, "GET", "/api/v1/incidents/changes?timeout=20"))
+             for _ in range(waiters)]
+    await asyncio.sleep(2)
+    start = time.perf_counter()
+    results = await gather_limited(min(requests, 200), concurrency,
+                                   lambda: http(port, "GET", f"/api/v1/incidents/{incident_id}"))
+    summary(f"lecture ({waiters} en attente)", results, time.perf_counter() - start)
+
+    # Une modification doit réveiller toutes les attentes
+    start = time.perf_counter()
+    await http(port, "PUT", f"/api/v1/incidents/{incident_id}/status", json.dumps({"status": "resolved"}).encode())
+    done, pending = await asyncio.wait(polls, timeout=10)
+    for task in pending:
+        task.cancel()
+    woken = [task.result() for task in done if not task.exception() and task.result()[0] == 200
+             and json.loads(task.result()[1])["count"] > 0]
+    print(f"  attentes réveillées         {len(woken)}/{waiters} en {time.perf_counter() - start:.2f} s")
+
+
+async def wait_ready(port, process):
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur du port {port} s'est arrêté.")
+        try:
+            if (await http(port, "GET", "/api/v1/incidents/health"))[0] == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Le serveur du port {port} ne répond pas.")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    waiters = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    for mode, (port, command) in SERVERS.items():
+        process = subprocess.Popen(command, cwd=SRC, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_ready(port, process))
+            print(f"Mode '{mode}' ({requests} requêtes, concurrence {concurrency}) :")
+            asyncio.run(scenario(port, requests, concurrency, waiters))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+
+# Va aller chercher le dossier src, la ou se trouve redis_link
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import redis_link  # noqa: E402
+
+# Compare les modes de stockage "json" (document string) et "hash" (un champ par attribut)
+# Utilisation : python benchmarks/bench_storage.py [nombre_incidents]
+# Attention : écrit des clés INC-BENCH-* dans le Redis configuré ; les transitions passent par
+# les scripts Lua et modifient aussi les index, le stream des changements et les statistiques.
+# Le benchmark refuse donc la base par défaut (REDIS_DB=0) : utiliser une base dédiée. Les
+# incidents, leurs index (statut, commandant, termes de recherche) et leurs versions sont
+# supprimés à la fin, et les statistiques remises dans leur état initial.
+
+POSTMORTEM = {
+    "what_happened": "Saturation du pool de connexions de la base principale. " * 40,
+    "root_cause": "Une requête non indexée déclenchée par un batch nocturne. " * 40,
+    "action_items": [f"Action corrective n°{i}" for i in range(50)],
+    "added_at": 1730073600
+}
+
+
+def make_incident(i):
+    return {
+        "id": f"INC-BENCH-{i:06d}",
+        "title": f"Incident de benchmark {i}",
+        "sev": 2,
+        "services": ["api-gateway", "db"],
+        "summary": "p95 > 2s en EU-West",
+        "status": "open",
+        "started_at": 1730073600 + i,
+        "commander": None,
+        "postmortem": POSTMORTEM
+    }
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {elapsed * 1000:9.1f} ms  {count / elapsed:10.0f} ops/s")
+
+
+def run(mode, count):
+    redis_link.STORAGE_MODE = mode
+    ids = [make_incident(i)["id"] for i in range(count)]
+    print(f"Mode '{mode}' ({count} incidents) :")
+    timed("création", count, lambda: [redis_link.saveJSONFile(make_incident(i)) for i in range(count)])
+    timed("changement de statut", count, lambda: [redis_link.setIncidentStatus(id, "resolved") for id in ids])
+    timed("assignation", count, lambda: [redis_link.assignCommander(id, "bench") for id in ids])
+    timed("lecture statut", count, lambda: redis_link.loadJSONFiles(ids, fields=["status", "commander"]))
+    timed("lecture complète", count, lambda: [redis_link.readJSONFile(id) for id in ids])
+    timed("lecture en masse", count, lambda: redis_link.loadJSONFiles(ids))
+    cleanup(ids)
+
+
+def stats_keys():
+    # Statistiques modifiées par les créations et les transitions du benchmark
+    return [redis_link.STATS_SEVERITY_KEY, redis_link.STATS_STATUS_KEY, redis_link.STATS_RESOLUTION_KEY,
+            redis_link.STATS_DAY_KEY.format(redis_link.statsDay(time.time()))]
+
+
+def cleanup(ids):
+    # Supprime les incidents du benchmark avec leurs index, termes de recherche et versions
+    pipe = redis_link.r.pipeline()
+    for id in ids:
+        pipe.hkeys(redis_link.SEARCH_TERMS_KEY.format(id))
+    terms = pipe.execute()
+    pipe = redis_link.r.pipeline()
+    for id, incident_terms in zip(ids, terms):
+        for term in incident_terms:
+            pipe.zrem(redis_link.SEARCH_TERM_KEY.format(term), id)
+    pipe.delete(*ids, *(redis_link.SEARCH_TERMS_KEY.format(id) for id in ids))
+    pipe.srem(redis_link.INDEXED_FIELDS["status"].format("resolved"), *ids)
+    pipe.srem(redis_link.INDEXED_FIELDS["commander"].format("bench"), *ids)
+    pipe.hdel(redis_link.VERSIONS_KEY, *ids)
+    pipe.execute()
+
+
+if __name__ == '__main__':
+    try:
+        redis_link.r.ping()
+    except redis_link.UNAVAILABLE as e:
+        sys.exit(f"Redis injoignable : {e}")
+    if not redis_link.REDIS_CONFIG["db"]:
+        sys.exit("Base Redis par défaut : lancer le benchmark sur une base dédiée (REDIS_DB=1 par exemple).")
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    keys = stats_keys()
+    snapshots = [redis_link.rb.dump(key) for key in keys]
+    try:
+        for mode in redis_link.STORAGE_MODES:
+            run(mode, count)
+    finally:
+        # Statistiques remises dans leur état d'avant le benchmark
+        pipe = redis_link.rb.pipeline()
+        pipe.delete(*keys)
+        for key, snapshot in zip(keys, snapshots):
+            if snapshot is not None:
+                pipe.restore(key, 0, snapshot)
+        pipe.execute()
@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import threading
+
+import compression
+
+# Stockage froid des incidents résolus depuis longtemps : base SQLite locale,
+# un document JSON compressé par incident (timeline comprise).
+# Les colonnes status, commander et started_at permettent de filtrer et de paginer
+# comme les index Redis, sans décompresser les documents.
+
+FILTER_COLUMNS = ("status", "commander")
+
+
+class IncidentArchive:
+    """
+    Archive des incidents dans une base SQLite ('path').
+
+    - Les documents sont compressés avec 'algorithm' (voir compression.py) quelle que soit leur taille.
+    - La base n'est ouverte qu'au premier accès et n'est créée qu'à la première écriture :
+      tant que rien n'est archivé, les lectures ne renvoient rien sans toucher au disque.
+    - Une seule connexion est partagée entre les threads, protégée par un verrou.
+    - Sans 'path' (None), l'archive est désactivée : les lectures ne renvoient rien et
+      toute écriture lève ValueError.
+    """
+
+    def __init__(self, path, algorithm="zlib"):
+        self.path = path
+        self.algorithm = algorithm
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self.path is None:
+            raise ValueError("Archive désactivée : aucun fichier d'archive n'est configuré.")
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS incidents ("
+                "id TEXT PRIMARY KEY, status TEXT, commander TEXT, "
+                "started_at INTEGER, resolved_at INTEGER, document BLOB NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS incidents_started_at ON incidents (started_at, id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS incidents_commander ON incidents (commander)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def exists(self):
+        # La base a-t-elle déjà été créée (ou ouverte) ?
+        return self._connection is not None or self.path is not None and os.path.exists(self.path)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            if not self.exists():
+                return []
+            return self._connect().execute(sql, params).fetchall()
+
+    def put(self, records):
+        """
+        Enregistre (ou remplace) des incidents dans une seule transaction.
+        'records' : liste de (incident décodé, document JSON encodé en bytes).
+        """
+        rows = [(
+            obj["id"], obj.get("status"), obj.get("commander"), obj.get("started_at"),
+            obj.get("resolved_at"), compression.compress(document, self.algorithm, threshold=1)
+        ) for obj, document in records]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO incidents VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def delete(self, ids):
+        ids = [(id,) for id in ids]
+        with self._lock:
+            if not ids or not self.exists():
+                return
+            connection = self._connect()
+            with connection:
+                connection.executemany("DELETE FROM incidents WHERE id = ?", ids)
+
+    def get(self, id):
+        # Document JSON (bytes) d'un incident archivé, ou None
+        return self.get_many([id]).get(id)
+
+    def get_many(self, ids):
+        # Documents JSON (bytes) des incidents archivés parmi 'ids', par ID
+        ids = list(ids)
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._query(f"SELECT id, document FROM incidents WHERE id IN ({placeholders})", ids)
+        return {id: compression.decompress(document) for id, document in rows}
+
+    def where(self, filters):
+        # Clause WHERE et paramètres correspondant aux filtres (status, commander)
+        unknown = set(filters) - set(FILTER_COLUMNS)
+        if unknown:
+            raise ValueError(f"Filtres non pris en charge par l'archive : {sorted(unknown)}")
+        conditions = [f"{column} = ?" for column in filters]
+        return conditions, list(filters.values())
+
+    def ids(self, **filters):
+        # IDs des incidents archivés correspondant aux filtres
+        conditions, params = self.where(filters)
+        sql = "SELECT id FROM incidents" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        return {row[0] for row in self._query(sql, params)}
+
+    def iter_documents(self, batch_size=500, **filters):
+        """
+        Parcourt les incidents archivés correspondant aux filtres, par paquets de
+        'batch_size' (ordre des IDs). Génère des paires (ID, document JSON en bytes).
+        """
+        conditions, params = self.where(filters)
+        last_id = ""
+        while True:
+            rows = self._query(
+                "SELECT id, document FROM incidents WHERE " + " AND ".join(conditions + ["id > ?"])
+                + " ORDER BY id LIMIT ?",
+                params + [last_id, batch_size]
+            )
+            for id, document in rows:
+                yield id, compression.decompress(document)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def page(self, limit, after=None, since=None, until=None, descending=False, **filters):
+        """
+        Retourne au plus 'limit' paires (started_at, ID) triées comme l'index temporel
+        de Redis, situées strictement après la position 'after' = (started_at, ID).
+        """
+        conditions, params = self.where(filters)
+        conditions.append("started_at IS NOT NULL")
+        if since is not None:
+            conditions.append("started_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("started_at <= ?")
+            params.append(until)
+        if after is not None:
+            operator = "<" if descending else ">"
+            conditions.append(f"(started_at {operator} ? OR (started_at = ? AND id {operator} ?))")
+            params.extend([after[0], after[0], after[1]])
+        order = "DESC" if descending else "ASC"
+        rows = self._query(
+            "SELECT started_at, id FROM incidents WHERE " + " AND ".join(conditions)
+            + f" ORDER BY started_at {order}, id {order} LIMIT ?",
+            params + [limit]
+        )
+        return [(int(started_at), id) for started_at, id in rows]
+
+    def count(self):
+        rows = self._query("SELECT COUNT(*) FROM incidents")
+        return rows[0][0] if rows else 0
@@ -0,0 +1,403 @@
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import redis.asyncio as aioredis
+from asgiref.wsgi import WsgiToAsgi
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag
+
+import codec
+import identifiers
+import redis_link
+from main import (
+    MAX_PAGE_SIZE, MAX_POLL_TIMEOUT, SSE_BATCH_SIZE, SSE_HEADERS, SSE_KEEPALIVE, SSE_RETRY_MS, app as flask_app,
+    poll_parameters, requested_fields, sse_event, stream_parameters
+)
+
+# Point d'entrée ASGI du microservice Incidents :
+#   uvicorn asgi:app --app-dir src --host 0.0.0.0 --port 8000
+# Les routes de lecture les plus sollicitées et l'attente longue des modifications sont
+# servies nativement avec redis.asyncio (pool partagé par le processus) : une requête en
+# attente n'occupe ni thread ni connexion Redis. Toutes les autres routes sont celles de
+# l'application Flask, exécutées dans un pool de threads ; le routage est celui de Flask.
+
+# Modifications lues par paquet par le lecteur unique du stream des changements
+NOTIFIER_BATCH_SIZE = 1000
+NOTIFIER_BLOCK_MS = 5000
+# Dernières modifications gardées en mémoire pour les flux SSE
+NOTIFIER_BUFFER_SIZE = 10000
+
+
+def connectionPool(decode_responses=True, **overrides):
+    # Pool asynchrone configuré comme le pool synchrone de redis_link (REDIS_*)
+    config = dict(redis_link.REDIS_CONFIG, **overrides)
+    return aioredis.BlockingConnectionPool(
+        retry=Retry(ExponentialBackoff(cap=redis_link.REDIS_BACKOFF_CAP, base=redis_link.REDIS_BACKOFF_BASE),
+                    redis_link.REDIS_RETRIES, supported_errors=redis_link.RETRIED),
+        retry_on_error=list(redis_link.RETRIED),
+        decode_responses=decode_responses,
+        **config
+    )
+
+
+class Clients:
+    """
+    Clients Redis asynchrones partagés, créés au premier usage dans la boucle courante
+    (un pool est lié à la boucle asyncio qui ouvre ses connexions).
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.r = None
+        self.rb = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.r = aioredis.Redis(connection_pool=connectionPool())
+            self.rb = aioredis.Redis(connection_pool=connectionPool(decode_responses=False))
+        return self.r, self.rb
+
+    async def close(self):
+        for client in (self.r, self.rb):
+            if client is not None:
+                await client.aclose()
+        self.loop = self.r = self.rb = None
+
+
+class ChangeNotifier(redis_link.ChangeBuffer):
+    """
+    Lecteur unique du stream des changements : une seule connexion Redis bloquée en XREAD
+    réveille toutes les requêtes en attente, quel que soit leur nombre.
+    Les dernières modifications lues sont gardées en mémoire : les flux SSE les y
+    prennent sans relire Redis.
+    """
+
+    def __init__(self):
+        super().__init__(NOTIFIER_BUFFER_SIZE)
+        self.loop = None
+        self.event = None
+        self.task = None
+
+    def current(self):
+        # Événement déclenché à la prochaine modification (à prendre avant de lire le stream)
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task.done():
+            self.loop = loop
+            self.event = asyncio.Event()
+            self.task = loop.create_task(self.run())
+        return self.event
+
+    async def run(self):
+        # Connexion dédiée sans délai de lecture : l'attente est bornée par BLOCK
+        client = aioredis.Redis(connection_pool=connectionPool(socket_timeout=None, max_connections=1))
+        delay = redis_link.REDIS_BACKOFF_BASE
+        try:
+            last_id = None
+            while True:
+                try:
+                    if last_id is None:
+                        entries = await client.xrevrange(redis_link.CHANGES_STREAM, count=1)
+                        last_id = entries[0][0] if entries else "0-0"
+                        self.reset(last_id)
+                    response = await client.xread(
+                        {redis_link.CHANGES_STREAM: last_id}, count=NOTIFIER_BATCH_SIZE, block=NOTIFIER_BLOCK_MS
+                    )
+                    delay = redis_link.REDIS_BACKOFF_BASE
+                except redis_link.UNAVAILABLE:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, redis_link.REDIS_BACKOFF_CAP)
+                    continue
+                if response:
+                    last_id = response[0][1][-1][0]
+                    self.append(redis_link.decodeChanges(response))
+                    event, self.event = self.event, asyncio.Event()
+                    event.set()
+        finally:
+            self.reset(None)
+            await client.aclose()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.loop = self.task = None
+
+
+clients = Clients()
+notifier = ChangeNotifier()
+
+
+class Request:
+    # Requête HTTP minimale construite à partir du scope ASGI
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        query = parse_qs(scope["query_string"].decode(), keep_blank_values=True)
+        self.args = {name: values[0] for name, values in query.items()}
+
+
+class Response:
+    def __init__(self, body=b"", status=200, etag=None, content_type="application/json"):
+        self.body = body
+        self.status = status
+        self.headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+        if etag is not None:
+            self.headers.append((b"etag", quote_etag(etag).encode()))
+
+    async def send(self, send, receive):
+        await send({"type": "http.response.start", "status": self.status, "headers": self.headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class StreamResponse:
+    # Réponse envoyée morceau par morceau depuis un générateur asynchrone, arrêtée quand le client part
+    def __init__(self, chunks, content_type, headers=None):
+        self.chunks = chunks
+        self.headers = [(b"content-type", content_type.encode())]
+        self.headers.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+
+    async def send(self, send, receive):
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        async def stream():
+            async for chunk in self.chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await send({"type": "http.response.start", "status": 200, "headers": self.headers})
+        watcher = asyncio.create_task(disconnected())
+        streamer = asyncio.create_task(stream())
+        try:
+            await asyncio.wait([watcher, streamer], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            streamer.cancel()
+            await asyncio.gather(watcher, streamer, return_exceptions=True)
+            await self.chunks.aclose()
+        if streamer.done() and not streamer.cancelled() and streamer.exception() is None:
+            await send({"type": "http.response.body", "body": b""})
+
+
+def json_response(obj, status=200, etag=None):
+    return Response(codec.dumps(obj), status, etag)
+
+
+def not_modified(request, etag):
+    # Réponse 304 si le client possède déjà la version 'etag' (comme main.not_modified)
+    if not parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return None
+    response = Response(status=304, etag=etag)
+    response.headers = [header for header in response.headers if header[0] == b"etag"]
+    return response
+
+
+async def health_check(request):
+    # Même réponse que la route Flask, ping asynchrone
+    r, _ = clients.get()
+    try:
+        await r.ping()
+    except redis_link.UNAVAILABLE as e:
+        return json_response({"status": "error", "service": "incidents", "redis": f"connection error: {e}"}, 500)
+    return json_response({"status": "ok", "service": "incidents", "redis": "connected", "cache": redis_link.cache.stats()})
+
+
+async def read_versioned_incident(incident_id):
+    # Comme redis_link.readVersionedJSONFile : document et version dans la même transaction
+    r, rb = clients.get()
+    pipe = (r if redis_link.STORAGE_MODE == "hash" else rb).pipeline()
+    if redis_link.STORAGE_MODE == "hash":
+        pipe.hgetall(incident_id)
+    else:
+        pipe.get(incident_id)
+    pipe.hget(redis_link.VERSIONS_KEY, incident_id)
+    data, version = await pipe.execute()
+    version = int(version or 0)
+    if data:
+        return redis_link.decodeDocument(data), version
+    # Lecture de l'archive SQLite hors de la boucle d'événements
+    document = await asyncio.to_thread(redis_link.archive.get, incident_id)
+    return (codec.loads(document), version) if document else (None, 0)
+
+
+async def read_incident_fields(incident_id, fields):
+    # Comme redis_link.loadVersionedJSONFields en mode "hash" : seuls les champs demandés sont lus
+    r, _ = clients.get()
+    fields = redis_link.fieldset(fields)
+    pipe = r.pipeline()
+    pipe.hmget(incident_id, fields)
+    pipe.hget(redis_link.VERSIONS_KEY, incident_id)
+    values, version = await pipe.execute()
+    if values[0] is None:
+        incident, version = await read_versioned_incident(incident_id)
+        return (redis_link.selectFields(incident, fields) if incident else None), version
+    mapping = {field: value for field, value in zip(fields, values) if value is not None}
+    return redis_link.decodeHash(mapping), int(version or 0)
+
+
+async def get_incident_by_id(request, incident_id):
+    # Même comportement que la route Flask : ETag, 304, cache local partagé, champs demandés
+    if not identifiers.is_incident_id(incident_id):
+        return json_response({"error": "Incident not found"}, 404)
+    r, _ = clients.get()
+    version = await r.hget(redis_link.VERSIONS_KEY, incident_id) if request.headers.get("if-none-match") else None
+    if version is not None:
+        cached = not_modified(request, f"{incident_id}-{int(version)}")
+        if cached:
+            return cached
+
+    try:
+        fields = requested_fields(request.args)
+    except ValueError:
+        return json_response(
+            {"error": "Invalid 'fields' parameter: expected a comma-separated list of field names"}, 400
+        )
+    if fields is not None and redis_link.STORAGE_MODE == "hash":
+        incident, version = await read_incident_fields(incident_id, fields)
+        if not incident:
+            return json_response({"error": "Incident not found"}, 404)
+        return json_response(incident, etag=f"{incident_id}-{version}")
+
+    cache = redis_link.cache
+    entry = None
+    if cache.enabled:
+        cache.listen(redis_link.r, redis_link.INVALIDATION_CHANNEL)
+        entry = cache.get(incident_id)
+    if entry is None:
+        generation = cache.generation
+        entry = await read_versioned_incident(incident_id)
+        if entry[0] is not None and cache.enabled:
+            cache.put(incident_id, entry, generation)
+    incident, version = entry
+    if not incident:
+        return json_response({"error": "Incident not found"}, 404)
+    if fields is not None:
+        incident = redis_link.selectFields(incident, redis_link.fieldset(fields))
+    return json_response(incident, etag=f"{incident_id}-{version}")
+
+
+async def poll_changes(request):
+    # Même contrat que la route Flask ; l'attente se fait sur le lecteur partagé
+    r, _ = clients.get()
+    try:
+        after, limit, timeout = poll_parameters(request.args)
+        if not after:
+            entries = await r.xrevrange(redis_link.CHANGES_STREAM, count=1)
+            after = entries[0][0] if entries else "0-0"
+        deadline = time.monotonic() + timeout
+        while True:
+            event = notifier.current()
+            changes = redis_link.decodeChanges(await r.xread({redis_link.CHANGES_STREAM: after}, count=limit))
+            remaining = deadline - time.monotonic()
+            if changes or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    except (ValueError, aioredis.ResponseError):
+        return json_response({
+            "error": f"Invalid parameters: 'limit' must be between 1 and {MAX_PAGE_SIZE}, "
+                     f"'timeout' between 0 and {MAX_POLL_TIMEOUT} and 'after' a change ID"
+        }, 400)
+    return json_response({"data": changes, "count": len(changes), "last_id": changes[-1]["id"] if changes else after})
+
+
+async def filter_changes(changes, filters):
+    # Comme redis_link.filterChanges, appartenances aux index vérifiées en un pipeline asynchrone
+    queries = redis_link.membershipQueries(changes, filters)
+    members = set()
+    if queries:
+        r, _ = clients.get()
+        pipe = r.pipeline(transaction=False)
+        for key, id in queries:
+            pipe.sismember(key, id)
+        members = {query for query, member in zip(queries, await pipe.execute()) if member}
+    return redis_link.matchChanges(changes, filters, members)
+
+
+async def change_events(after, filters):
+    # Événements SSE : modifications prises dans la mémoire du lecteur partagé, ou lues
+    # dans Redis tant que le client est en retard (reprise avec Last-Event-ID)
+    r, _ = clients.get()
+    yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+    if after is None:
+        entries = await r.xrevrange(redis_link.CHANGES_STREAM, count=1)
+        after = entries[0][0] if entries else "0-0"
+    while True:
+        event = notifier.current()
+        changes = notifier.since(after)
+        if changes is None:
+            changes = redis_link.decodeChanges(
+                await r.xread({redis_link.CHANGES_STREAM: after}, count=SSE_BATCH_SIZE)
+            )
+        if changes:
+            after = changes[-1]["id"]
+            events = b"".join(sse_event(change) for change in await filter_changes(changes, filters))
+            if events:
+                yield events
+            continue
+        try:
+            await asyncio.wait_for(event.wait(), SSE_KEEPALIVE)
+        except asyncio.TimeoutError:
+            yield b": keepalive\n\n"
+
+
+async def stream_changes(request):
+    # Même contrat que la route Flask ; tous les clients partagent le lecteur du stream
+    try:
+        after, filters = stream_parameters(request.args, {"Last-Event-ID": request.headers.get("last-event-id")})
+    except ValueError:
+        return json_response({"error": "Invalid 'Last-Event-ID': a change ID is expected"}, 400)
+    return StreamResponse(change_events(after, filters), "text/event-stream", SSE_HEADERS)
+
+
+# Routes servies nativement, par nom de vue Flask (méthode GET uniquement)
+NATIVE_VIEWS = {
+    "health_check": health_check,
+    "get_incident_by_id": get_incident_by_id,
+    "poll_changes": poll_changes,
+    "stream_changes": stream_changes,
+}
+
+wsgi = WsgiToAsgi(flask_app)
+url_adapter = flask_app.url_map.bind("localhost")
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await notifier.stop()
+            await clients.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "GET":
+        try:
+            endpoint, view_args = url_adapter.match(scope["path"], "GET")
+        except HTTPException:
+            endpoint = None
+        view = NATIVE_VIEWS.get(endpoint)
+        if view is not None:
+            try:
+                response = await view(Request(scope), **view_args)
+            except redis_link.UNAVAILABLE:
+                response = json_response({"error": "Redis unavailable, retry later"}, 503)
+            return await response.send(send, receive)
+    return await wsgi(scope, receive, send)
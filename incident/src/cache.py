@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+# Délais (en secondes) avant de se réabonner au canal d'invalidation après une coupure
+RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 30
+
+
+class IncidentCache:
+    """
+    Cache LRU borné, avec durée de vie, des incidents déjà décodés.
+
+    - 'maxsize' : nombre maximal d'incidents gardés en mémoire (0 désactive le cache).
+    - 'ttl' : durée de vie d'une entrée en secondes, filet de sécurité si une
+      invalidation est perdue (coupure de la connexion pub/sub par exemple).
+
+    Les objets retournés sont partagés entre les requêtes : ils ne doivent pas être modifiés.
+    """
+
+    def __init__(self, maxsize=1000, ttl=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Incrémentée à chaque invalidation : un résultat lu avant une invalidation n'est pas mis en cache
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.listener = None
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None
+            }
+
+    def listen(self, client, channel):
+        """
+        Démarre (une seule fois par processus) le thread qui écoute le canal
+        d'invalidation et retire du cache les incidents modifiés par les autres workers.
+        """
+        with self.lock:
+            if self.listener is not None or not self.enabled:
+                return
+            self.listener = threading.Thread(target=self.consume, args=(client, channel), daemon=True)
+        self.listener.start()
+
+    def consume(self, client, channel):
+        # Réabonnement automatique, avec un délai doublé à chaque échec consécutif
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                # Des invalidations ont pu être manquées avant l'abonnement
+                self.clear()
+                delay = RECONNECT_DELAY
+                while True:
+                    # Attente bornée : le délai de lecture des sockets du pool ne coupe pas l'écoute
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self.invalidate(message["data"])
+            except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+                self.clear()
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
@@ -0,0 +1,80 @@
+import json
+import re
+
+from flask.json.provider import JSONProvider
+
+# Codec JSON du microservice : orjson s'il est installé, sinon la bibliothèque standard
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Suite d'au moins 20 chiffres : un entier de plus de 64 bits, qu'orjson ne sait pas
+# décoder exactement ; ces documents passent par la bibliothèque standard
+LONG_NUMBER = re.compile(rb"\d{20}")
+
+
+def backend():
+    return "orjson" if orjson is not None else "json"
+
+
+def dumps(obj):
+    # Encode un objet en JSON compact (bytes UTF-8)
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Entier de plus de 64 bits (ou type non pris en charge) : bibliothèque standard
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data):
+    # Décode du JSON (bytes ou str)
+    if orjson is not None and not LONG_NUMBER.search(data.encode() if isinstance(data, str) else data):
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Fragment:
+    """
+    Fragment JSON déjà encodé (par exemple un document lu tel quel dans Redis),
+    inséré sans être décodé ni réencodé par dumps_fragments.
+    """
+
+    __slots__ = ("contents",)
+
+    def __init__(self, contents):
+        self.contents = contents.encode() if isinstance(contents, str) else contents
+
+
+def dumps_fragments(obj):
+    """
+    Encode un objet dont les dictionnaires et listes peuvent contenir des Fragment :
+    le contenu des fragments est recopié tel quel dans le résultat (bytes).
+    """
+    if isinstance(obj, Fragment):
+        return obj.contents
+    if isinstance(obj, dict):
+        return b"{" + b",".join(dumps(str(key)) + b":" + dumps_fragments(value) for key, value in obj.items()) + b"}"
+    if isinstance(obj, (list, tuple)):
+        return b"[" + b",".join(dumps_fragments(value) for value in obj) + b"]"
+    return dumps(obj)
+
+
+class CodecJSONProvider(JSONProvider):
+    """
+    Fournisseur JSON de Flask (jsonify, request.get_json) s'appuyant sur ce codec.
+    Enregistrement : app.json = CodecJSONProvider(app)
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype="application/json")
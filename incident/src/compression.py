@@ -0,0 +1,46 @@
+import zlib
+
+# Compression transparente des documents volumineux
+# Un document compressé commence par un octet d'en-tête indiquant l'algorithme ;
+# un document JSON non compressé commence toujours par '{'.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB_HEADER = b"\x01"
+ZSTD_HEADER = b"\x02"
+HEADERS = (ZLIB_HEADER, ZSTD_HEADER)
+ALGORITHMS = ("zlib", "zstd")
+
+
+def is_compressed(data):
+    return data[:1] in HEADERS
+
+
+def compress(data, algorithm="zlib", threshold=4096):
+    """
+    Compresse 'data' (bytes) si sa taille atteint 'threshold' octets (0 désactive
+    la compression) et si le résultat est effectivement plus petit.
+    """
+    if not threshold or len(data) < threshold:
+        return data
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise ValueError("La compression zstd nécessite le paquet 'zstandard'.")
+        compressed = ZSTD_HEADER + zstandard.ZstdCompressor().compress(data)
+    else:
+        compressed = ZLIB_HEADER + zlib.compress(data)
+    return compressed if len(compressed) < len(data) else data
+
+
+def decompress(data):
+    # Retourne le document décompressé (ou 'data' tel quel s'il n'est pas compressé)
+    header = data[:1]
+    if header == ZLIB_HEADER:
+        return zlib.decompress(data[1:])
+    if header == ZSTD_HEADER:
+        if zstandard is None:
+            raise ValueError("La décompression zstd nécessite le paquet 'zstandard'.")
+        return zstandard.ZstdDecompressor().decompress(data[1:])
+    return data
@@ -0,0 +1,62 @@
+import os
+import re
+import threading
+import time
+
+# IDs d'incidents triables par date de création, au format ULID :
+# "INC-" + 26 caractères en base32 de Crockford, codant 48 bits d'horodatage
+# (millisecondes) suivis de 80 bits aléatoires. L'ordre lexicographique des IDs
+# est l'ordre de création ; les anciens IDs (INC-XXXXXX, 6 caractères hexadécimaux)
+# restent valides mais ne portent pas de date.
+
+PREFIX = "INC-"
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+LENGTH = 26
+RANDOM_BITS = 80
+SORTABLE_ID = re.compile(rf"^{PREFIX}[{ALPHABET}]{{{LENGTH}}}$")
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+
+def encode(value):
+    chars = []
+    for _ in range(LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def new_id(timestamp_ms=None):
+    """
+    Génère un nouvel ID d'incident pour l'instant 'timestamp_ms' (maintenant par défaut).
+    Dans une même milliseconde, la partie aléatoire est incrémentée : les IDs générés
+    par un processus restent strictement croissants.
+    """
+    global _last
+    if timestamp_ms is None:
+        timestamp_ms = time.time_ns() // 1_000_000
+    with _lock:
+        last_timestamp, last_random = _last
+        if timestamp_ms <= last_timestamp and last_random + 1 < 1 << RANDOM_BITS:
+            timestamp_ms, random = last_timestamp, last_random + 1
+        else:
+            random = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+        _last = (timestamp_ms, random)
+    return PREFIX + encode(timestamp_ms << RANDOM_BITS | random)
+
+
+def timestamp(id):
+    # Horodatage de création (millisecondes) d'un ID triable, None pour un ancien ID
+    if not SORTABLE_ID.match(id):
+        return None
+    value = 0
+    for char in id[len(PREFIX):]:
+        value = value * 32 + ALPHABET.index(char)
+    return value >> RANDOM_BITS
+
+
+
+def is_incident_id(id):
+    # Clé d'un incident : "INC-..." sans ':' (les sous-clés, index et autres clés Redis sont exclus)
+    return isinstance(id, str) and id.startswith(PREFIX) and ":" not in id
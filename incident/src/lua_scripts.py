@@ -0,0 +1,479 @@
+# Scripts Lua exécutés côté Redis pour les transitions d'état des incidents
+# Chaque script valide et applique la modification en un seul aller-retour atomique,
+# index secondaires, 'updated_at', versions (ETag), invalidation des caches et
+# stream des changements compris.
+#
+# Convention d'appel : KEYS[1] = clé de l'incident (toutes les clés concernées pour
+# BULK_UPDATE), ARGV[1] = mode de stockage
+# ("json" ou "hash"), ARGV[2] = timestamp courant, puis les arguments propres au script.
+# Un script retourne false si l'incident n'existe pas, sinon {version, document JSON mis
+# à jour} (mode "json") ou {version, contenu du hash...} (mode "hash").
+# Seuls les champs modifiés sont réécrits (mode "json" : remplacés dans le document encodé,
+# sans le décoder) ; le reste du document est conservé octet pour octet.
+# Un document compressé (premier octet < 0x20) ne peut pas être décodé en Lua : le script
+# répond alors l'erreur COMPRESSED et redis_link le décompresse avant de réessayer.
+# Les clés d'index sont calculées dans le script : compatible Redis standalone uniquement.
+
+# Préambule commun ; les marqueurs __XXX__ sont remplacés par les constantes de redis_link
+PRELUDE = """
+local mode = ARGV[1]
+local now = tonumber(ARGV[2])
+local INDEXES = __INDEXES__
+local CHANGES_STREAM = __CHANGES_STREAM__
+local CHANGES_MAXLEN = __CHANGES_MAXLEN__
+local INVALIDATION_CHANNEL = __INVALIDATION_CHANNEL__
+local VERSIONS_KEY = __VERSIONS_KEY__
+local LIST_VERSION_KEY = __LIST_VERSION_KEY__
+local STATS_STATUS_KEY = __STATS_STATUS_KEY__
+local STATS_RESOLUTION_KEY = __STATS_RESOLUTION_KEY__
+local STATS_DAY_PREFIX = __STATS_DAY_PREFIX__
+
+-- Champs lus en plus des champs indexés (durée de résolution)
+local TIMESTAMP_FIELDS = {"started_at", "resolved_at"}
+
+-- Document lu par load_doc (mode "json") : {payload, positions des valeurs, accolade fermante}
+local sources = {}
+
+-- Positions {début, fin} des valeurs de premier niveau d'un objet JSON encodé, par champ,
+-- et position de son accolade fermante. Le document n'est jamais décodé ni réencodé en
+-- entier : les champs non modifiés (listes vides, grands nombres...) restent tels quels.
+local function scan(payload)
+    local spans, depth, pos = {}, 0, 1
+    local expect_key, field, start = false, nil, nil
+    while true do
+        local i, _, c = string.find(payload, '([{}%[%]",:])', pos)
+        pos = i + 1
+        if c == '"' then
+            local j = pos
+            while true do
+                local k, _, d = string.find(payload, '(["\\\\])', j)
+                if d == "\\\\" then
+                    j = k + 2
+                else
+                    pos = k + 1
+                    break
+                end
+            end
+            if depth == 1 and expect_key then
+                field = cjson.decode(string.sub(payload, i, pos - 1))
+                expect_key = false
+            end
+        elseif c == ":" then
+            if depth == 1 then
+                start = pos
+            end
+        elseif c == "," then
+            if depth == 1 then
+                spans[field] = {start, i - 1}
+                expect_key = true
+            end
+        elseif c == "{" or c == "[" then
+            depth = depth + 1
+            if depth == 1 then
+                expect_key = true
+            end
+        else
+            depth = depth - 1
+            if depth == 0 then
+                if field then
+                    spans[field] = {start, i - 1}
+                end
+                return spans, i
+            end
+        end
+    end
+end
+
+-- Remplace ou ajoute des champs de premier niveau ('values' : champ -> valeur encodée en JSON)
+local function patch(payload, spans, close, values)
+    local edits, appended = {}, {}
+    for field, value in pairs(values) do
+        local span = spans[field]
+        if span then
+            table.insert(edits, {span[1], span[2], value})
+        else
+            table.insert(appended, cjson.encode(field) .. ":" .. value)
+        end
+    end
+    table.sort(edits, function(a, b) return a[1] < b[1] end)
+    local parts, pos = {}, 1
+    for _, edit in ipairs(edits) do
+        table.insert(parts, string.sub(payload, pos, edit[1] - 1))
+        table.insert(parts, edit[3])
+        pos = edit[2] + 1
+    end
+    if #appended > 0 then
+        table.insert(parts, string.sub(payload, pos, close - 1))
+        if next(spans) then
+            table.insert(parts, ",")
+        end
+        table.insert(parts, table.concat(appended, ","))
+        pos = close
+    end
+    table.insert(parts, string.sub(payload, pos))
+    return table.concat(parts)
+end
+
+-- Encode une valeur modifiée ; {json = ...} est une valeur déjà encodée, insérée telle quelle
+local function encode(value)
+    if type(value) == "table" then
+        return value.json
+    end
+    return cjson.encode(value)
+end
+
+-- Type Redis d'un incident selon le mode de stockage
+local KEY_TYPES = {json = "string", hash = "hash"}
+
+-- Champs indexés et timestamps actuels d'un incident ; nil si absent ou si la clé n'est
+-- pas un incident (autre type), nil et "COMPRESSED" si le document est compressé (mode "json")
+local function load_doc(key)
+    local fields = {unpack(TIMESTAMP_FIELDS)}
+    for field in pairs(INDEXES) do
+        table.insert(fields, field)
+    end
+    local doc = {}
+    if redis.call("TYPE", key)["ok"] ~= KEY_TYPES[mode] then
+        return nil
+    end
+    if mode == "hash" then
+        if redis.call("HEXISTS", key, "id") == 0 then
+            return nil
+        end
+        local values = redis.call("HMGET", key, unpack(fields))
+        for i, field in ipairs(fields) do
+            if values[i] then
+                doc[field] = cjson.decode(values[i])
+            end
+        end
+        return doc
+    end
+    local payload = redis.call("GET", key)
+    if not payload then
+        return nil
+    end
+    if string.byte(payload, 1) < 32 then
+        return nil, "COMPRESSED"
+    end
+    if string.sub(payload, 1, 1) ~= "{" then
+        return nil
+    end
+    local spans, close = scan(payload)
+    for _, field in ipairs(fields) do
+        local span = spans[field]
+        if span then
+            doc[field] = cjson.decode(string.sub(payload, span[1], span[2]))
+        end
+    end
+    sources[key] = {payload, spans, close}
+    return doc
+end
+
+-- Publie un enregistrement de modification compact dans le stream des changements
+local function emit_change(key, op, data)
+    redis.call("XADD", CHANGES_STREAM, "MAXLEN", "~", CHANGES_MAXLEN, "*",
+        "op", op, "incident", key, "ts", now, "data", cjson.encode(data))
+end
+
+-- Date UTC (AAAA-MM-JJ) d'un timestamp, pour les compteurs par jour
+local function day(ts)
+    local z = math.floor(ts / 86400) + 719468
+    local era = math.floor(z / 146097)
+    local doe = z - era * 146097
+    local yoe = math.floor((doe - math.floor(doe / 1460) + math.floor(doe / 36524) - math.floor(doe / 146096)) / 365)
+    local doy = doe - (365 * yoe + math.floor(yoe / 4) - math.floor(yoe / 100))
+    local mp = math.floor((5 * doy + 2) / 153)
+    local d = doy - math.floor((153 * mp + 2) / 5) + 1
+    local m = mp < 10 and mp + 3 or mp - 9
+    local y = yoe + era * 400 + (m <= 2 and 1 or 0)
+    return string.format("%04d-%02d-%02d", y, m, d)
+end
+
+-- Compte (ou décompte avec sign = -1) une résolution dans les statistiques de durée
+local function count_resolution(started_at, resolved_at, sign)
+    if type(started_at) ~= "number" or type(resolved_at) ~= "number" then
+        return
+    end
+    local duration = resolved_at - started_at
+    local bucket = STATS_DAY_PREFIX .. day(resolved_at)
+    redis.call("HINCRBY", STATS_RESOLUTION_KEY, "count", sign)
+    redis.call("HINCRBY", STATS_RESOLUTION_KEY, "seconds", sign * duration)
+    redis.call("HINCRBY", bucket, "resolved", sign)
+    redis.call("HINCRBY", bucket, "resolve_seconds", sign * duration)
+end
+
+-- Met à jour les compteurs de statistiques lors d'un changement de statut ;
+-- 'resolved_at' est fixé à la résolution et effacé à la réouverture
+local function record_stats(doc, changes)
+    local old, new = doc.status, changes.status
+    if new == nil or old == new then
+        return
+    end
+    if old ~= nil and old ~= cjson.null then
+        redis.call("HINCRBY", STATS_STATUS_KEY, old, -1)
+    end
+    redis.call("HINCRBY", STATS_STATUS_KEY, new, 1)
+    if old == "resolved" then
+        count_resolution(doc.started_at, doc.resolved_at, -1)
+        changes.resolved_at = cjson.null
+    end
+    if new == "resolved" then
+        count_resolution(doc.started_at, now, 1)
+        changes.resolved_at = now
+    end
+end
+
+-- Applique les modifications, met à jour les index et les statistiques, et retourne l'incident
+local function apply(key, doc, changes)
+    record_stats(doc, changes)
+    for field, prefix in pairs(INDEXES) do
+        local old, new = doc[field], changes[field]
+        if new ~= nil and old ~= new then
+            if old ~= nil and old ~= cjson.null then
+                redis.call("SREM", prefix .. old, key)
+            end
+            redis.call("SADD", prefix .. new, key)
+        end
+    end
+    local version = redis.call("HINCRBY", VERSIONS_KEY, key, 1)
+    redis.call("INCR", LIST_VERSION_KEY)
+    redis.call("PUBLISH", INVALIDATION_CHANNEL, key)
+    local values = {}
+    for field, value in pairs(changes) do
+        values[field] = encode(value)
+    end
+    if mode == "hash" then
+        local args = {}
+        for field, value in pairs(values) do
+            table.insert(args, field)
+            table.insert(args, value)
+        end
+        redis.call("HSET", key, unpack(args))
+        local result = redis.call("HGETALL", key)
+        table.insert(result, 1, version)
+        return result
+    end
+    local source = sources[key]
+    local payload = patch(source[1], source[2], source[3], values)
+    redis.call("SET", key, payload)
+    return {version, payload}
+end
+"""
+
+# ARGV[3] = nouveau statut, ARGV[4..] = statuts valides
+SET_STATUS = """
+local status = ARGV[3]
+local valid = false
+for i = 4, #ARGV do
+    if ARGV[i] == status then
+        valid = true
+    end
+end
+if not valid then
+    return redis.error_reply("INVALID_STATUS")
+end
+local key = KEYS[1]
+local doc, err = load_doc(key)
+if err then
+    return redis.error_reply(err)
+end
+if not doc then
+    return false
+end
+local result = apply(key, doc, {status = status, updated_at = now})
+emit_change(key, "status", {status = status})
+return result
+"""
+
+# ARGV[3] = commandant
+ASSIGN = """
+local key = KEYS[1]
+local doc, err = load_doc(key)
+if err then
+    return redis.error_reply(err)
+end
+if not doc then
+    return false
+end
+local result = apply(key, doc, {commander = ARGV[3], assigned_at = now, updated_at = now})
+emit_change(key, "assign", {commander = ARGV[3]})
+return result
+"""
+
+# ARGV[3] = postmortem encodé en JSON
+ATTACH_POSTMORTEM = """
+local key = KEYS[1]
+local doc, err = load_doc(key)
+if err then
+    return redis.error_reply(err)
+end
+if not doc then
+    return false
+end
+local spans, close = scan(ARGV[3])
+local postmortem = patch(ARGV[3], spans, close, {added_at = cjson.encode(now)})
+local result = apply(key, doc, {postmortem = {json = postmortem}, updated_at = now})
+emit_change(key, "postmortem", {})
+return result
+"""
+
+# Modification groupée, atomique, du statut ou du commandant de plusieurs incidents
+# KEYS = clés des incidents, ARGV[3] = opération ("status" ou "assign"), ARGV[4] = valeur,
+# ARGV[5..] = statuts valides. Retourne {modifiés, inchangés, absents, compressés}.
+BULK_UPDATE = """
+local operation, value = ARGV[3], ARGV[4]
+if operation == "status" then
+    local valid = false
+    for i = 5, #ARGV do
+        if ARGV[i] == value then
+            valid = true
+        end
+    end
+    if not valid then
+        return redis.error_reply("INVALID_STATUS")
+    end
+elseif operation ~= "assign" then
+    return redis.error_reply("INVALID_OPERATION")
+end
+local field = operation == "status" and "status" or "commander"
+local changed, unchanged, missing, compressed = {}, {}, {}, {}
+for _, key in ipairs(KEYS) do
+    local doc, err = load_doc(key)
+    if err then
+        table.insert(compressed, key)
+    elseif not doc then
+        table.insert(missing, key)
+    elseif doc[field] == value then
+        table.insert(unchanged, key)
+    else
+        local changes = {updated_at = now}
+        changes[field] = value
+        if operation == "assign" then
+            changes.assigned_at = now
+        end
+        apply(key, doc, changes)
+        emit_change(key, operation, {[field] = value})
+        table.insert(changed, key)
+    end
+end
+return {changed, unchanged, missing, compressed}
+"""
+
+# Script autonome (sans préambule) : remplace le document d'un incident sans en changer
+# le contenu (compression, décompression) uniquement s'il n'a pas été modifié depuis
+# sa lecture. KEYS[1] = clé de l'incident, KEYS[2] = hash des versions,
+# ARGV[1] = version lue, ARGV[2] = nouveau document. Retourne 1 si remplacé, 0 sinon.
+SWAP_DOCUMENT = """
+local version = tonumber(redis.call("HGET", KEYS[2], KEYS[1]) or 0)
+if version ~= tonumber(ARGV[1]) or redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+redis.call("SET", KEYS[1], ARGV[2])
+return 1
+"""
+
+# Script autonome (sans préambule) : remplace les termes indexés d'un incident pour la
+# recherche plein texte. KEYS[1] = hash terme -> score de l'incident, ARGV[1] = ID,
+# ARGV[2] = préfixe des index de termes, ARGV[3..] = paires terme, score.
+# Seuls les termes ajoutés, retirés ou dont le score change touchent les index.
+INDEX_TERMS = """
+local id, prefix = ARGV[1], ARGV[2]
+local terms = {}
+for i = 3, #ARGV, 2 do
+    terms[ARGV[i]] = ARGV[i + 1]
+end
+local previous = redis.call("HGETALL", KEYS[1])
+local known = {}
+for i = 1, #previous, 2 do
+    local term, score = previous[i], previous[i + 1]
+    known[term] = true
+    if not terms[term] then
+        redis.call("ZREM", prefix .. term, id)
+        redis.call("HDEL", KEYS[1], term)
+    elseif terms[term] == score then
+        terms[term] = nil
+    end
+end
+for term, score in pairs(terms) do
+    redis.call("ZADD", prefix .. term, score, id)
+    redis.call("HSET", KEYS[1], term, score)
+end
+return #previous / 2
+"""
+
+# Script autonome (sans préambule) : retire de Redis un incident copié dans l'archive,
+# uniquement s'il n'a pas été modifié depuis la copie.
+# KEYS[1] = clé de l'incident, KEYS[2] = hash des versions, KEYS[3] = timeline,
+# KEYS[4] = hash des termes indexés, KEYS[5] = index temporel, KEYS[6] = version de la liste,
+# KEYS[7..] = index secondaires contenant l'incident.
+# ARGV[1] = version copiée, ARGV[2] = ID du dernier événement de timeline copié ("" si aucun),
+# ARGV[3] = canal d'invalidation, ARGV[4] = préfixe des index de termes.
+# Retourne 1 si l'incident a été retiré, 0 sinon.
+ARCHIVE_INCIDENT = """
+local id = KEYS[1]
+if tonumber(redis.call("HGET", KEYS[2], id) or 0) ~= tonumber(ARGV[1]) then
+    return 0
+end
+local last = redis.call("XREVRANGE", KEYS[3], "+", "-", "COUNT", 1)[1]
+if (last and last[1] or "") ~= ARGV[2] then
+    return 0
+end
+for _, term in ipairs(redis.call("HKEYS", KEYS[4])) do
+    redis.call("ZREM", ARGV[4] .. term, id)
+end
+redis.call("DEL", id, KEYS[3], KEYS[4])
+redis.call("ZREM", KEYS[5], id)
+for i = 7, #KEYS do
+    redis.call("SREM", KEYS[i], id)
+end
+redis.call("INCR", KEYS[6])
+redis.call("PUBLISH", ARGV[3], id)
+return 1
+"""
+
+# Regroupement des créations en double (empreinte d'alerte)
+# KEYS = [empreinte, index des incidents résolus, stream des changements]
+# ARGV = [timestamp, suffixe des clés de timeline, message de l'événement,
+#         longueur maximale du stream des changements, ID pré-généré, durée de réservation]
+# Si l'empreinte désigne un incident présent dans Redis et non résolu, un événement
+# "duplicate" numéroté est ajouté à sa timeline et le script retourne {ID, nombre
+# d'occurrences}. Si une création de même empreinte est en cours, il retourne "pending" ;
+# sinon il réserve l'empreinte pour l'ID pré-généré et retourne "claimed". La transaction
+# de création (redis_link.queueFingerprint) rend la réservation définitive.
+COALESCE_INCIDENT = """
+local now = tonumber(ARGV[1])
+local id = redis.call("HGET", KEYS[1], "id")
+-- Création de même empreinte en cours : l'appelant attend qu'elle aboutisse ou soit libérée
+if id and redis.call("HEXISTS", KEYS[1], "pending") == 1 then
+    return "pending"
+end
+-- Aucun incident regroupable : l'empreinte est réservée pour l'ID pré-généré (ARGV[5])
+-- pendant ARGV[6] s, le temps de sa création (createIncidents la rend définitive)
+if not id or redis.call("EXISTS", id) == 0 or redis.call("SISMEMBER", KEYS[2], id) == 1 then
+    redis.call("DEL", KEYS[1])
+    redis.call("HSET", KEYS[1], "id", ARGV[5], "pending", 1)
+    redis.call("EXPIRE", KEYS[1], ARGV[6])
+    return "claimed"
+end
+local count = redis.call("HINCRBY", KEYS[1], "count", 1)
+local event = cjson.encode({timestamp = now, type = "duplicate", message = ARGV[3], count = count})
+redis.call("XADD", id .. ARGV[2], "*", "event", event)
+redis.call("XADD", KEYS[3], "MAXLEN", "~", ARGV[4], "*",
+    "op", "timeline", "incident", id, "ts", now, "data", cjson.encode({type = "duplicate"}))
+return {id, count}
+"""
+
+# Libère l'empreinte réservée par une création qui a échoué, si elle l'est toujours pour cet ID
+RELEASE_FINGERPRINT = """
+if redis.call("HGET", KEYS[1], "id") == ARGV[1] and redis.call("HEXISTS", KEYS[1], "pending") == 1 then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+SCRIPTS = {
+    "set_status": SET_STATUS,
+    "assign": ASSIGN,
+    "attach_postmortem": ATTACH_POSTMORTEM,
+    "bulk_update": BULK_UPDATE,
+}
@@ -1,21 +1,154 @@
 import os
 import time
-import uuid
 import redis
-from flask import Flask, jsonify, request
+import codec
+import identifiers
+from functools import wraps
+from itertools import chain
+from flask import Flask, Response, jsonify, request
 from redis_link import *
 
 app = Flask(__name__)
+# jsonify et request.get_json passent par le codec (orjson si disponible)
+app.json = codec.CodecJSONProvider(app)
+
+# Archivage en tâche de fond des incidents résolus (si INCIDENT_ARCHIVE_INTERVAL > 0)
+startArchiver()
+
+# Pagination des listes (incidents, timeline)
+PAGE_PARAMS = ("limit", "cursor", "since", "until")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DEFAULT_TIMELINE_PAGE_SIZE = 100
+
+# Nombre maximal d'incidents créés par POST /api/v1/incidents/batch
+MAX_BATCH_SIZE = 500
+
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+
+MAX_STATS_DAYS = 366
+
+# Taille (en octets) des morceaux envoyés par l'export NDJSON
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_POLL_TIMEOUT = 25
+MAX_POLL_TIMEOUT = 60
+
+# Flux SSE des modifications : commentaire envoyé après SSE_KEEPALIVE s sans événement
+# (détection des clients partis, proxys), délai de reconnexion conseillé aux navigateurs
+SSE_KEEPALIVE = 15
+SSE_RETRY_MS = 3000
+SSE_BATCH_SIZE = 500
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Longueur maximale de l'en-tête Idempotency-Key
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# En-têtes recalculés à chaque réponse : non enregistrés pour les requêtes rejouées
+UNREPLAYED_HEADERS = {"content-type", "content-length"}
+
+def not_modified(etag):
+    # Retourne une réponse 304 (sans corps) si le client possède déjà la version 'etag'
+    if not request.if_none_match.contains(etag):
+        return None
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def raw_json(body):
+    # Réponse JSON dont le corps est déjà encodé (bytes)
+    return app.response_class(body, mimetype="application/json")
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    return response
+
+
+def requested_fields(args):
+    """
+    Champs demandés par le paramètre 'fields' (noms séparés par des virgules).
+    Retourne None si le paramètre est absent ; lève ValueError s'il est vide.
+    """
+    if "fields" not in args:
+        return None
+    fields = [field.strip() for field in args["fields"].split(",") if field.strip()]
+    if not fields:
+        raise ValueError
+    return fields
+
+
+def idempotent(view):
+    """
+    Rend une route POST idempotente avec l'en-tête 'Idempotency-Key'.
+
+    - La première requête réserve la clé puis sa réponse est enregistrée dans Redis
+      (IDEMPOTENCY_TTL) ; les erreurs 5xx ne sont pas enregistrées et libèrent la clé.
+    - Une requête rejouée avec la même clé reçoit la réponse enregistrée (statut, corps et
+      en-têtes comme 'ETag' ou 'Incident-Occurrences'), lue avec la réservation (un
+      aller-retour), sans rien exécuter ; en-tête 'Idempotent-Replayed'.
+    - Si la première requête est encore en cours, la réponse est un 409.
+    Les clés sont propres à chaque route.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return jsonify({
+                "error": f"Invalid 'Idempotency-Key' header: 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters expected"
+            }), 400
+        scope = f"{request.path}:{key}"
+        stored = reserveIdempotencyKey(scope)
+        if stored is not None:
+            status, mimetype, headers, body = stored
+            if status is None:
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+            response = app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            releaseIdempotencyKey(scope)
+            raise
+        if response.status_code >= 500:
+            releaseIdempotencyKey(scope)
+        else:
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() not in UNREPLAYED_HEADERS}
+            saveIdempotentResponse(scope, response.status_code, response.mimetype, headers, response.get_data())
+        return response
+    return wrapper
+
+
+def incident_route(view):
+    """
+    Routes /api/v1/incidents/<id>/... : un ID qui n'est pas celui d'un incident
+    (clé d'index, de statistiques, sous-clé...) répond 404 sans toucher à Redis.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        id = kwargs.get("id", kwargs.get("incident_id"))
+        if not identifiers.is_incident_id(id):
+            return jsonify({"error": "Incident not found"}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
 
 @app.route('/api/v1/incidents/health', methods=['GET'])
 def health_check():
     # Vérifie la connexion au serveur Redis et retourne le statut de santé du microservice
+    # ainsi que les compteurs du cache local des incidents (hits, misses...)
     try:
         if r.ping():
             return jsonify({
                 "status": "ok",
                 "service": "incidents",
-                "redis": "connected"
+                "redis": "connected",
+                "cache": cache.stats()
             }), 200
         else:
             return jsonify({
@@ -23,7 +156,7 @@ def health_check():
                 "service": "incidents",
                 "redis": "not responding"
             }), 500
-    except redis.exceptions.ConnectionError as e:
+    except UNAVAILABLE as e:
         return jsonify({
             "status": "error",
             "service": "incidents",
@@ -31,186 +164,614 @@ def health_check():
         }), 500
 
 
+@app.errorhandler(redis.exceptions.ConnectionError)
+@app.errorhandler(redis.exceptions.TimeoutError)
+def redis_unavailable(error):
+    # Redis reste injoignable après les nouvelles tentatives : le client peut réessayer plus tard
+    return jsonify({"error": "Redis unavailable, retry later"}), 503
+
 
-@app.route('/api/v1/incidents', methods=['POST'])
-def create_incident():
-    # Crée un nouvel incident à partir des données JSON reçues dans la requête
-    # Génère un ID unique, initialise les champs de l'incident et sauvegarde dans Redis
-    data = request.get_json()
-    if not data or 'title' not in data or 'sev' not in data:
-        return jsonify({"error": "Requête invalide: 'title' et 'sev' sont requis."}), 400
 
-    new_id = f"INC-{uuid.uuid4().hex[:6].upper()}"
-    new_incident = {
-        "id": new_id,
+def build_incident(data):
+    """
+    Valide les données d'un nouvel incident et construit l'incident à enregistrer.
+    Retourne (incident, None) ou (None, message d'erreur).
+    """
+    if not isinstance(data, dict) or 'title' not in data or 'sev' not in data:
+        return None, "Requête invalide: 'title' et 'sev' sont requis."
+    services = data.get("services", [])
+    if not isinstance(services, list) or not all(isinstance(service, str) for service in services):
+        return None, "Requête invalide: 'services' doit être une liste de noms de services."
+
+    # ID triable par date de création (l'unicité est garantie à l'enregistrement, SET NX)
+    now = time.time()
+    return {
+        "id": identifiers.new_id(int(now * 1000)),
         "title": data.get("title"),
         "sev": data.get("sev"),
-        "services": data.get("services", []),
+        "services": services,
         "summary": data.get("summary", ""),
         "status": "open",
-        "started_at": int(time.time()),
+        "started_at": int(now),
         "commander": None
-    }
-    saveJSONFile(new_incident)
+    }, None
+
+
+@app.route('/api/v1/incidents', methods=['POST'])
+@idempotent
+def create_incident():
+    # Crée un nouvel incident à partir des données JSON reçues dans la requête
+    # Génère un ID unique, initialise les champs de l'incident et sauvegarde dans Redis
+    # Avec 'Idempotency-Key', une requête rejouée reçoit la réponse de la première (voir idempotent)
+    # Une création en double d'un incident récent non résolu (même titre et mêmes services)
+    # est regroupée dans cet incident : réponse 200, nombre d'occurrences dans 'Incident-Occurrences'
+    new_incident, error = build_incident(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    coalesced = coalesceIncident(new_incident)
+    if coalesced:
+        incident_id, occurrences = coalesced
+        incident = loadJSONFile(incident_id)
+        # Incident archivé entre-temps : la création a lieu normalement
+        if incident is not None:
+            response = jsonify(incident)
+            response.headers["Incident-Occurrences"] = str(occurrences)
+            return response, 200
+
+    claimed_id = new_incident["id"]
+    try:
+        createIncident(new_incident)
+    except Exception:
+        # Création échouée : l'empreinte réservée par coalesceIncident est libérée
+        releaseFingerprint(new_incident, claimed_id)
+        raise
     return jsonify(new_incident), 201
 
 
+@app.route('/api/v1/incidents/batch', methods=['POST'])
+@idempotent
+def create_incidents_batch():
+    """
+    Crée plusieurs incidents en une seule requête.
+
+    - Attend un tableau JSON de payloads, validés avec les mêmes règles que la création unitaire.
+    - Les incidents valides sont enregistrés dans un seul pipeline Redis.
+    - Retourne un résultat par élément (même ordre) : 201 si tous sont créés,
+      207 si certains sont invalides, 400 si aucun n'est valide.
+    """
+    data = request.get_json()
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Requête invalide: un tableau d'incidents non vide est attendu."}), 400
+    if len(data) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Requête invalide: {MAX_BATCH_SIZE} incidents maximum par lot."}), 400
+
+    results = []
+    new_incidents = []
+    for index, payload in enumerate(data):
+        new_incident, error = build_incident(payload)
+        if error:
+            results.append({"index": index, "status": 400, "error": error})
+        else:
+            results.append({"index": index, "status": 201, "incident": new_incident})
+            new_incidents.append(new_incident)
+
+    if new_incidents:
+        createIncidents(new_incidents)
+
+    failed = len(data) - len(new_incidents)
+    status = 201 if not failed else 207 if new_incidents else 400
+    return jsonify({
+        "created": len(new_incidents),
+        "failed": failed,
+        "results": results
+    }), status
+
+
+@app.route('/api/v1/incidents/bulk', methods=['PATCH'])
+def bulk_update_incidents():
+    """
+    Modifie le statut ou le commandant de plusieurs incidents en une seule opération atomique.
+
+    - Cible les incidents par 'ids' (liste d'IDs) ou par 'filter' (status, commander, services).
+    - 'operation' vaut "status" ou "assign", 'value' est le nouveau statut ou commandant.
+    - Toutes les modifications sont appliquées par un seul script Lua ; la réponse
+      indique les incidents modifiés, déjà à jour et introuvables.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Requête invalide: un objet JSON est attendu."}), 400
+    operation = data.get("operation")
+    value = data.get("value")
+    if operation not in BULK_OPERATIONS or not isinstance(value, str) or not value:
+        return jsonify({"error": "Requête invalide: 'operation' (status ou assign) et 'value' sont requis."}), 400
+    if ("ids" in data) == ("filter" in data):
+        return jsonify({"error": "Requête invalide: fournir soit 'ids', soit 'filter'."}), 400
+
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not all(identifiers.is_incident_id(id) for id in ids):
+            return jsonify({"error": "Requête invalide: 'ids' doit être une liste d'IDs d'incidents."}), 400
+    else:
+        criteria = data["filter"]
+        if not isinstance(criteria, dict) or not criteria or set(criteria) - {"services", *INDEXED_FIELDS}:
+            return jsonify({"error": "Requête invalide: 'filter' accepte status, commander et services."}), 400
+        services = criteria.get("services")
+        if isinstance(services, str):
+            services = [services]
+        if services is not None and not (isinstance(services, list) and all(isinstance(s, str) for s in services)) \
+                or not all(isinstance(criteria[field], str) for field in INDEXED_FIELDS if field in criteria):
+            return jsonify({"error": "Requête invalide: 'status' et 'commander' doivent être des chaînes, "
+                                     "'services' un nom ou une liste de noms."}), 400
+        index_filters = {field: criteria[field] for field in INDEXED_FIELDS if field in criteria}
+        ids = selectIncidentIds(services=services, **index_filters)
+    if len(ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Requête invalide: {MAX_BATCH_SIZE} incidents maximum par opération."}), 400
+
+    try:
+        changed, unchanged, missing = bulkUpdateIncidents(ids, operation, value)
+    except ValueError:
+        return jsonify({"error": f"Invalid status. Must be one of {VALID_STATUSES}"}), 400
+    return jsonify({
+        "matched": len(changed) + len(unchanged),
+        "changed": changed,
+        "unchanged": unchanged,
+        "not_found": missing
+    }), 200
+
+
 @app.route('/api/v1/incidents', methods=['GET'])
 def get_incidents():
-    # Récupère tous les incidents depuis Redis et applique les filtres facultatifs 'commander' et 'status'
+    """
+    Récupère les incidents depuis Redis en appliquant les filtres facultatifs 'commander', 'status' et 'service'.
+
+    - Les filtres sont résolus via les index secondaires (idx:status:<s>, idx:commander:<id>, idx:service:<nom>).
+    - Si 'limit', 'cursor', 'since' ou 'until' est fourni, la réponse est paginée :
+      seule la page demandée est lue dans l'index temporel (incidents:by_started_at)
+      et la réponse contient 'data', 'count' et 'next_cursor'.
+    - 'include_archived=true' ajoute les incidents archivés (lus dans l'archive locale).
+    - 'fields=id,title,...' limite les champs renvoyés pour chaque incident (l'ID est
+      toujours inclus) ; en mode "hash", seuls ces champs sont lus dans Redis.
+    - La réponse porte un ETag fondé sur la version globale de la liste : si le
+      client envoie le même dans 'If-None-Match', la réponse est un 304 et aucun
+      incident n'est chargé.
+    """
+    filters = request.args
+    return list_incidents({field: filters.get(field) for field in LIST_FILTERS if field in filters})
+
+
+def list_incidents(index_filters):
+    # Liste (éventuellement paginée) des incidents correspondant aux filtres d'index,
+    # avec les paramètres de la requête courante (voir get_incidents)
+    etag = f"list-{listVersion()}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    filters = request.args
+    include_archived = filters.get("include_archived", "").lower() in ("1", "true", "yes")
+    if include_archived and "service" in index_filters:
+        return jsonify({"error": "'include_archived' cannot be combined with a service filter"}), 400
+    try:
+        fields = requested_fields(filters)
+    except ValueError:
+        return jsonify({"error": "Invalid 'fields' parameter: expected a comma-separated list of field names"}), 400
+
+    if any(param in filters for param in PAGE_PARAMS):
+        try:
+            limit = int(filters.get("limit", DEFAULT_PAGE_SIZE))
+            since = int(filters["since"]) if "since" in filters else None
+            until = int(filters["until"]) if "until" in filters else None
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError
+            ids, next_cursor = pageIncidentIds(
+                limit,
+                cursor=filters.get("cursor"),
+                since=since,
+                until=until,
+                descending=filters.get("order") == "desc",
+                include_archived=include_archived,
+                **index_filters
+            )
+        except ValueError:
+            return jsonify({
+                "error": f"Invalid pagination parameters: 'limit' must be between 1 and {MAX_PAGE_SIZE}, "
+                         "'since'/'until' must be timestamps and 'cursor' a value returned by a previous page"
+            }), 400
+        # Les documents lus dans Redis sont insérés tels quels dans la réponse, sans décodage
+        documents = loadRawJSONFiles(ids, include_archived=include_archived, fields=fields)
+        return with_etag(raw_json(codec.dumps_fragments({
+            "data": [codec.Fragment(document) for document in documents],
+            "count": len(documents),
+            "next_cursor": next_cursor
+        })), etag), 200
+
+    if index_filters:
+        # Lit uniquement les IDs correspondants, chargés par paquets (MGET)
+        documents = loadRawJSONFiles(findIncidentIds(**index_filters), fields=fields)
+    else:
+        # Parcourt tous les incidents avec SCAN + MGET, sans bloquer Redis avec KEYS
+        documents = iter_incidents(raw=True, fields=fields)
+    if include_archived:
+        archived = iterArchivedIncidents(**index_filters)
+        if fields is not None:
+            archived = (pruneDocument(document, fieldset(fields)) for document in archived)
+        documents = chain(documents, archived)
+
+    return with_etag(raw_json(codec.dumps_fragments(
+        [codec.Fragment(document) for document in documents]
+    )), etag), 200
+
+
+@app.route('/api/v1/services', methods=['GET'])
+def get_services():
+    # Résumé par service : nombre d'incidents ouverts, mitigés et au total,
+    # calculé à partir des cardinalités des index (aucun incident n'est chargé)
+    services = serviceSummary()
+    return jsonify({"data": services, "count": len(services)}), 200
+
+
+@app.route('/api/v1/services/<service>/incidents', methods=['GET'])
+def get_service_incidents(service):
+    """
+    Incidents touchant un service, lus dans son index (idx:service:<nom>).
+    Mêmes filtres, pagination, champs et ETag que GET /api/v1/incidents : une page
+    est lue dans l'intersection de l'index du service et de l'index temporel.
+    """
     filters = request.args
-    incidents_list = []
+    index_filters = {field: filters.get(field) for field in INDEXED_FIELDS if field in filters}
+    return list_incidents(dict(index_filters, service=service))
 
-    keys = r.keys("INC-*")  # Récupère toutes les clés d'incidents dans Redis
-    for key in keys:
-        obj = loadJSONFile(key)  # Charge l'objet JSON depuis Redis
-        if obj:
-            incidents_list.append(obj)
 
-    # Filtre par 'commander' si spécifié
-    if 'commander' in filters:
-        commander_id = filters.get('commander')
-        incidents_list = [inc for inc in incidents_list if inc.get('commander') == commander_id]
+def poll_parameters(args):
+    """
+    Valide les paramètres d'attente des modifications : retourne (after, limit, timeout).
+    Sans 'after', seules les modifications postérieures à la requête sont renvoyées.
+    Lève ValueError si un paramètre est invalide.
+    """
+    limit = int(args.get("limit", DEFAULT_TIMELINE_PAGE_SIZE))
+    timeout = float(args.get("timeout", DEFAULT_POLL_TIMEOUT))
+    if not 1 <= limit <= MAX_PAGE_SIZE or not 0 <= timeout <= MAX_POLL_TIMEOUT:
+        raise ValueError
+    return args.get("after"), limit, timeout
+
+
+@app.route('/api/v1/incidents/changes', methods=['GET'])
+def poll_changes():
+    """
+    Attente longue (long-poll) des modifications d'incidents.
 
-    # Filtre par 'status' si spécifié
-    if 'status' in filters:
-        status = filters.get('status')
-        incidents_list = [inc for inc in incidents_list if inc.get('status') == status]
+    - 'after' : ID de la dernière modification reçue ('last_id' de la réponse précédente).
+    - 'timeout' : attente maximale en secondes si aucune modification n'est disponible (25 par défaut).
+    - Répond dès qu'au moins une modification est disponible, ou à l'expiration du délai
+      avec une liste vide ; 'last_id' sert de 'after' pour l'appel suivant.
+    """
+    try:
+        after, limit, timeout = poll_parameters(request.args)
+        after = after or lastChangeId()
+        deadline = time.monotonic() + timeout
+        while True:
+            # Attente par tranches (bornées par le délai de lecture des sockets du pool)
+            block = int((deadline - time.monotonic()) * 1000)
+            changes = readChanges(after, count=limit, block=block if block >= 1 else None)
+            if changes or block < 1:
+                break
+    except (ValueError, redis.exceptions.ResponseError):
+        return jsonify({
+            "error": f"Invalid parameters: 'limit' must be between 1 and {MAX_PAGE_SIZE}, "
+                     f"'timeout' between 0 and {MAX_POLL_TIMEOUT} and 'after' a change ID"
+        }), 400
+    return jsonify({
+        "data": changes,
+        "count": len(changes),
+        "last_id": changes[-1]["id"] if changes else after
+    }), 200
 
-    return jsonify(incidents_list), 200
+
+def stream_parameters(args, headers):
+    """
+    Valide les paramètres du flux SSE : retourne (position de reprise ou None, filtres).
+    La reprise vient de l'en-tête 'Last-Event-ID' (reconnexion automatique du navigateur)
+    ou du paramètre 'last_event_id'. Lève ValueError si la position est invalide.
+    """
+    after = headers.get("Last-Event-ID") or args.get("last_event_id")
+    if after:
+        streamPosition(after)
+    return after, {field: args[field] for field in INDEXED_FIELDS if field in args}
+
+
+def sse_event(change):
+    # Événement SSE d'une modification : l'ID du stream sert de Last-Event-ID à la reconnexion
+    return f"id: {change['id']}\nevent: {change['op']}\ndata: ".encode() + codec.dumps(change) + b"\n\n"
+
+
+@app.route('/api/v1/incidents/stream', methods=['GET'])
+def stream_changes():
+    """
+    Flux Server-Sent Events des modifications d'incidents (création, statut, commandant,
+    timeline...), lu dans le stream des changements.
+
+    - 'status' et 'commander' filtrent les incidents concernés (état après la modification).
+    - 'Last-Event-ID' reprend le flux après le dernier événement reçu ; sinon seules les
+      nouvelles modifications sont envoyées.
+    - Un seul thread par processus lit le stream (changeFeed) : en attente, un client
+      occupe un thread mais aucune connexion Redis. Seule une reprise plus ancienne que
+      les modifications gardées en mémoire relit le stream (XREAD non bloquant).
+    """
+    try:
+        after, filters = stream_parameters(request.args, request.headers)
+    except ValueError:
+        return jsonify({"error": "Invalid 'Last-Event-ID': a change ID is expected"}), 400
+    changeFeed.listen()
+    after = after or lastChangeId()
+
+    def generate(after):
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        while True:
+            changes = changeFeed.since(after)
+            if changes is None:
+                changes = readChanges(after, count=SSE_BATCH_SIZE)
+            if not changes:
+                if not changeFeed.wait(after, SSE_KEEPALIVE):
+                    yield b": keepalive\n\n"
+                continue
+            after = changes[-1]["id"]
+            events = b"".join(sse_event(change) for change in filterChanges(changes, **filters))
+            if events:
+                yield events
+
+    return Response(generate(after), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.route('/api/v1/incidents/export', methods=['GET'])
+def export_incidents():
+    """
+    Exporte les incidents au format NDJSON (un document JSON par ligne), en flux.
+
+    - Accepte les filtres 'status', 'commander', 'service', 'since' et 'until' de la liste.
+    - Les incidents sont lus par paquets (SCAN/index + MGET) et envoyés au fur et à
+      mesure : la mémoire utilisée ne dépend pas du nombre d'incidents exportés.
+    """
+    filters = request.args
+    if filters.get("format", "ndjson") != "ndjson":
+        return jsonify({"error": "Unsupported format: only 'ndjson' is available"}), 400
+    try:
+        since = int(filters["since"]) if "since" in filters else None
+        until = int(filters["until"]) if "until" in filters else None
+    except ValueError:
+        return jsonify({"error": "Invalid parameters: 'since' and 'until' must be timestamps"}), 400
+    index_filters = {field: filters.get(field) for field in LIST_FILTERS if field in filters}
+    documents = iterIncidentDocuments(since, until, **index_filters)
+
+    def generate():
+        # Le premier incident part tout de suite ; les suivants sont regroupés
+        # en morceaux d'environ EXPORT_CHUNK_SIZE octets
+        chunk, size, first = [], 0, True
+        for document in documents:
+            line = (document.encode() if isinstance(document, str) else document) + b"\n"
+            chunk.append(line)
+            size += len(line)
+            if first or size >= EXPORT_CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk, size, first = [], 0, False
+        if chunk:
+            yield b"".join(chunk)
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=incidents.ndjson"})
+
+
+@app.route('/api/v1/incidents/stats', methods=['GET'])
+def get_incident_stats():
+    """
+    Statistiques des incidents pour les tableaux de bord.
+
+    - Nombre d'incidents par sévérité et par statut, nombre de résolutions et
+      durée moyenne de résolution (MTTR, en secondes).
+    - 'days' (facultatif) : ajoute les créations, résolutions et MTTR des N derniers jours.
+    - Les compteurs sont tenus à jour à chaque écriture : la réponse ne dépend
+      pas du nombre d'incidents stockés.
+    """
+    try:
+        days = int(request.args.get("days", 0))
+        if not 0 <= days <= MAX_STATS_DAYS:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"Invalid 'days': must be between 0 and {MAX_STATS_DAYS}"}), 400
+    return jsonify(loadStats(days)), 200
+
+
+@app.route('/api/v1/incidents/search', methods=['GET'])
+def search_incidents():
+    """
+    Recherche plein texte dans le titre, le résumé et le postmortem des incidents.
+
+    - 'q' : termes recherchés (tous doivent être présents, casse et accents ignorés).
+    - 'limit' : nombre maximal de résultats (20 par défaut).
+    - Retourne les IDs classés par pertinence, avec leur score, sans charger les incidents.
+    """
+    query = request.args.get("q", "")
+    try:
+        limit = int(request.args.get("limit", DEFAULT_SEARCH_RESULTS))
+        if not 1 <= limit <= MAX_SEARCH_RESULTS:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"Invalid 'limit': must be between 1 and {MAX_SEARCH_RESULTS}"}), 400
+    if not query.strip():
+        return jsonify({"error": "Missing query parameter 'q'"}), 400
+
+    results = searchIncidents(query, limit)
+    return jsonify({
+        "query": query,
+        "data": [{"id": incident_id, "score": score} for incident_id, score in results],
+        "count": len(results)
+    }), 200
 
 
 @app.route("/api/v1/incidents/<incident_id>", methods=["GET"])
+@incident_route
 def get_incident_by_id(incident_id):
     # Récupère un incident spécifique depuis Redis à partir de son ID
     # Retourne une erreur 404 si l'incident n'existe pas
-    incident = loadJSONFile(incident_id)
+    # Si 'If-None-Match' correspond à la version courante, répond 304 sans charger l'incident
+    # 'fields=title,status,...' limite les champs renvoyés (HMGET en mode "hash")
+    # Sans version enregistrée (ID inconnu...), la lecture normale répond (404 le cas échéant)
+    version = incidentVersion(incident_id) if request.if_none_match else None
+    if version is not None:
+        cached = not_modified(f"{incident_id}-{version}")
+        if cached:
+            return cached
+
+    try:
+        fields = requested_fields(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid 'fields' parameter: expected a comma-separated list of field names"}), 400
+    if fields is None:
+        incident, version = loadVersionedJSONFile(incident_id)
+    else:
+        incident, version = loadVersionedJSONFields(incident_id, fields)
     if not incident:
         return jsonify({"error": "Incident not found"}), 404
-    return jsonify(incident), 200
+    return with_etag(jsonify(incident), f"{incident_id}-{version}"), 200
 
 
 @app.route('/api/v1/incidents/<id>/timeline', methods=['PUT'])
+@incident_route
 def add_timeline_event(id):
     """
     Ajoute un nouvel événement à la timeline d'un incident existant.
     
-    - Récupère l'incident depuis Redis.
-    - Ajoute un dictionnaire {"type": ..., "message": ...} à la liste 'timeline'.
-    - Sauvegarde l'incident mis à jour dans Redis.
+    - Vérifie que l'incident existe dans Redis (un incident archivé y est remis).
+    - Ajoute un dictionnaire {"timestamp": ..., "type": ..., "message": ...}
+      au stream 'INC-xxx:timeline' (une seule commande, le document n'est pas réécrit).
+    - Retourne l'événement créé avec son ID.
     """
-    incident = loadJSONFile(id)
-    if not incident:
+    if not incidentExists(id) and not restoreIncident(id):
         return jsonify({"error": "Incident not found"}), 404
 
     data = request.get_json()
     if not data or "type" not in data or "message" not in data:
         return jsonify({"error": "Missing 'type' or 'message' field"}), 400
 
-    # Initialise la timeline si elle n'existe pas encore
-    if "timeline" not in incident:
-        incident["timeline"] = []
-
     # Ajoute un nouvel événement à la timeline
     event = {
         "timestamp": int(time.time()),
         "type": data["type"],
         "message": data["message"]
     }
-    incident["timeline"].append(event)
+    event["id"] = appendTimelineEvent(id, event)
+    return jsonify(event), 200
 
-    # Sauvegarde dans Redis
-    saveJSONFile(incident)
-    return jsonify(incident), 200
+
+@app.route('/api/v1/incidents/<id>/timeline', methods=['GET'])
+@incident_route
+def get_timeline(id):
+    """
+    Retourne la timeline d'un incident, page par page.
+
+    - 'limit' : nombre maximal d'événements (100 par défaut).
+    - 'after' : ID du dernier événement déjà reçu ('next_after' de la page précédente).
+    - La timeline d'un incident archivé est lue dans l'archive.
+    """
+    if not incidentExists(id, include_archived=True):
+        return jsonify({"error": "Incident not found"}), 404
+
+    try:
+        limit = int(request.args.get("limit", DEFAULT_TIMELINE_PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError
+        events, next_after = loadTimeline(id, after=request.args.get("after"), limit=limit)
+    except (ValueError, redis.exceptions.ResponseError):
+        return jsonify({
+            "error": f"Invalid parameters: 'limit' must be between 1 and {MAX_PAGE_SIZE} "
+                     "and 'after' an event ID"
+        }), 400
+
+    return jsonify({
+        "data": events,
+        "count": len(events),
+        "next_after": next_after
+    }), 200
 
 
 @app.route('/api/v1/incidents/<id>/postmortem', methods=['PUT'])
+@incident_route
 def add_postmortem(id):
     """
     Ajoute un postmortem à un incident existant.
     
-    - Récupère l'incident depuis Redis.
     - Vérifie la présence des champs requis : what_happened, root_cause, action_items.
-    - Enregistre la section 'postmortem' dans l'objet incident.
-    - Sauvegarde la version mise à jour dans Redis.
+    - Enregistre la section 'postmortem' dans l'incident via un script Lua
+      (vérification d'existence, écriture et 'updated_at' en un seul aller-retour atomique).
     """
-    incident = loadJSONFile(id)
-    if not incident:
-        return jsonify({"error": "Incident not found"}), 404
-
     data = request.get_json()
     required_fields = ["what_happened", "root_cause", "action_items"]
     if not data or not all(field in data for field in required_fields):
         return jsonify({"error": "Missing postmortem fields"}), 400
 
-    # Ajoute les données de postmortem
-    incident["postmortem"] = {
+    # Ajoute les données de postmortem ('added_at' est fixé côté Redis)
+    incident = attachPostmortem(id, {
         "what_happened": data["what_happened"],
         "root_cause": data["root_cause"],
-        "action_items": data["action_items"],
-        "added_at": int(time.time())
-    }
-
-    saveJSONFile(incident)
+        "action_items": data["action_items"]
+    })
+    if not incident:
+        return jsonify({"error": "Incident not found"}), 404
     return jsonify(incident), 200
 
 
 @app.route('/api/v1/incidents/<id>/status', methods=['PUT'])
+@incident_route
 def update_incident_status(id):
     """
     Met à jour le statut d'un incident existant.
     
-    - Récupère l'incident depuis Redis.
     - Vérifie la présence et la validité du champ 'status'.
-    - Met à jour le champ 'status' et ajoute un timestamp de modification.
-    - Sauvegarde dans Redis.
+    - Met à jour le champ 'status', l'index de statut et 'updated_at' via un
+      script Lua (un seul aller-retour atomique, sans écrasement concurrent).
     """
-    incident = loadJSONFile(id)
-    if not incident:
-        return jsonify({"error": "Incident not found"}), 404
-
     data = request.get_json()
-    if not data or "status" not in data:
+    if not isinstance(data, dict) or "status" not in data:
         return jsonify({"error": "Missing 'status' field"}), 400
 
-    valid_status = ["open", "mitigated", "resolved"]
-    if data["status"] not in valid_status:
+    if data["status"] not in VALID_STATUSES:
         return jsonify({
-            "error": f"Invalid status. Must be one of {valid_status}"
+            "error": f"Invalid status. Must be one of {VALID_STATUSES}"
         }), 400
 
     # Met à jour le statut
-    incident["status"] = data["status"]
-    incident["updated_at"] = int(time.time())
-
-    saveJSONFile(incident)
+    try:
+        incident = setIncidentStatus(id, data["status"])
+    except ValueError:
+        return jsonify({
+            "error": f"Invalid status. Must be one of {VALID_STATUSES}"
+        }), 400
+    if not incident:
+        return jsonify({"error": "Incident not found"}), 404
     return jsonify(incident), 200
 
 
 @app.route("/api/v1/incidents/<incident_id>/assign", methods=["PUT"])
+@incident_route
 def assign_incident(incident_id):
     """
     Assigne un commandant à un incident spécifique.
     
-    - Récupère l'incident depuis Redis.
-    - Vérifie que le champ 'commander' est présent dans la requête.
-    - Met à jour l'attribut 'commander' de l'incident.
-    - Sauvegarde dans Redis.
+    - Vérifie que le champ 'commander' est présent dans la requête (chaîne non vide).
+    - Met à jour l'attribut 'commander', l'index des commandants et 'updated_at'
+      via un script Lua (un seul aller-retour atomique, sans écrasement concurrent).
     """
-    incident = loadJSONFile(incident_id)
-    if not incident:
-        return jsonify({"error": "Incident not found"}), 404
-
-    data = request.get_json() or {}
-    commander = data.get("commander")
+    data = request.get_json()
+    commander = data.get("commander") if isinstance(data, dict) else None
     if not commander:
         return jsonify({"error": "Missing field 'commander'"}), 400
+    if not isinstance(commander, str):
+        return jsonify({"error": "Invalid field 'commander': a string is expected"}), 400
 
     # Mise à jour du commandant
-    incident["commander"] = commander
-    incident["assigned_at"] = int(time.time())
-
-    saveJSONFile(incident)
+    incident = assignCommander(incident_id, commander)
+    if not incident:
+        return jsonify({"error": "Incident not found"}), 404
     return jsonify(incident), 200
 
 
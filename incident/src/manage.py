@@ -0,0 +1,71 @@
+import argparse
+import sys
+from redis_link import *
+
+# Commandes de maintenance du microservice Incidents
+# Utilisation : python src/manage.py <commande>
+
+
+def reindex(args):
+    # Reconstruit les index secondaires à partir des incidents existants
+    count = rebuildIndexes()
+    print(f"{count} incident(s) réindexé(s).")
+
+
+def migrate_timelines(args):
+    # Déplace les timelines embarquées dans les documents vers les streams INC-xxx:timeline
+    count = migrateTimelines()
+    print(f"{count} timeline(s) migrée(s).")
+
+
+def migrate_storage(args):
+    # Convertit les incidents vers le mode de stockage courant (INCIDENT_STORAGE)
+    count = migrateStorage()
+    print(f"{count} incident(s) converti(s) en mode '{STORAGE_MODE}'.")
+
+
+def compress(args):
+    # Compresse (ou décompresse) les documents existants selon INCIDENT_COMPRESS_THRESHOLD
+    count, before, after = recompressIncidents()
+    print(f"{count} document(s) réécrit(s) : {before} -> {after} octets ({before - after} octets économisés).")
+
+
+def rebuild_stats(args):
+    # Recalcule les statistiques (stats:*) à partir des incidents existants
+    count = rebuildStats()
+    print(f"Statistiques recalculées sur {count} incident(s).")
+
+
+def archive_incidents(args):
+    # Déplace dans l'archive locale les incidents résolus depuis plus de N jours
+    try:
+        count = archiveResolvedIncidents(args.days)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"{count} incident(s) archivé(s) dans {archive.path} ({archive.count()} au total).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance du microservice Incidents")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("reindex", help="Reconstruit les index secondaires (status, commander, services, recherche)").set_defaults(func=reindex)
+
+    subparsers.add_parser("migrate-timelines", help="Déplace les timelines des documents vers les streams Redis").set_defaults(func=migrate_timelines)
+
+    subparsers.add_parser("migrate-storage", help="Convertit les incidents vers le mode INCIDENT_STORAGE").set_defaults(func=migrate_storage)
+
+    subparsers.add_parser("compress", help="Recompresse les documents existants et affiche la mémoire économisée").set_defaults(func=compress)
+
+    subparsers.add_parser("rebuild-stats", help="Recalcule les statistiques (sévérité, statut, MTTR, par jour)").set_defaults(func=rebuild_stats)
+
+    archive_parser = subparsers.add_parser("archive", help="Archive les incidents résolus depuis plus de N jours")
+    archive_parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help=f"ancienneté minimale de la résolution (défaut : {ARCHIVE_AFTER_DAYS})")
+    archive_parser.set_defaults(func=archive_incidents)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,1494 @@
+import hashlib
+import os
+import threading
+import time
 import redis
 import json
+from collections import deque
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+import codec
+import compression
+import identifiers
+import search
+from archive import IncidentArchive
+from cache import IncidentCache
+from lua_scripts import (ARCHIVE_INCIDENT, COALESCE_INCIDENT, INDEX_TERMS, PRELUDE, RELEASE_FINGERPRINT, SCRIPTS,
+                         SWAP_DOCUMENT)
 
-# Connexion à Redis
-try:
-    r = redis.Redis(host='redis', port=6379, decode_responses=True)
-    r.ping()
-    print("Connexion à Redis réussie !")
-except redis.exceptions.ConnectionError:
-    print("Erreur : impossible de se connecter à Redis.")
-    r = None
+# Connexion à Redis, configurée par l'environnement et ouverte à la première commande :
+# l'import est immédiat et le service se reconnecte seul quand Redis redevient disponible.
+# - pool borné (REDIS_MAX_CONNECTIONS) : une commande attend au plus REDIS_POOL_TIMEOUT s une connexion libre
+# - connexion refusée ou coupée : commande rejouée REDIS_RETRIES fois, délai exponentiel de
+#   REDIS_BACKOFF_BASE à REDIS_BACKOFF_CAP secondes, sur une nouvelle connexion
+# - délai de réponse dépassé : jamais rejoué, la commande a pu être exécutée (une écriture
+#   rejouée doublerait un MULTI, un HINCRBY ou un XADD)
+# - une connexion inactive depuis REDIS_HEALTH_CHECK_INTERVAL s est vérifiée (PING) avant usage
+REDIS_CONFIG = {
+    "host": os.environ.get("REDIS_HOST", "redis"),
+    "port": int(os.environ.get("REDIS_PORT", 6379)),
+    "db": int(os.environ.get("REDIS_DB", 0)),
+    "password": os.environ.get("REDIS_PASSWORD") or None,
+    "max_connections": int(os.environ.get("REDIS_MAX_CONNECTIONS", 50)),
+    "timeout": float(os.environ.get("REDIS_POOL_TIMEOUT", 5)),
+    "socket_timeout": float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5)),
+    "socket_connect_timeout": float(os.environ.get("REDIS_CONNECT_TIMEOUT", 2)),
+    "health_check_interval": int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+}
+REDIS_RETRIES = int(os.environ.get("REDIS_RETRIES", 3))
+REDIS_BACKOFF_BASE = float(os.environ.get("REDIS_BACKOFF_BASE", 0.05))
+REDIS_BACKOFF_CAP = float(os.environ.get("REDIS_BACKOFF_CAP", 2))
+
+# Erreurs signifiant que Redis est injoignable (après les nouvelles tentatives) :
+# elles ne sont jamais masquées et deviennent une réponse 503 dans l'API
+UNAVAILABLE = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+# Erreurs rejouées par le client : uniquement les connexions en échec (pas TimeoutError)
+RETRIED = (redis.exceptions.ConnectionError,)
+
+
+def connectionPool(decode_responses=True, **overrides):
+    # Pool de connexions (aucune connexion n'est ouverte avant la première commande)
+    config = dict(REDIS_CONFIG, **overrides)
+    return redis.BlockingConnectionPool(
+        retry=Retry(ExponentialBackoff(cap=REDIS_BACKOFF_CAP, base=REDIS_BACKOFF_BASE), REDIS_RETRIES,
+                    supported_errors=RETRIED),
+        retry_on_error=list(RETRIED),
+        decode_responses=decode_responses,
+        **config
+    )
+
+
+# 'rb' renvoie des bytes non décodés : utilisé pour les documents, éventuellement compressés
+r = redis.Redis(connection_pool=connectionPool())
+rb = redis.Redis(connection_pool=connectionPool(decode_responses=False))
+
+# Mode de stockage des incidents :
+# - "json" : un document JSON par clé (string Redis)
+# - "hash" : un hash Redis par incident, chaque champ encodé en JSON ; les champs
+#   simples (status, commander, timestamps) se mettent à jour avec un seul HSET
+STORAGE_MODES = ("json", "hash")
+STORAGE_MODE = os.environ.get("INCIDENT_STORAGE", "json")
+if STORAGE_MODE not in STORAGE_MODES:
+    raise ValueError(f"INCIDENT_STORAGE doit valoir l'une des valeurs {STORAGE_MODES}.")
+
+# Compression des documents (mode "json") dont la taille atteint le seuil, en octets (0 : désactivée)
+COMPRESSION = os.environ.get("INCIDENT_COMPRESSION", "zlib")
+if COMPRESSION not in compression.ALGORITHMS:
+    raise ValueError(f"INCIDENT_COMPRESSION doit valoir l'une des valeurs {compression.ALGORITHMS}.")
+COMPRESS_THRESHOLD = int(os.environ.get("INCIDENT_COMPRESS_THRESHOLD", 4096))
+
+# Archive froide (SQLite locale) des incidents résolus depuis plus de ARCHIVE_AFTER_DAYS jours.
+# Les lectures par ID la consultent quand l'incident n'est plus dans Redis ; toute
+# modification d'un incident archivé le remet d'abord dans Redis.
+# ARCHIVE_INTERVAL > 0 lance l'archivage en tâche de fond toutes les N secondes.
+# Le fichier doit être désigné explicitement (INCIDENT_ARCHIVE_PATH, sur un volume persistant) :
+# sans lui, l'archive est désactivée et l'archivage refusé.
+ARCHIVE_PATH = os.environ.get("INCIDENT_ARCHIVE_PATH") or None
+archive = IncidentArchive(ARCHIVE_PATH, COMPRESSION)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("INCIDENT_ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_INTERVAL = int(os.environ.get("INCIDENT_ARCHIVE_INTERVAL", 0))
+if ARCHIVE_INTERVAL > 0 and ARCHIVE_PATH is None:
+    raise ValueError("INCIDENT_ARCHIVE_INTERVAL nécessite INCIDENT_ARCHIVE_PATH (fichier d'archive persistant).")
+
+# Index secondaires : un set Redis par valeur de champ, contenant les IDs d'incidents
+INDEXED_FIELDS = {
+    "status": "idx:status:{}",
+    "commander": "idx:commander:{}",
+}
+
+# Index des services : un set d'IDs par service touché (champ liste 'services'),
+# et le set des services connus (résumé par service sans SCAN)
+SERVICE_INDEX = "idx:service:{}"
+SERVICES_KEY = "idx:services"
+
+# Filtres des listes résolus par les index : champs indexés et service
+LIST_FILTERS = dict(INDEXED_FIELDS, service=SERVICE_INDEX)
+
+# Index temporel : sorted set des IDs d'incidents, score = started_at
+STARTED_AT_INDEX = "incidents:by_started_at"
+# Index temporel restreint aux filtres d'une liste paginée (ZINTERSTORE avec les index),
+# partagé par les pages suivantes tant que la liste ne change pas (clé versionnée, durée de vie courte)
+FILTERED_INDEX_KEY = "tmp:by_started_at:{}:{}"
+FILTERED_INDEX_TTL = int(os.environ.get("INCIDENT_FILTERED_INDEX_TTL", 30))
+
+# Timeline d'un incident : un Redis Stream par incident, alimenté en ajout seul
+TIMELINE_KEY = "{}:timeline"
+
+# Stream des modifications d'incidents, lisible par les autres services (XREAD / XREADGROUP)
+CHANGES_STREAM = "incidents:changes"
+CHANGES_MAXLEN = int(os.environ.get("INCIDENT_CHANGES_MAXLEN", 100000))
+# Flux SSE de l'application Flask : modifications lues par paquet par le lecteur unique
+# du stream, dernières modifications gardées en mémoire pour les clients
+CHANGE_FEED_BATCH_SIZE = 1000
+CHANGE_FEED_BLOCK_MS = 5000
+CHANGE_FEED_BUFFER_SIZE = 10000
+
+# Cache local des incidents lus par ID, invalidé via pub/sub à chaque écriture
+INVALIDATION_CHANNEL = "incidents:invalidate"
+cache = IncidentCache(
+    maxsize=int(os.environ.get("INCIDENT_CACHE_SIZE", 1000)),
+    ttl=float(os.environ.get("INCIDENT_CACHE_TTL", 5))
+)
+
+# Versions (ETag) : compteur par incident et compteur global de la liste, incrémentés à chaque écriture
+VERSIONS_KEY = "incidents:versions"
+LIST_VERSION_KEY = "incidents:list_version"
+
+# Statistiques tenues à jour à chaque création et changement de statut (HINCRBY) :
+# nombre d'incidents par sévérité et par statut, nombre et durée cumulée des résolutions
+# (MTTR), et par jour UTC (stats:day:AAAA-MM-JJ) créations, résolutions et durée cumulée
+STATS_SEVERITY_KEY = "stats:severity"
+STATS_STATUS_KEY = "stats:status"
+STATS_RESOLUTION_KEY = "stats:resolution"
+STATS_DAY_KEY = "stats:day:{}"
+
+# Recherche plein texte : un sorted set par terme (ID -> score) et, par incident,
+# le hash de ses termes indexés (pour retirer les anciens termes à la mise à jour)
+SEARCH_TERM_KEY = "idx:term:{}"
+SEARCH_TERMS_KEY = "{}:terms"
+SEARCH_FIELDS = tuple(search.FIELD_WEIGHTS)
+
+# Nombre de clés lues par aller-retour lors des chargements en masse
+BATCH_SIZE = 500
+
+VALID_STATUSES = ["open", "mitigated", "resolved"]
+
+# Réponses des requêtes POST portant un en-tête Idempotency-Key : conservées IDEMPOTENCY_TTL s,
+# la clé étant réservée au plus IDEMPOTENCY_LOCK_TTL s pendant le traitement de la première requête
+IDEMPOTENCY_KEY = "idempotency:{}"
+IDEMPOTENCY_TTL = int(os.environ.get("INCIDENT_IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get("INCIDENT_IDEMPOTENCY_LOCK_TTL", 60))
+
+# Regroupement des créations en double : une création de même empreinte (titre normalisé et
+# services) qu'un incident non résolu créé il y a moins de COALESCE_WINDOW s est ajoutée à
+# sa timeline au lieu de créer un nouvel incident (0 désactive le regroupement) ; l'empreinte
+# est réservée au plus COALESCE_PENDING_TTL s pendant la création du premier incident
+FINGERPRINT_KEY = "fingerprint:{}"
+COALESCE_WINDOW = int(os.environ.get("INCIDENT_COALESCE_WINDOW", 0))
+COALESCE_PENDING_TTL = int(os.environ.get("INCIDENT_COALESCE_PENDING_TTL", 10))
+COALESCE_POLL_INTERVAL = 0.05
+
+# Tentatives de réservation d'un ID libre à la création (voir reserveIncidentIds)
+ID_ATTEMPTS = 5
+BULK_OPERATIONS = ("status", "assign")
+
+
+def registerScripts(client):
+    # Enregistre les scripts Lua (EVALSHA, rechargés automatiquement si absents du cache Redis)
+    indexes = ", ".join(f'{field} = "{key_format.format("")}"' for field, key_format in INDEXED_FIELDS.items())
+    placeholders = {
+        "__INDEXES__": "{" + indexes + "}",
+        "__CHANGES_STREAM__": f'"{CHANGES_STREAM}"',
+        "__CHANGES_MAXLEN__": str(CHANGES_MAXLEN),
+        "__INVALIDATION_CHANNEL__": f'"{INVALIDATION_CHANNEL}"',
+        "__VERSIONS_KEY__": f'"{VERSIONS_KEY}"',
+        "__LIST_VERSION_KEY__": f'"{LIST_VERSION_KEY}"',
+        "__STATS_STATUS_KEY__": f'"{STATS_STATUS_KEY}"',
+        "__STATS_RESOLUTION_KEY__": f'"{STATS_RESOLUTION_KEY}"',
+        "__STATS_DAY_PREFIX__": f'"{STATS_DAY_KEY.format("")}"',
+    }
+    prelude = PRELUDE
+    for placeholder, value in placeholders.items():
+        prelude = prelude.replace(placeholder, value)
+    registered = {name: client.register_script(prelude + body) for name, body in SCRIPTS.items()}
+    registered["swap_document"] = client.register_script(SWAP_DOCUMENT)
+    registered["index_terms"] = client.register_script(INDEX_TERMS)
+    registered["archive_incident"] = client.register_script(ARCHIVE_INCIDENT)
+    registered["coalesce_incident"] = client.register_script(COALESCE_INCIDENT)
+    registered["release_fingerprint"] = client.register_script(RELEASE_FINGERPRINT)
+    return registered
+
+
+scripts = registerScripts(r)
+
+
+def encodeHash(obj):
+    # Encode chaque champ en JSON (codec) : les types (int, null, listes, objets) sont conservés
+    return {field: codec.dumps(value) for field, value in obj.items()}
+
+
+def decodeHash(mapping):
+    return {field: codec.loads(value) for field, value in mapping.items()}
+
+
+def writeIncident(pipe, obj, reserved=False):
+    # Ajoute au pipeline les commandes d'écriture complète d'un incident selon le mode de stockage
+    # 'reserved' : le document a déjà été écrit par reserveIncidentIds (mode "json")
+    key = obj["id"]
+    if STORAGE_MODE == "hash":
+        pipe.delete(key)
+        pipe.hset(key, mapping=encodeHash(obj))
+    elif not reserved:
+        pipe.set(key, encodeDocument(obj))
+    touchIncident(pipe, key)
+    queueSearchTerms(pipe, obj)
+
+
+def encodeDocument(obj):
+    # Document stocké en mode "json" : JSON compressé s'il dépasse le seuil
+    return compression.compress(codec.dumps(obj), COMPRESSION, COMPRESS_THRESHOLD)
+
+
+def touchIncident(pipe, key):
+    # Nouvelle version de l'incident et de la liste (ETag)
+    pipe.hincrby(VERSIONS_KEY, key, 1)
+    pipe.incr(LIST_VERSION_KEY)
+    # Les autres workers retirent l'incident de leur cache ; ce processus le fait tout de suite
+    pipe.publish(INVALIDATION_CHANNEL, key)
+    cache.invalidate(key)
 
 
 def saveJSONFile(obj):
-    if r is None:
-        print("Redis non connecté.")
-        return None
     try:
         if "id" not in obj:
             raise ValueError("L'objet JSON doit contenir un champ 'id' unique.")
-        key = obj["id"]
-        json_data = json.dumps(obj)
-        r.set(key, json_data)
+        pipe = r.pipeline()
+        writeIncident(pipe, obj)
+        pipe.execute()
         return obj
+    except UNAVAILABLE:
+        raise
     except Exception as e:
         print(f"Erreur lors de la sauvegarde : {e}")
         return None
 
 
 def loadJSONFile(id):
-    if r is None:
-        print("Redis non connecté.")
-        return None
+    """
+    Charge un incident par ID, en passant par le cache local (lecture au travers).
+    L'objet retourné peut être partagé avec d'autres requêtes : ne pas le modifier.
+    """
+    return loadVersionedJSONFile(id)[0]
+
+
+def loadVersionedJSONFile(id):
+    # Comme loadJSONFile, mais retourne (incident, version de l'incident lu)
+    if not cache.enabled:
+        return readVersionedJSONFile(id)
+    cache.listen(r, INVALIDATION_CHANNEL)
+    entry = cache.get(id)
+    if entry is None:
+        generation = cache.generation
+        entry = readVersionedJSONFile(id)
+        if entry[0] is not None:
+            cache.put(id, entry, generation)
+    return entry
+
+
+def decodeDocument(data):
+    # Décode un incident tel que lu dans Redis (hash, ou document éventuellement compressé)
+    return decodeHash(data) if STORAGE_MODE == "hash" else codec.loads(compression.decompress(data))
+
+
+def loadVersionedJSONFields(id, fields):
+    """
+    Comme loadVersionedJSONFile, mais l'incident retourné ne contient que les champs
+    demandés (et l'ID). En mode "hash", seuls ces champs sont lus (HMGET, sans le cache
+    local) ; sinon l'incident complet est lu puis élagué.
+    """
+    fields = fieldset(fields)
+    if STORAGE_MODE != "hash":
+        obj, version = loadVersionedJSONFile(id)
+        return (selectFields(obj, fields) if obj else None), version
+    pipe = r.pipeline()
+    pipe.hmget(id, fields)
+    pipe.hget(VERSIONS_KEY, id)
+    values, version = pipe.execute()
+    if values[0] is None:
+        # Incident absent de Redis : lecture dans l'archive
+        obj, version = readVersionedJSONFile(id)
+        return (selectFields(obj, fields) if obj else None), version
+    return decodeHash({field: value for field, value in zip(fields, values) if value is not None}), int(version or 0)
+
+
+def readJSONFile(id):
+    # Lit un incident directement dans Redis, sans passer par le cache
+    return readVersionedJSONFile(id)[0]
+
+
+def readVersionedJSONFile(id):
+    # Lit un incident et sa version dans la même transaction
     try:
-        json_data = r.get(id)
-        if json_data is None:
-            return None
-        return json.loads(json_data)
+        if STORAGE_MODE == "hash":
+            pipe = r.pipeline()
+            pipe.hgetall(id)
+        else:
+            pipe = rb.pipeline()
+            pipe.get(id)
+        pipe.hget(VERSIONS_KEY, id)
+        data, version = pipe.execute()
+        if not data:
+            # Incident absent de Redis : lecture dans l'archive (version conservée dans Redis)
+            document = archive.get(id)
+            return (codec.loads(document), int(version or 0)) if document else (None, 0)
+        return decodeDocument(data), int(version or 0)
+    except UNAVAILABLE:
+        raise
     except Exception as e:
         print(f"Erreur lors de la lecture : {e}")
+        return None, 0
+
+
+def incidentVersion(id):
+    # Version courante d'un incident, None s'il n'a pas de version enregistrée (ID inconnu,
+    # ou incident jamais écrit depuis l'ajout des versions) : pas d'ETag comparable
+    version = r.hget(VERSIONS_KEY, id)
+    return int(version) if version is not None else None
+
+
+def listVersion():
+    # Version courante de la liste des incidents, incrémentée à chaque écriture
+    return int(r.get(LIST_VERSION_KEY) or 0)
+
+
+def runIncidentScript(name, id, *args):
+    """
+    Exécute un script Lua de transition sur un incident et retourne l'incident
+    mis à jour, ou None si l'incident n'existe pas.
+
+    Un document compressé est d'abord décompressé sur place (le Lua ne sait pas
+    le lire) ; le document résultant est recompressé s'il dépasse le seuil.
+    Un incident archivé est remis dans Redis avant d'être modifié.
+    Une clé qui n'est pas celle d'un incident (index, stats...) est traitée comme absente.
+    """
+    if not identifiers.is_incident_id(id):
+        return None
+    for _ in range(3):
+        try:
+            result = scripts[name](keys=[id], args=[STORAGE_MODE, int(time.time()), *args])
+        except redis.exceptions.ResponseError as e:
+            if "COMPRESSED" not in str(e):
+                raise
+            inflateIncident(id)
+            continue
+        if result or not restoreIncident(id):
+            break
+    else:
+        raise RuntimeError(f"Impossible de modifier l'incident {id}.")
+    cache.invalidate(id)
+    if not result:
+        return None
+    version, *data = result
+    if STORAGE_MODE == "hash":
+        return decodeHash(dict(zip(data[::2], data[1::2])))
+    payload = data[0].encode()
+    compressed = compression.compress(payload, COMPRESSION, COMPRESS_THRESHOLD)
+    if compressed is not payload:
+        swapDocument(id, version, compressed)
+    return codec.loads(payload)
+
+
+def swapDocument(id, version, document):
+    # Remplace le document stocké (même contenu, autre encodage) s'il est toujours à la 'version' lue
+    return scripts["swap_document"](keys=[id, VERSIONS_KEY], args=[version, document]) == 1
+
+
+def inflateIncident(id):
+    # Réécrit un document compressé sous forme de JSON brut, lisible par les scripts Lua
+    pipe = rb.pipeline()
+    pipe.get(id)
+    pipe.hget(VERSIONS_KEY, id)
+    document, version = pipe.execute()
+    if document is not None and compression.is_compressed(document):
+        swapDocument(id, int(version or 0), compression.decompress(document))
+
+
+def setIncidentStatus(id, status):
+    """
+    Change le statut d'un incident de façon atomique (index et updated_at compris).
+    Lève ValueError si le statut n'est pas valide.
+    """
+    try:
+        return runIncidentScript("set_status", id, status, *VALID_STATUSES)
+    except redis.exceptions.ResponseError as e:
+        if "INVALID_STATUS" in str(e):
+            raise ValueError(f"Statut invalide : {status}") from e
+        raise
+
+
+def assignCommander(id, commander):
+    # Assigne un commandant de façon atomique (index, assigned_at et updated_at compris)
+    return runIncidentScript("assign", id, commander)
+
+
+def attachPostmortem(id, postmortem):
+    # Attache un postmortem de façon atomique (added_at et updated_at compris)
+    incident = runIncidentScript("attach_postmortem", id, codec.dumps(postmortem))
+    if incident:
+        indexSearchTerms(incident)
+    return incident
+
+
+def bulkUpdateIncidents(ids, operation, value):
+    """
+    Applique une opération ("status" ou "assign") à plusieurs incidents via un seul
+    script Lua : tous les incidents sont modifiés dans la même transaction.
+
+    Retourne (IDs modifiés, IDs déjà à jour, IDs inexistants).
+    Lève ValueError si l'opération ou le statut n'est pas valide.
+
+    Les documents compressés et les incidents archivés (remis dans Redis) sont
+    traités dans un second passage (l'atomicité ne porte alors que sur chaque passage).
+    """
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f"Opération invalide : {operation}")
+    changed, unchanged, missing = [], [], []
+    pending = list(dict.fromkeys(ids))
+    # Seules les clés d'incidents sont passées au script (jamais les index, stats...)
+    missing = [id for id in pending if not identifiers.is_incident_id(id)]
+    pending = [id for id in pending if identifiers.is_incident_id(id)]
+    for _ in range(3):
+        try:
+            result = scripts["bulk_update"](
+                keys=pending,
+                args=[STORAGE_MODE, int(time.time()), operation, value, *VALID_STATUSES]
+            )
+        except redis.exceptions.ResponseError as e:
+            if "INVALID_STATUS" in str(e):
+                raise ValueError(f"Statut invalide : {value}") from e
+            raise
+        for found, target in zip(result, (changed, unchanged, missing)):
+            target.extend(found)
+        pending = result[3]
+        if not pending:
+            break
+        for id in pending:
+            inflateIncident(id)
+    else:
+        raise RuntimeError(f"Impossible de décompresser les incidents {pending}.")
+    for id in changed:
+        cache.invalidate(id)
+    if STORAGE_MODE == "json" and changed:
+        recompressDocuments(changed)
+    restored = [id for id in missing if restoreIncident(id)]
+    if restored:
+        missing = [id for id in missing if id not in restored]
+        for found, target in zip(bulkUpdateIncidents(restored, operation, value), (changed, unchanged, missing)):
+            target.extend(found)
+    return changed, unchanged, missing
+
+
+def hashToJSON(mapping):
+    # Assemble le document JSON d'un incident stocké en hash, sans décoder les valeurs
+    return "{" + ",".join(f"{json.dumps(field)}:{value}" for field, value in mapping.items()) + "}"
+
+
+def fieldset(fields):
+    # Liste de champs demandés commençant par 'id' (None : incident complet)
+    if fields is None:
+        return None
+    return ["id", *dict.fromkeys(field for field in fields if field != "id")]
+
+
+def selectFields(obj, fields):
+    # Champs demandés d'un incident décodé (les champs absents sont omis)
+    return {field: obj[field] for field in fields if field in obj}
+
+
+def pruneDocument(document, fields):
+    # Document JSON encodé réduit aux champs demandés (inchangé si 'fields' est None)
+    if fields is None:
+        return document
+    return codec.dumps(selectFields(codec.loads(document), fields))
+
+
+def loadRawJSONFiles(ids, batch_size=BATCH_SIZE, include_archived=False, fields=None):
+    """
+    Comme loadJSONFiles, mais retourne les documents encodés tels que lus dans
+    Redis, sans les décoder (à insérer tels quels dans une réponse HTTP).
+    Avec 'include_archived', les incidents absents de Redis sont lus dans l'archive.
+    Avec 'fields', seuls ces champs (et l'ID) sont renvoyés : en mode "hash", ils sont
+    les seuls lus (HMGET) ; sinon les documents sont élagués avant d'être réencodés.
+    """
+    ids = list(ids)
+    fields = fieldset(fields)
+    documents = []
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        if STORAGE_MODE == "hash" and fields is not None:
+            pipe = r.pipeline(transaction=False)
+            for key in chunk:
+                pipe.hmget(key, fields)
+            found = [
+                hashToJSON({field: value for field, value in zip(fields, values) if value is not None})
+                if values[0] is not None else None
+                for values in pipe.execute()
+            ]
+        elif STORAGE_MODE == "hash":
+            pipe = r.pipeline(transaction=False)
+            for key in chunk:
+                pipe.hgetall(key)
+            found = [hashToJSON(mapping) if mapping else None for mapping in pipe.execute()]
+        else:
+            found = [pruneDocument(compression.decompress(document), fields) if document is not None else None
+                     for document in rb.mget(chunk)]
+        if include_archived and None in found:
+            archived = archive.get_many(key for key, document in zip(chunk, found) if document is None)
+            found = [pruneDocument(archived[key], fields) if document is None and key in archived else document
+                     for key, document in zip(chunk, found)]
+        documents.extend(document for document in found if document is not None)
+    return documents
+
+
+def loadJSONFiles(ids, batch_size=BATCH_SIZE, fields=None):
+    """
+    Charge plusieurs incidents en un minimum d'allers-retours.
+
+    Les IDs sont lus par paquets de 'batch_size' avec MGET (ou un pipeline de
+    HGETALL en mode "hash") ; les clés absentes ou illisibles sont ignorées.
+    L'ordre des IDs fournis est conservé.
+    """
+    incidents = []
+    for json_data in loadRawJSONFiles(ids, batch_size, fields=fields):
+        try:
+            incidents.append(codec.loads(json_data))
+        except Exception as e:
+            print(f"Erreur lors de la lecture : {e}")
+    return incidents
+
+
+def iter_incidents(batch_size=BATCH_SIZE, raw=False, fields=None):
+    """
+    Parcourt tous les incidents sans bloquer Redis.
+
+    Les clés sont découvertes avec SCAN (jamais KEYS) puis chargées par paquets
+    avec MGET : environ N / batch_size allers-retours pour N incidents.
+    Avec raw=True, les documents sont renvoyés encodés (voir loadRawJSONFiles) ;
+    'fields' limite les champs renvoyés.
+    """
+    load = loadRawJSONFiles if raw else loadJSONFiles
+    seen = set()
+    cursor = 0
+    while True:
+        cursor, keys = r.scan(cursor=cursor, match="INC-*", count=batch_size)
+        # SCAN peut renvoyer une clé plusieurs fois ; les sous-clés (INC-xxx:...) sont ignorées
+        keys = [key for key in keys if ":" not in key and key not in seen]
+        seen.update(keys)
+        yield from load(keys, batch_size, fields=fields)
+        if cursor == 0:
+            break
+
+
+def incidentExists(id, include_archived=False):
+    return r.exists(id) == 1 or (include_archived and archive.get(id) is not None)
+
+
+def appendTimelineEvent(id, event):
+    """
+    Ajoute un événement à la timeline d'un incident avec un seul XADD.
+
+    Le document de l'incident n'est pas réécrit : l'ajout est en O(1) et deux
+    ajouts concurrents ne peuvent pas s'écraser. Retourne l'ID de l'entrée.
+    """
+    pipe = r.pipeline()
+    pipe.xadd(TIMELINE_KEY.format(id), {"event": codec.dumps(event)})
+    queueChange(pipe, "timeline", id, {"type": event.get("type")})
+    return pipe.execute()[0]
+
+
+def loadTimeline(id, after=None, limit=100):
+    """
+    Lit au plus 'limit' événements de la timeline d'un incident, dans l'ordre
+    chronologique, situés strictement après l'entrée 'after'.
+
+    Retourne (événements, ID du dernier événement ou None s'il n'y en a plus).
+    """
+    start = f"({after}" if after else "-"
+    entries = r.xrange(TIMELINE_KEY.format(id), min=start, max="+", count=limit + 1)
+    if not entries and not incidentExists(id):
+        return loadArchivedTimeline(id, after, limit)
+    events = [dict(codec.loads(fields["event"]), id=entry_id) for entry_id, fields in entries[:limit]]
+    next_after = events[-1]["id"] if len(entries) > limit else None
+    return events, next_after
+
+
+def streamPosition(entry_id):
+    # Position comparable d'un ID d'entrée de stream "<ms>-<seq>" ; ValueError s'il est invalide
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def loadArchivedTimeline(id, after=None, limit=100):
+    # Comme loadTimeline, pour la timeline embarquée dans le document d'un incident archivé
+    document = archive.get(id)
+    events = codec.loads(document).get("timeline", []) if document else []
+    if after:
+        position = streamPosition(after)
+        events = [event for event in events if streamPosition(event["id"]) > position]
+    next_after = events[limit - 1]["id"] if len(events) > limit else None
+    return events[:limit], next_after
+
+
+def migrateTimelines():
+    """
+    Déplace les timelines encore stockées dans les documents JSON vers les
+    streams INC-xxx:timeline. Retourne le nombre d'incidents migrés.
+    """
+    count = 0
+    for obj in iter_incidents():
+        events = obj.pop("timeline", None)
+        if events is None:
+            continue
+        pipe = r.pipeline()
+        for event in events:
+            pipe.xadd(TIMELINE_KEY.format(obj["id"]), {"event": codec.dumps(event)})
+        writeIncident(pipe, obj)
+        pipe.execute()
+        count += 1
+    return count
+
+
+def queueIndexes(pipe, obj, previous=None):
+    # Ajoute au pipeline les mises à jour d'index correspondant au passage de 'previous' à 'obj'
+    previous = previous or {}
+    for field, key_format in INDEXED_FIELDS.items():
+        old_value = previous.get(field)
+        new_value = obj.get(field)
+        if old_value == new_value:
+            continue
+        if old_value:
+            pipe.srem(key_format.format(old_value), obj["id"])
+        if new_value:
+            pipe.sadd(key_format.format(new_value), obj["id"])
+    # Index des services : l'incident est retiré des services qu'il ne touche plus
+    old_services = set(previous.get("services") or [])
+    new_services = set(obj.get("services") or [])
+    for service in old_services - new_services:
+        pipe.srem(SERVICE_INDEX.format(service), obj["id"])
+    for service in new_services - old_services:
+        pipe.sadd(SERVICE_INDEX.format(service), obj["id"])
+    if new_services - old_services:
+        pipe.sadd(SERVICES_KEY, *(new_services - old_services))
+    # Index temporel : écrit à la création, ou si started_at a été modifié
+    started_at = obj.get("started_at")
+    if started_at is not None and previous.get("started_at") != started_at:
+        pipe.zadd(STARTED_AT_INDEX, {obj["id"]: started_at})
+
+
+def indexIncident(obj, previous=None):
+    """
+    Met à jour les index secondaires d'un incident.
+
+    Pour chaque champ indexé dont la valeur a changé entre 'previous' et 'obj',
+    retire l'ID de l'ancien set et l'ajoute au nouveau, en un seul aller-retour.
+    """
+    pipe = r.pipeline()
+    queueIndexes(pipe, obj, previous)
+    pipe.execute()
+    return obj
+
+
+def queueChange(pipe, op, id, data=None):
+    # Ajoute au pipeline la publication d'un enregistrement de modification compact
+    pipe.xadd(CHANGES_STREAM, {
+        "op": op,
+        "incident": id,
+        "ts": int(time.time()),
+        "data": codec.dumps(data or {})
+    }, maxlen=CHANGES_MAXLEN, approximate=True)
+
+
+def createIncident(obj):
+    """
+    Enregistre un nouvel incident, ses index et l'événement de création
+    dans une seule transaction (un aller-retour).
+    """
+    created = createIncidents([obj])
+    return created[0] if created else None
+
+
+def reserveIncidentIds(objs):
+    """
+    Réserve l'ID de chaque nouvel incident avec SET NX (le document lui-même ; HSETNX du
+    champ 'id' en mode "hash"), en un aller-retour par tentative : un incident existant
+    n'est jamais écrasé. Un incident dont l'ID est déjà pris en reçoit un nouveau.
+    """
+    pending = list(objs)
+    for _ in range(ID_ATTEMPTS):
+        pipe = r.pipeline(transaction=False)
+        for obj in pending:
+            if STORAGE_MODE == "hash":
+                pipe.hsetnx(obj["id"], "id", codec.dumps(obj["id"]))
+            else:
+                pipe.set(obj["id"], encodeDocument(obj), nx=True)
+        pending = [obj for obj, reserved in zip(pending, pipe.execute()) if not reserved]
+        if not pending:
+            return
+        for obj in pending:
+            obj["id"] = identifiers.new_id()
+    raise RuntimeError(f"Impossible de réserver un ID libre après {ID_ATTEMPTS} tentatives.")
+
+
+def createIncidents(objs):
+    """
+    Enregistre plusieurs nouveaux incidents (documents, index et événements de
+    création) dans un seul pipeline transactionnel, après réservation de leurs IDs.
+    """
+    reserveIncidentIds(objs)
+    pipe = r.pipeline()
+    for obj in objs:
+        writeIncident(pipe, obj, reserved=True)
+        queueIndexes(pipe, obj)
+        queueCreationStats(pipe, obj)
+        if COALESCE_WINDOW:
+            queueFingerprint(pipe, obj)
+        queueChange(pipe, "create", obj["id"], {
+            field: obj.get(field) for field in ("title", "sev", "status", "services")
+        })
+    pipe.execute()
+    return objs
+
+
+def reserveIdempotencyKey(key):
+    """
+    Réserve une clé d'idempotence en un aller-retour (SET NX GET).
+    Retourne None si la clé vient d'être réservée (la requête doit être traitée),
+    (None, None, None, None) si la première requête est encore en cours, sinon la réponse
+    enregistrée (statut, type de contenu, en-têtes, corps).
+    """
+    stored = rb.set(IDEMPOTENCY_KEY.format(key), b"", nx=True, get=True, ex=IDEMPOTENCY_LOCK_TTL)
+    if stored is None:
         return None
+    if not stored:
+        return None, None, None, None
+    head, body = stored.split(b"\n", 1)
+    status, mimetype, *headers = head.decode().split(" ", 2)
+    # Réponses enregistrées sans en-têtes (format précédent) : aucun en-tête à rejouer
+    return int(status), mimetype, codec.loads(headers[0]) if headers else {}, body
+
+
+def saveIdempotentResponse(key, status, mimetype, headers, body):
+    # Enregistre la réponse de la première requête : "<statut> <type> <en-têtes JSON>\n<corps>"
+    head = f"{status} {mimetype} ".encode() + codec.dumps(headers) + b"\n"
+    rb.set(IDEMPOTENCY_KEY.format(key), head + body, ex=IDEMPOTENCY_TTL)
+
+
+def releaseIdempotencyKey(key):
+    # Libère une clé réservée dont la requête a échoué : elle pourra être rejouée
+    rb.delete(IDEMPOTENCY_KEY.format(key))
+
+
+def incidentFingerprint(obj):
+    # Empreinte d'un incident : titre normalisé (termes de recherche) et services triés
+    title = " ".join(search.tokenize(str(obj.get("title") or "")))
+    services = sorted({str(service).strip().lower() for service in obj.get("services") or []})
+    return hashlib.sha1("\n".join([title, *services]).encode()).hexdigest()
+
+
+def queueFingerprint(pipe, obj):
+    # Ajoute au pipeline de création l'empreinte de l'incident, définitive et valable COALESCE_WINDOW secondes
+    key = FINGERPRINT_KEY.format(incidentFingerprint(obj))
+    pipe.hset(key, mapping={"id": obj["id"], "count": 1})
+    pipe.hdel(key, "pending")
+    pipe.expire(key, COALESCE_WINDOW)
+
+
+def coalesceIncident(obj):
+    """
+    Regroupe la création de 'obj' avec l'incident non résolu de même empreinte créé depuis
+    moins de COALESCE_WINDOW secondes : un événement "duplicate" numéroté est ajouté à sa
+    timeline, en un seul aller-retour atomique (script Lua).
+
+    Retourne (ID de l'incident existant, nombre d'occurrences), ou None si l'incident doit
+    être créé. Dans ce cas, le script a réservé l'empreinte pour obj["id"] : les créations
+    concurrentes de même empreinte attendent la fin de celle-ci puis y sont regroupées.
+    L'appelant libère l'empreinte si la création échoue (releaseFingerprint).
+    """
+    if not COALESCE_WINDOW:
+        return None
+    deadline = time.monotonic() + COALESCE_PENDING_TTL
+    while True:
+        result = scripts["coalesce_incident"](
+            keys=[FINGERPRINT_KEY.format(incidentFingerprint(obj)), INDEXED_FIELDS["status"].format("resolved"),
+                  CHANGES_STREAM],
+            args=[int(time.time()), TIMELINE_KEY.format(""), "Création en double regroupée dans cet incident",
+                  CHANGES_MAXLEN, obj["id"], COALESCE_PENDING_TTL]
+        )
+        if result == "claimed":
+            return None
+        if result != "pending":
+            incident_id, occurrences = result
+            return incident_id, int(occurrences)
+        # Réservation d'une création bloquée : elle expire, la création a lieu sans regroupement
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(COALESCE_POLL_INTERVAL)
+
+
+def releaseFingerprint(obj, incident_id):
+    # Libère l'empreinte réservée pour 'incident_id' par coalesceIncident (création échouée)
+    if COALESCE_WINDOW:
+        scripts["release_fingerprint"](keys=[FINGERPRINT_KEY.format(incidentFingerprint(obj))], args=[incident_id])
+
+
+def statsDay(timestamp):
+    # Jour UTC (AAAA-MM-JJ) d'un timestamp, même découpage que les scripts Lua
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def queueCreationStats(pipe, obj):
+    # Ajoute au pipeline les compteurs d'un nouvel incident (sévérité, statut, créations du jour)
+    pipe.hincrby(STATS_SEVERITY_KEY, str(obj.get("sev")), 1)
+    pipe.hincrby(STATS_STATUS_KEY, obj.get("status", "open"), 1)
+    pipe.hincrby(STATS_DAY_KEY.format(statsDay(obj.get("started_at") or time.time())), "created", 1)
+
+
+def loadStats(days=0):
+    """
+    Lit les statistiques agrégées en un seul aller-retour, quel que soit le nombre d'incidents.
+
+    Retourne un dict : 'total', 'by_severity', 'by_status', 'resolved' et 'mttr_seconds'
+    (durée moyenne de résolution, None sans résolution), et si 'days' > 0, 'days' :
+    les compteurs des 'days' derniers jours UTC, du plus ancien à aujourd'hui.
+    """
+    today = int(time.time()) // 86400
+    dates = [statsDay((today - offset) * 86400) for offset in range(days - 1, -1, -1)]
+    pipe = r.pipeline()
+    pipe.hgetall(STATS_SEVERITY_KEY)
+    pipe.hgetall(STATS_STATUS_KEY)
+    pipe.hgetall(STATS_RESOLUTION_KEY)
+    for date in dates:
+        pipe.hgetall(STATS_DAY_KEY.format(date))
+    severity, status, resolution, *buckets = pipe.execute()
+
+    def mttr(count, seconds):
+        return int(seconds) / int(count) if int(count or 0) > 0 else None
+
+    by_status = {name: int(count) for name, count in status.items() if int(count)}
+    stats = {
+        "total": sum(by_status.values()),
+        "by_severity": {sev: int(count) for sev, count in severity.items() if int(count)},
+        "by_status": by_status,
+        "resolved": int(resolution.get("count", 0)),
+        "mttr_seconds": mttr(resolution.get("count"), resolution.get("seconds", 0))
+    }
+    if days:
+        stats["days"] = [{
+            "date": date,
+            "created": int(bucket.get("created", 0)),
+            "resolved": int(bucket.get("resolved", 0)),
+            "mttr_seconds": mttr(bucket.get("resolved"), bucket.get("resolve_seconds", 0))
+        } for date, bucket in zip(dates, buckets)]
+    return stats
+
+
+def rebuildStats():
+    """
+    Recalcule toutes les statistiques à partir des incidents présents dans Redis
+    (incidents créés avant leur ajout ou compteurs à corriger). Les incidents résolus
+    sans 'resolved_at' sont comptés par statut mais pas dans la durée de résolution.
+    """
+    for key in r.scan_iter("stats:*", count=BATCH_SIZE):
+        r.delete(key)
+    count = 0
+    pipe = r.pipeline()
+    for obj in iter_incidents():
+        queueCreationStats(pipe, obj)
+        started_at, resolved_at = obj.get("started_at"), obj.get("resolved_at")
+        if obj.get("status") == "resolved" and started_at is not None and resolved_at is not None:
+            bucket = STATS_DAY_KEY.format(statsDay(resolved_at))
+            pipe.hincrby(STATS_RESOLUTION_KEY, "count", 1)
+            pipe.hincrby(STATS_RESOLUTION_KEY, "seconds", resolved_at - started_at)
+            pipe.hincrby(bucket, "resolved", 1)
+            pipe.hincrby(bucket, "resolve_seconds", resolved_at - started_at)
+        count += 1
+        if count % BATCH_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+    return count
+
+
+def readChanges(last_id="0", count=100, block=None):
+    """
+    Lit les modifications publiées après 'last_id' dans le stream des changements.
+
+    Retourne une liste de {"id", "op", "incident", "ts", "data"} ; l'ID (croissant)
+    de la dernière entrée sert de 'last_id' pour l'appel suivant.
+    'block' (en millisecondes) est borné par le délai de lecture des sockets (REDIS_SOCKET_TIMEOUT).
+    """
+    if block is not None:
+        block = max(1, min(block, int(REDIS_CONFIG["socket_timeout"] * 1000) - 500))
+    return decodeChanges(r.xread({CHANGES_STREAM: last_id}, count=count, block=block))
+
+
+def lastChangeId():
+    # ID de la dernière entrée du stream des changements ("0-0" s'il est vide)
+    entries = r.xrevrange(CHANGES_STREAM, count=1)
+    return entries[0][0] if entries else "0-0"
+
+
+def decodeChanges(response):
+    # Modifications contenues dans une réponse XREAD sur le stream des changements
+    if not response:
+        return []
+    return [{
+        "id": entry_id,
+        "op": fields["op"],
+        "incident": fields["incident"],
+        "ts": int(fields["ts"]),
+        "data": codec.loads(fields["data"])
+    } for entry_id, fields in response[0][1]]
+
+
+class ChangeBuffer:
+    """
+    Dernières modifications lues dans le stream des changements, gardées en mémoire :
+    les flux SSE les y prennent sans relire Redis.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.changes = deque()
+        # Position du stream à partir de laquelle 'changes' est complet (None : pas encore lue)
+        self.start = None
+        # Position de la dernière modification lue
+        self.last = None
+
+    def reset(self, start):
+        with self.lock:
+            self.changes.clear()
+            self.start = self.last = start
+
+    def append(self, changes):
+        with self.lock:
+            for change in changes:
+                if len(self.changes) == self.size:
+                    self.start = self.changes.popleft()["id"]
+                self.changes.append(change)
+                self.last = change["id"]
+
+    def since(self, after):
+        # Modifications postérieures à 'after' gardées en mémoire, None si elles n'y sont pas toutes
+        position = streamPosition(after)
+        with self.lock:
+            if self.start is None or position < streamPosition(self.start):
+                return None
+            changes = []
+            for change in reversed(self.changes):
+                if streamPosition(change["id"]) <= position:
+                    break
+                changes.append(change)
+        return changes[::-1]
+
+
+class ChangeFeed(ChangeBuffer):
+    """
+    Lecteur unique du stream des changements pour les flux SSE de l'application Flask :
+    un thread de fond par processus, bloqué en XREAD sur une connexion dédiée, réveille
+    tous les clients ; ceux-ci n'occupent aucune connexion du pool partagé en attendant.
+    """
+
+    def __init__(self, size=CHANGE_FEED_BUFFER_SIZE):
+        super().__init__(size)
+        self.condition = threading.Condition(self.lock)
+        self.thread = None
+
+    def listen(self):
+        # Démarre le lecteur (une seule fois par processus)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="incident-change-feed", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        # Connexion dédiée sans délai de lecture : l'attente est bornée par BLOCK
+        client = redis.Redis(connection_pool=connectionPool(socket_timeout=None, max_connections=1))
+        delay = REDIS_BACKOFF_BASE
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    entries = client.xrevrange(CHANGES_STREAM, count=1)
+                    last_id = entries[0][0] if entries else "0-0"
+                    self.reset(last_id)
+                response = client.xread(
+                    {CHANGES_STREAM: last_id}, count=CHANGE_FEED_BATCH_SIZE, block=CHANGE_FEED_BLOCK_MS
+                )
+                delay = REDIS_BACKOFF_BASE
+            except UNAVAILABLE:
+                time.sleep(delay)
+                delay = min(delay * 2, REDIS_BACKOFF_CAP)
+                continue
+            if response:
+                last_id = response[0][1][-1][0]
+                self.append(decodeChanges(response))
+
+    def reset(self, start):
+        super().reset(start)
+        with self.condition:
+            self.condition.notify_all()
+
+    def append(self, changes):
+        super().append(changes)
+        with self.condition:
+            self.condition.notify_all()
+
+    def wait(self, after, timeout):
+        # Attend (au plus 'timeout' s) que le lecteur ait lu au-delà de 'after' ; False à l'expiration
+        position = streamPosition(after)
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.last is not None and streamPosition(self.last) > position, timeout
+            )
+
+
+changeFeed = ChangeFeed()
+
+
+def membershipQueries(changes, filters):
+    """
+    Paires (clé d'index, ID d'incident) à vérifier pour filtrer des modifications :
+    seulement celles qui ne portent pas elles-mêmes la valeur du champ filtré.
+    """
+    return sorted({
+        (INDEXED_FIELDS[field].format(value), change["incident"])
+        for change in changes for field, value in filters.items() if field not in change["data"]
+    })
+
+
+def matchChanges(changes, filters, members):
+    """
+    Modifications dont l'incident correspond aux filtres (status, commander) : la valeur
+    portée par la modification si elle en a une, sinon l'appartenance à l'index secondaire
+    ('members' : paires de membershipQueries présentes dans Redis).
+    """
+    return [change for change in changes if all(
+        change["data"][field] == value if field in change["data"]
+        else (INDEXED_FIELDS[field].format(value), change["incident"]) in members
+        for field, value in filters.items()
+    )]
+
+
+def filterChanges(changes, **filters):
+    # Comme matchChanges, appartenances aux index vérifiées en un seul pipeline
+    queries = membershipQueries(changes, filters)
+    members = set()
+    if queries:
+        pipe = r.pipeline(transaction=False)
+        for key, id in queries:
+            pipe.sismember(key, id)
+        members = {query for query, member in zip(queries, pipe.execute()) if member}
+    return matchChanges(changes, filters, members)
+
+
+def findIncidentIds(**filters):
+    """
+    Retourne les IDs des incidents correspondant à tous les filtres donnés
+    (ex: status="open", commander="thomas", service="api") par intersection des index.
+    """
+    keys = [LIST_FILTERS[field].format(value) for field, value in filters.items()]
+    if not keys:
+        return set()
+    return r.sinter(keys)
+
+
+def selectIncidentIds(services=None, **filters):
+    """
+    Retourne les IDs (triés) des incidents correspondant aux filtres indexés
+    (status, commander) et, si 'services' est fourni, touchant au moins un de ces services
+    (union des index de services, en un aller-retour avec les filtres).
+    """
+    if not services:
+        return sorted(findIncidentIds(**filters))
+    pipe = r.pipeline(transaction=False)
+    pipe.sunion([SERVICE_INDEX.format(service) for service in services])
+    if filters:
+        pipe.sinter([INDEXED_FIELDS[field].format(value) for field, value in filters.items()])
+    ids, *filtered = pipe.execute()
+    for matching in filtered:
+        ids &= matching
+    return sorted(ids)
+
+
+def serviceSummary():
+    """
+    Nombre d'incidents par service, calculé à partir des cardinalités des index
+    (SCARD et SINTERCARD avec les index de statut) en un seul aller-retour.
+    Retourne une liste de {"service", "total", "open", "mitigated"} ; les services
+    qui n'ont plus d'incident dans Redis sont omis.
+    """
+    services = sorted(r.smembers(SERVICES_KEY))
+    if not services:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for service in services:
+        key = SERVICE_INDEX.format(service)
+        pipe.scard(key)
+        for status in ("open", "mitigated"):
+            pipe.sintercard(2, [key, INDEXED_FIELDS["status"].format(status)])
+    counts = pipe.execute()
+    summary = []
+    for index, service in enumerate(services):
+        total, open_count, mitigated = counts[3 * index:3 * index + 3]
+        if total:
+            summary.append({"service": service, "total": total, "open": open_count, "mitigated": mitigated})
+    return sorted(summary, key=lambda item: (-item["open"], item["service"]))
+
+
+def iterIncidentDocuments(since=None, until=None, batch_size=BATCH_SIZE, **filters):
+    """
+    Génère un à un les documents JSON bruts des incidents correspondant aux filtres
+    (status, commander via les index, 'since'/'until' sur started_at), lus par paquets
+    de 'batch_size' : seuls les IDs sont gardés en mémoire, jamais tous les documents.
+    """
+    if filters:
+        ids = sorted(findIncidentIds(**filters))
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            if since is not None or until is not None:
+                chunk = [id for id, score in zip(chunk, r.zmscore(STARTED_AT_INDEX, chunk))
+                         if score is not None
+                         and (since is None or score >= since)
+                         and (until is None or score <= until)]
+            yield from loadRawJSONFiles(chunk, batch_size)
+    elif since is None and until is None:
+        yield from iter_incidents(batch_size, raw=True)
+    else:
+        # Parcours de l'index temporel page par page (curseur stable en cas d'ex aequo)
+        cursor = None
+        while True:
+            ids, cursor = pageIncidentIds(batch_size, cursor, since, until)
+            yield from loadRawJSONFiles(ids, batch_size)
+            if cursor is None:
+                return
+
+
+def rebuildIndexes():
+    """
+    Reconstruit tous les index secondaires à partir des incidents présents
+    dans Redis (utile pour les incidents créés avant l'ajout des index).
+    """
+    for key_format in LIST_FILTERS.values():
+        for key in r.scan_iter(key_format.format("*")):
+            r.delete(key)
+    r.delete(STARTED_AT_INDEX, SERVICES_KEY)
+    for pattern in (SEARCH_TERM_KEY.format("*"), SEARCH_TERMS_KEY.format("INC-*")):
+        for key in r.scan_iter(pattern, count=BATCH_SIZE):
+            r.delete(key)
+    count = 0
+    for obj in iter_incidents():
+        indexIncident(obj)
+        indexSearchTerms(obj)
+        count += 1
+    return count
+
+
+def queueSearchTerms(pipe, obj):
+    # Ajoute au pipeline la mise à jour des termes indexés de l'incident (titre, résumé, postmortem)
+    scores = search.term_scores(obj)
+    scripts["index_terms"](
+        keys=[SEARCH_TERMS_KEY.format(obj["id"])],
+        args=[obj["id"], SEARCH_TERM_KEY.format(""), *(item for pair in scores.items() for item in pair)],
+        client=pipe
+    )
+
+
+def indexSearchTerms(obj):
+    # Met à jour les termes indexés d'un incident (hors pipeline d'écriture)
+    pipe = r.pipeline()
+    queueSearchTerms(pipe, obj)
+    pipe.execute()
+
+
+def searchIncidents(query, limit=20):
+    """
+    Recherche plein texte : retourne les (ID, score) des incidents contenant tous
+    les termes de 'query', par score décroissant (somme des scores des termes).
+
+    L'intersection des index de termes est calculée par Redis (ZINTERSTORE) dans
+    une clé temporaire ; seuls les 'limit' premiers résultats sont transférés.
+    """
+    keys = [SEARCH_TERM_KEY.format(term) for term in sorted(set(search.tokenize(query)))]
+    if not keys:
+        return []
+    if len(keys) == 1:
+        return r.zrevrange(keys[0], 0, limit - 1, withscores=True)
+    result_key = f"search:{os.urandom(8).hex()}"
+    pipe = r.pipeline()
+    pipe.zinterstore(result_key, keys)
+    pipe.zrevrange(result_key, 0, limit - 1, withscores=True)
+    pipe.delete(result_key)
+    return pipe.execute()[1]
+
+
+def encodeCursor(score, incident_id):
+    # Curseur de pagination : position (started_at, id) du dernier incident renvoyé
+    return f"{int(score)}:{incident_id}"
+
+
+def decodeCursor(cursor):
+    score, sep, incident_id = cursor.partition(":")
+    if not sep or not incident_id:
+        raise ValueError("Curseur invalide.")
+    return int(score), incident_id
+
+
+def filteredTimeIndex(filters):
+    """
+    Retourne la clé d'un sorted set temporaire des incidents correspondant aux filtres
+    (status, commander, service), avec leur started_at pour score : ZINTERSTORE de
+    l'index temporel (poids 1) et des index des filtres (poids 0), calculé dans Redis.
+    La clé dépend des filtres et de la version de la liste : les pages suivantes la
+    réutilisent sans recalcul tant qu'aucun incident n'est modifié.
+    """
+    keys = sorted(LIST_FILTERS[field].format(value) for field, value in filters.items())
+    digest = hashlib.sha1("\n".join(keys).encode()).hexdigest()
+    key = FILTERED_INDEX_KEY.format(digest, listVersion())
+    if r.expire(key, FILTERED_INDEX_TTL):
+        return key
+    pipe = r.pipeline()
+    pipe.zinterstore(key, dict({STARTED_AT_INDEX: 1}, **{index: 0 for index in keys}))
+    pipe.expire(key, FILTERED_INDEX_TTL)
+    pipe.execute()
+    return key
+
+
+def pageIncidentIds(limit, cursor=None, since=None, until=None, descending=False, include_archived=False, **filters):
+    """
+    Retourne une page d'IDs d'incidents triés par started_at (puis par ID),
+    ainsi que le curseur de la page suivante (None s'il n'y en a plus).
+
+    Seule la page demandée est lue avec ZRANGEBYSCORE, dans l'index temporel ou,
+    avec des filtres (status, commander, service), dans son intersection avec les
+    index (voir filteredTimeIndex).
+    Avec 'include_archived', la page est fusionnée avec celle de l'archive.
+    Lève ValueError si le curseur est invalide.
+    """
+    after = decodeCursor(cursor) if cursor else None
+    low = "-inf" if since is None else since
+    high = "+inf" if until is None else until
+
+    def is_after(score, incident_id):
+        if after is None:
+            return True
+        return (score, incident_id) < after if descending else (score, incident_id) > after
+
+    index = filteredTimeIndex(filters) if filters else STARTED_AT_INDEX
+    if after is not None:
+        # Reprend à partir du score du curseur ; les ex aequo déjà vus sont ignorés
+        if descending:
+            high = after[0]
+        else:
+            low = after[0]
+    page = []
+    offset = 0
+    while len(page) <= limit:
+        if descending:
+            batch = r.zrevrangebyscore(index, high, low, start=offset, num=limit + 1, withscores=True)
+        else:
+            batch = r.zrangebyscore(index, low, high, start=offset, num=limit + 1, withscores=True)
+        if not batch:
+            break
+        offset += len(batch)
+        page.extend((int(score), incident_id) for incident_id, score in batch if is_after(int(score), incident_id))
+    page = page[:limit + 1]
+
+    if include_archived:
+        # Redis fait foi pour un incident présent des deux côtés (archivage interrompu)
+        seen = {incident_id for _, incident_id in page}
+        archived = [item for item in archive.page(limit + 1, after, since, until, descending, **filters)
+                    if item[1] not in seen]
+        page = sorted(page + archived, reverse=descending)[:limit + 1]
+
+    next_cursor = encodeCursor(*page[limit - 1]) if len(page) > limit else None
+    return [incident_id for _, incident_id in page[:limit]], next_cursor
+
+
+def migrateStorage():
+    """
+    Convertit les incidents stockés dans l'autre mode vers le mode courant
+    (INCIDENT_STORAGE). Retourne le nombre d'incidents convertis.
+    """
+    source_type = "string" if STORAGE_MODE == "hash" else "hash"
+    count = 0
+    for key in r.scan_iter("INC-*", count=BATCH_SIZE, _type=source_type):
+        if ":" in key:
+            continue
+        if source_type == "hash":
+            obj = decodeHash(r.hgetall(key))
+        else:
+            obj = codec.loads(compression.decompress(rb.get(key)))
+        saveJSONFile(obj)
+        count += 1
+    return count
+
+
+def recompressIncidents():
+    """
+    Réencode les documents existants (mode "json") selon le seuil et l'algorithme
+    courants : compression des gros documents, décompression des petits.
+
+    Retourne (nombre de documents réécrits, taille totale avant, taille totale après) en octets.
+    """
+    count = before = after = 0
+    for key in r.scan_iter("INC-*", count=BATCH_SIZE, _type="string"):
+        if ":" in key:
+            continue
+        size_before, size_after = recompressIncident(key)
+        before += size_before
+        after += size_after
+        count += size_before != size_after
+    return count, before, after
+
+
+def recompressIncident(id):
+    # Réencode un document (mode "json") selon les réglages courants ; retourne (taille avant, taille après)
+    pipe = rb.pipeline()
+    pipe.get(id)
+    pipe.hget(VERSIONS_KEY, id)
+    document, version = pipe.execute()
+    if document is None:
+        return 0, 0
+    encoded = compression.compress(compression.decompress(document), COMPRESSION, COMPRESS_THRESHOLD)
+    if encoded != document and swapDocument(id, int(version or 0), encoded):
+        return len(document), len(encoded)
+    return len(document), len(document)
+
+
+def recompressDocuments(ids):
+    """
+    Réencode plusieurs documents (mode "json") selon les réglages courants, en deux
+    allers-retours quel que soit leur nombre : lecture (MGET + HMGET des versions),
+    puis remplacement des documents dont l'encodage change.
+    """
+    pipe = rb.pipeline(transaction=False)
+    pipe.mget(ids)
+    pipe.hmget(VERSIONS_KEY, ids)
+    documents, versions = pipe.execute()
+    pipe = r.pipeline(transaction=False)
+    for id, document, version in zip(ids, documents, versions):
+        if document is None:
+            continue
+        encoded = compression.compress(compression.decompress(document), COMPRESSION, COMPRESS_THRESHOLD)
+        if encoded != document:
+            scripts["swap_document"](keys=[id, VERSIONS_KEY], args=[int(version or 0), encoded], client=pipe)
+    pipe.execute()
+
+
+def iterArchivedIncidents(batch_size=BATCH_SIZE, **filters):
+    """
+    Parcourt les documents JSON (bytes) des incidents archivés correspondant aux
+    filtres (status, commander), en ignorant ceux qui sont aussi présents dans Redis.
+    """
+    batch = []
+    for item in archive.iter_documents(batch_size, **filters):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield from archivedOnly(batch)
+            batch = []
+    yield from archivedOnly(batch)
+
+
+def archivedOnly(items):
+    # Documents des paires (ID, document) dont l'incident n'est plus dans Redis
+    if not items:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for id, _ in items:
+        pipe.exists(id)
+    return [document for (_, document), exists in zip(items, pipe.execute()) if not exists]
+
+
+def archiveResolvedIncidents(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE):
+    """
+    Déplace dans l'archive les incidents résolus depuis plus de 'older_than_days' jours
+    (date de résolution, à défaut date de dernière modification). Retourne le nombre
+    d'incidents archivés.
+
+    Chaque paquet est d'abord écrit dans l'archive, puis retiré de Redis par un script
+    Lua (document, timeline, index) seulement s'il n'a pas été modifié entre-temps ;
+    sinon la copie archivée est supprimée et l'incident reste dans Redis.
+    Lève ValueError si aucun fichier d'archive n'est configuré (INCIDENT_ARCHIVE_PATH).
+    """
+    if archive.path is None:
+        raise ValueError("Archivage impossible : INCIDENT_ARCHIVE_PATH doit désigner le fichier d'archive.")
+    cutoff = int(time.time()) - older_than_days * 86400
+    ids = sorted(r.smembers(INDEXED_FIELDS["status"].format("resolved")))
+    count = 0
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        # Versions et timelines sont lues avant les documents : toute écriture ultérieure
+        # change la version ou la dernière entrée, et le retrait de Redis est alors refusé
+        pipe = r.pipeline()
+        pipe.hmget(VERSIONS_KEY, chunk)
+        for id in chunk:
+            pipe.xrange(TIMELINE_KEY.format(id))
+        versions, *timelines = pipe.execute()
+        documents = {obj.get("id"): obj for obj in loadJSONFiles(chunk)}
+        candidates = []
+        for id, version, entries in zip(chunk, versions, timelines):
+            obj = documents.get(id)
+            if obj is None:
+                continue
+            resolved_at = obj.get("resolved_at") or obj.get("updated_at") or obj.get("started_at") or 0
+            if obj.get("status") != "resolved" or resolved_at > cutoff:
+                continue
+            obj["timeline"] = [dict(codec.loads(fields["event"]), id=entry_id) for entry_id, fields in entries]
+            candidates.append((obj, int(version or 0), entries[-1][0] if entries else ""))
+        if not candidates:
+            continue
+
+        archive.put([(obj, codec.dumps(obj)) for obj, _, _ in candidates])
+        pipe = r.pipeline(transaction=False)
+        for obj, version, last_event in candidates:
+            id = obj["id"]
+            index_keys = [INDEXED_FIELDS[field].format(obj[field]) for field in INDEXED_FIELDS if obj.get(field) is not None]
+            index_keys.extend(SERVICE_INDEX.format(service) for service in set(obj.get("services") or []))
+            scripts["archive_incident"](
+                keys=[id, VERSIONS_KEY, TIMELINE_KEY.format(id), SEARCH_TERMS_KEY.format(id),
+                      STARTED_AT_INDEX, LIST_VERSION_KEY, *index_keys],
+                args=[version, last_event, INVALIDATION_CHANNEL, SEARCH_TERM_KEY.format("")],
+                client=pipe
+            )
+        results = pipe.execute()
+        archive.delete(obj["id"] for (obj, _, _), removed in zip(candidates, results) if not removed)
+        for obj, _, _ in candidates:
+            cache.invalidate(obj["id"])
+        count += sum(results)
+    return count
+
+
+def restoreIncident(id):
+    """
+    Remet dans Redis un incident archivé (document, timeline, index) puis le retire
+    de l'archive. Retourne False si l'incident n'est pas archivé.
+    """
+    document = archive.get(id)
+    if document is None:
+        return False
+    obj = codec.loads(document)
+    events = obj.pop("timeline", [])
+    pipe = r.pipeline()
+    writeIncident(pipe, obj)
+    queueIndexes(pipe, obj)
+    for event in events:
+        entry_id = event.pop("id")
+        pipe.xadd(TIMELINE_KEY.format(id), {"event": codec.dumps(event)}, id=entry_id)
+    # Une restauration concurrente rejoue les mêmes écritures : les XADD en double échouent sans effet
+    pipe.execute(raise_on_error=False)
+    archive.delete([id])
+    return True
+
+
+def startArchiver(interval=ARCHIVE_INTERVAL, older_than_days=ARCHIVE_AFTER_DAYS):
+    """
+    Lance l'archivage périodique dans un thread de fond (toutes les 'interval' secondes).
+    Sans effet si 'interval' vaut 0. Plusieurs workers peuvent l'exécuter en même temps.
+    """
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            try:
+                count = archiveResolvedIncidents(older_than_days)
+                if count:
+                    print(f"{count} incident(s) archivé(s).")
+            except Exception as e:
+                print(f"Erreur lors de l'archivage : {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="incident-archiver", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,57 @@
+import re
+import unicodedata
+from collections import Counter
+
+# Découpage en termes pour l'index de recherche plein texte des incidents
+# (titre, résumé et postmortem). Les termes et leurs scores sont stockés dans Redis
+# par redis_link ; ce module ne fait que le traitement du texte.
+
+# Poids de chaque champ dans le score d'un terme (un mot du titre compte plus)
+FIELD_WEIGHTS = {"title": 3, "summary": 1, "postmortem": 1}
+
+MIN_TERM_LENGTH = 2
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Mots vides français et anglais, ignorés à l'indexation comme à la recherche
+STOPWORDS = frozenset("""
+    au aux avec ce ces dans de des du elle en et il ils la le les leur lui ma mais me
+    meme mes mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta
+    te tes toi ton tu un une vos votre vous est sont ete etait
+    an and are as at be by for from has have in is it its of on or that the this to
+    was were will with
+""".split())
+
+
+def tokenize(text):
+    """
+    Retourne les termes d'un texte : minuscules, sans accents, découpés sur les
+    caractères non alphanumériques, mots vides et termes trop courts retirés.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    return [term for term in TERM_PATTERN.findall(normalized)
+            if len(term) >= MIN_TERM_LENGTH and term not in STOPWORDS]
+
+
+def texts(value):
+    # Chaînes contenues dans une valeur (le postmortem est un objet contenant des listes)
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from texts(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from texts(item)
+
+
+def term_scores(obj):
+    """
+    Retourne le score de chaque terme d'un incident : nombre d'occurrences
+    pondéré par le poids du champ (FIELD_WEIGHTS).
+    """
+    scores = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for text in texts(obj.get(field)):
+            for term in tokenize(text):
+                scores[term] += weight
+    return dict(scores)
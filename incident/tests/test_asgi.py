@@ -0,0 +1,150 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("asgiref")
+
+import asgi
+import identifiers
+from redis_link import appendTimelineEvent, assignCommander, createIncident, lastChangeId
+
+
+def call(path, method="GET", headers=None, body=b"", query=b""):
+    """Exécute une requête sur l'application ASGI, sans serveur ; retourne (statut, en-têtes, corps)."""
+    return asyncio.run(request(path, method, headers, body, query))
+
+
+async def request(path, method="GET", headers=None, body=b"", query=b""):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query, "root_path": "",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": ("127.0.0.1", 5000), "server": ("localhost", 8000),
+    }
+    received = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        received.append(message)
+
+    await asgi.app(scope, receive, send)
+    await asgi.notifier.stop()
+    await asgi.clients.close()
+    start = received[0]
+    content = b"".join(message.get("body", b"") for message in received[1:])
+    return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}, content
+
+
+def test_native_health_check():
+    """La route de santé est servie nativement (redis.asyncio)."""
+    status, _, content = call("/api/v1/incidents/health")
+    assert status == 200
+    assert json.loads(content)["redis"] == "connected"
+
+
+def test_create_through_flask_and_read_natively():
+    """Une route Flask (création) et la lecture native par ID, avec ETag et 304."""
+    body = json.dumps({"title": "ASGI", "sev": "low"}).encode()
+    status, _, content = call(
+        "/api/v1/incidents", "POST", {"Content-Type": "application/json", "Content-Length": str(len(body))}, body
+    )
+    assert status == 201
+    inc_id = json.loads(content)["id"]
+
+    status, headers, content = call(f"/api/v1/incidents/{inc_id}")
+    assert status == 200
+    assert json.loads(content)["title"] == "ASGI"
+    status, _, content = call(f"/api/v1/incidents/{inc_id}", headers={"If-None-Match": headers["etag"]})
+    assert status == 304
+    assert content == b""
+    assert call("/api/v1/incidents/INC-NOPE00")[0] == 404
+    assert call("/api/v1/incidents/INC-NOPE00", headers={"If-None-Match": '"INC-NOPE00-0"'})[0] == 404
+
+
+def test_long_poll_wakes_on_change():
+    """Une attente longue est réveillée par une modification publiée pendant l'attente."""
+    after = lastChangeId()
+    incident_id = identifiers.new_id()
+
+    async def scenario():
+        waiting = asyncio.create_task(request("/api/v1/incidents/changes", query=f"after={after}&timeout=5".encode()))
+        await asyncio.sleep(0.3)
+        await asyncio.to_thread(createIncident, {
+            "id": incident_id, "title": "Long poll", "sev": "low", "services": [], "summary": "",
+            "status": "open", "started_at": 1, "commander": None
+        })
+        return await waiting
+
+    status, _, content = asyncio.run(scenario())
+    assert status == 200
+    assert incident_id in [change["incident"] for change in json.loads(content)["data"]]
+    assert call("/api/v1/incidents/changes", query=b"timeout=999")[0] == 400
+
+
+def test_native_read_with_fields():
+    """La lecture native par ID respecte le paramètre 'fields'."""
+    incident_id = identifiers.new_id()
+    createIncident({
+        "id": incident_id, "title": "Champs", "sev": "low", "services": [], "summary": "",
+        "status": "open", "started_at": 1, "commander": None
+    })
+    status, _, content = call(f"/api/v1/incidents/{incident_id}", query=b"fields=title,sev")
+    assert status == 200
+    assert json.loads(content) == {"id": incident_id, "title": "Champs", "sev": "low"}
+    assert call(f"/api/v1/incidents/{incident_id}", query=b"fields=")[0] == 400
+
+
+def test_sse_stream_resumes_filters_and_pushes():
+    """Le flux SSE reprend après Last-Event-ID, filtre par commandant et pousse les nouvelles modifications."""
+    after = lastChangeId()
+    followed, other = identifiers.new_id(), identifiers.new_id()
+    commander = f"sse-{followed}"
+    for incident_id in (followed, other):
+        createIncident({
+            "id": incident_id, "title": "SSE", "sev": "low", "services": [], "summary": "",
+            "status": "open", "started_at": 1, "commander": None
+        })
+    assignCommander(followed, commander)
+
+    async def scenario():
+        disconnect = asyncio.Event()
+        requested = False
+        body = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            body.append(message.get("body", b""))
+            if b"event: timeline" in b"".join(body):
+                disconnect.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/api/v1/incidents/stream", "raw_path": b"/api/v1/incidents/stream",
+            "query_string": f"commander={commander}".encode(), "root_path": "",
+            "headers": [(b"last-event-id", after.encode())], "client": ("127.0.0.1", 5000), "server": ("localhost", 8000),
+        }
+        task = asyncio.create_task(asgi.app(scope, receive, send))
+        while b"event: assign" not in b"".join(body):
+            await asyncio.sleep(0.05)
+        await asyncio.to_thread(appendTimelineEvent, followed, {"timestamp": 1, "type": "note", "message": "SSE"})
+        await asyncio.wait_for(task, 5)
+        await asgi.notifier.stop()
+        await asgi.clients.close()
+        return b"".join(body).decode()
+
+    content = asyncio.run(scenario())
+    events = [json.loads(line[len("data: "):]) for line in content.splitlines() if line.startswith("data: ")]
+    assert [(event["op"], event["incident"]) for event in events] == [
+        ("create", followed), ("assign", followed), ("timeline", followed)
+    ]
+    assert content.startswith("retry: ")
+    assert call("/api/v1/incidents/stream", headers={"Last-Event-ID": "hier"})[0] == 400
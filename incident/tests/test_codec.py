@@ -0,0 +1,41 @@
+import pytest
+import codec
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    """Exécute le test avec orjson puis avec le repli sur la bibliothèque standard."""
+    if request.param == "json":
+        monkeypatch.setattr(codec, "orjson", None)
+    elif codec.orjson is None:
+        pytest.skip("orjson n'est pas installé")
+    return request.param
+
+
+def test_roundtrip(backend):
+    """Vérifie qu'un incident encodé puis décodé est inchangé."""
+    incident = {"id": "INC-CODEC1", "title": "Latence élevée", "services": [], "commander": None, "sev": 2}
+    encoded = codec.dumps(incident)
+    assert isinstance(encoded, bytes)
+    assert codec.loads(encoded) == incident
+    assert codec.loads(encoded.decode()) == incident
+    assert codec.backend() == backend
+
+
+def test_dumps_fragments_splices_raw_documents(backend):
+    """Vérifie que les fragments déjà encodés sont insérés tels quels."""
+    raw = '{"id":"INC-CODEC2","title":"Brut"}'
+    body = codec.dumps_fragments({"data": [codec.Fragment(raw)], "count": 1, "next_cursor": None})
+    assert raw.encode() in body
+    assert codec.loads(body) == {"data": [{"id": "INC-CODEC2", "title": "Brut"}], "count": 1, "next_cursor": None}
+
+
+def test_integers_beyond_64_bits(backend):
+    """Vérifie que les entiers de plus de 64 bits sont encodés et décodés exactement."""
+    incident = {"id": "INC-CODEC3", "sev": 10 ** 27, "budget": -(2 ** 70), "ratio": 0.5}
+    encoded = codec.dumps(incident)
+    assert b"1000000000000000000000000000" in encoded
+    assert codec.loads(encoded) == incident
+    assert codec.loads(encoded.decode()) == incident
+    with pytest.raises(TypeError):
+        codec.dumps({"tags": {"a"}})
@@ -1,5 +1,12 @@
 import json
+import threading
+import time
+import uuid
 import pytest
+import redis
+import compression
+import identifiers
+import redis_link
 from main import app, saveJSONFile, loadJSONFile
 from redis_link import *
 
@@ -14,6 +21,22 @@ def client():
         yield client
 
 
+@pytest.fixture
+def isolated_db(monkeypatch):
+    """
+    Base Redis séparée (REDIS_DB + 1), vidée avant et après le test : pour les tests qui
+    réécrivent des clés globales (statistiques...) sans toucher à celles des autres tests.
+    """
+    db = REDIS_CONFIG["db"] + 1
+    isolated = redis.Redis(connection_pool=connectionPool(db=db))
+    isolated.flushdb()
+    monkeypatch.setattr(redis_link, "r", isolated)
+    monkeypatch.setattr(redis_link, "rb", redis.Redis(connection_pool=connectionPool(decode_responses=False, db=db)))
+    monkeypatch.setattr(redis_link, "scripts", registerScripts(isolated))
+    yield isolated
+    isolated.flushdb()
+
+
 # === TESTS DE BASE ===
 
 def test_redis_connection():
@@ -21,6 +44,36 @@ def test_redis_connection():
     assert r.ping() is True
 
 
+def test_redis_unavailable_returns_503(client, monkeypatch):
+    """Redis injoignable : le client se crée sans connexion et les routes répondent 503."""
+    offline = redis.Redis(connection_pool=connectionPool(port=1, socket_connect_timeout=0.1))
+    monkeypatch.setattr(redis_link, "r", offline)
+    response = client.get('/api/v1/incidents/stats')
+    assert response.status_code == 503
+    assert "error" in response.get_json()
+
+
+def test_timed_out_command_is_not_replayed(monkeypatch):
+    """Un délai de réponse dépassé n'est pas rejoué : l'écriture a pu être exécutée par Redis."""
+    client = redis.Redis(connection_pool=connectionPool())
+    sent = []
+    send_command = redis.connection.Connection.send_command
+
+    def counting_send(self, *args, **kwargs):
+        sent.append(args[0])
+        return send_command(self, *args, **kwargs)
+
+    def timed_out(self, *args, **kwargs):
+        raise redis.exceptions.TimeoutError("Timeout reading from socket")
+
+    client.ping()
+    monkeypatch.setattr(redis.connection.Connection, "send_command", counting_send)
+    monkeypatch.setattr(redis.connection.Connection, "read_response", timed_out)
+    with pytest.raises(redis.exceptions.TimeoutError):
+        client.incr("test:timeout")
+    assert sent == ["INCRBY"]
+
+
 def test_health_check(client):
     """Teste la route de health check."""
     response = client.get('/api/v1/incidents/health')
@@ -49,9 +102,12 @@ def test_create_incident(client):
     assert "id" in data
     assert data["status"] == "open"
 
-    # Vérifie que l’incident est bien stocké dans Redis
-    redis_obj = r.get(f"INC:{data['id']}") or r.get(data["id"])
-    assert redis_obj is not None
+    # Vérifie que l’incident est bien stocké dans Redis (document JSON, ou hash en mode "hash")
+    if STORAGE_MODE == "hash":
+        redis_obj = r.hgetall(data["id"])
+    else:
+        redis_obj = r.get(f"INC:{data['id']}") or r.get(data["id"])
+    assert redis_obj
 
 
 def test_create_invalid_incident(client):
@@ -106,6 +162,38 @@ def test_filter_by_status(client):
         assert inc["status"] == "open"
 
 
+def test_filter_by_commander_uses_index(client):
+    """Teste le filtre 'commander' : seuls les incidents assignés sont retournés."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Filter commander", "sev": "low"}
+    ).get_json()["id"]
+    client.put(f'/api/v1/incidents/{inc_id}/assign', json={"commander": "index-user"})
+
+    assert inc_id in r.smembers("idx:commander:index-user")
+    response = client.get('/api/v1/incidents?commander=index-user&status=open')
+    assert response.status_code == 200
+    ids = [inc["id"] for inc in response.get_json()]
+    assert inc_id in ids
+    assert all(inc["commander"] == "index-user" for inc in response.get_json())
+
+
+def test_status_index_follows_updates(client):
+    """Vérifie que l'index de statut est mis à jour lors d'un changement de statut."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Index status", "sev": "low"}
+    ).get_json()["id"]
+    assert inc_id in r.smembers("idx:status:open")
+
+    client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "resolved"})
+    assert inc_id not in r.smembers("idx:status:open")
+    assert inc_id in r.smembers("idx:status:resolved")
+
+    ids = [inc["id"] for inc in client.get('/api/v1/incidents?status=open').get_json()]
+    assert inc_id not in ids
+
+
 # === TESTS DE MISE À JOUR ===
 
 def test_update_incident_status(client):
@@ -134,6 +222,20 @@ def test_update_incident_status(client):
     )
     assert response_404.status_code == 404
 
+    # Corps ou statut d'un type inattendu
+    for body in (["status"], {"status": ["resolved"]}, {"status": {"a": 1}}):
+        assert client.put(f'/api/v1/incidents/{inc_id}/status', json=body).status_code == 400
+
+
+def test_huge_integer_is_preserved(client):
+    """Un entier de plus de 64 bits est conservé exactement, sans erreur 500."""
+    response = client.post('/api/v1/incidents', json={"title": "Grand entier", "sev": 10 ** 27})
+    assert response.status_code == 201
+    inc_id = response.get_json()["id"]
+    assert response.get_json()["sev"] == 10 ** 27
+    client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "mitigated"})
+    assert client.get(f'/api/v1/incidents/{inc_id}').get_json()["sev"] == 10 ** 27
+
 
 def test_assign_incident(client):
     """Teste l'assignation d'un commandant à un incident."""
@@ -161,6 +263,11 @@ def test_assign_incident(client):
         f"/api/v1/incidents/{incident_id}/assign", json={})
     assert response_invalid.status_code == 400
 
+    # Cas invalide : commandant qui n'est pas une chaîne, corps qui n'est pas un objet
+    for body in ({"commander": {"a": 1}}, {"commander": 42}, ["commander"]):
+        assert client.put(f"/api/v1/incidents/{incident_id}/assign", json=body).status_code == 400
+    assert client.get(f"/api/v1/incidents/{incident_id}").get_json()["commander"] == "thomas"
+
     # Cas incident inexistant
     response_404 = client.put(
         "/api/v1/incidents/INC-UNKNOWN/assign", json=assign_payload)
@@ -183,9 +290,14 @@ def test_add_timeline_event(client):
         json={"type": "alert", "message": "CPU spike detected"}
     )
     assert response.status_code == 200
-    updated = response.get_json()
-    assert "timeline" in updated
-    assert any(event["type"] == "alert" for event in updated["timeline"])
+    event = response.get_json()
+    assert event["type"] == "alert"
+    assert "id" in event
+
+    # L'événement est lisible via la timeline, le document reste inchangé
+    timeline = client.get(f'/api/v1/incidents/{inc_id}/timeline').get_json()
+    assert any(e["type"] == "alert" for e in timeline["data"])
+    assert "timeline" not in client.get(f'/api/v1/incidents/{inc_id}').get_json()
 
     # Cas invalide : champ manquant
     response_invalid = client.put(
@@ -194,6 +306,35 @@ def test_add_timeline_event(client):
     )
     assert response_invalid.status_code == 400
 
+    # Cas incident inexistant
+    response_404 = client.put(
+        '/api/v1/incidents/INC-UNKNOWN/timeline',
+        json={"type": "alert", "message": "CPU spike detected"}
+    )
+    assert response_404.status_code == 404
+
+
+def test_get_timeline_paginated(client):
+    """Teste la lecture paginée de la timeline avec 'after' et 'limit'."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Timeline pages", "sev": "low"}
+    ).get_json()["id"]
+    for i in range(3):
+        client.put(f'/api/v1/incidents/{inc_id}/timeline', json={"type": "note", "message": f"event {i}"})
+
+    first = client.get(f'/api/v1/incidents/{inc_id}/timeline?limit=2').get_json()
+    assert [e["message"] for e in first["data"]] == ["event 0", "event 1"]
+    assert first["next_after"] == first["data"][-1]["id"]
+
+    second = client.get(
+        f'/api/v1/incidents/{inc_id}/timeline?limit=2&after={first["next_after"]}').get_json()
+    assert [e["message"] for e in second["data"]] == ["event 2"]
+    assert second["next_after"] is None
+
+    assert client.get(f'/api/v1/incidents/{inc_id}/timeline?limit=0').status_code == 400
+    assert client.get('/api/v1/incidents/INC-UNKNOWN/timeline').status_code == 404
+
 
 def test_add_postmortem(client):
     """Teste l’ajout d’un postmortem à un incident."""
@@ -226,3 +367,905 @@ def test_add_postmortem(client):
         json={"what_happened": "Oops"}
     )
     assert response_invalid.status_code == 400
+
+
+# === TESTS DE CHARGEMENT EN MASSE ===
+
+def test_load_json_files_batches():
+    """Vérifie que loadJSONFiles charge plusieurs incidents et ignore les IDs absents."""
+    saveJSONFile({"id": "INC-BULK01", "title": "Bulk 1"})
+    saveJSONFile({"id": "INC-BULK02", "title": "Bulk 2"})
+
+    loaded = loadJSONFiles(["INC-BULK01", "INC-MISSING", "INC-BULK02"], batch_size=1)
+    assert [inc["id"] for inc in loaded] == ["INC-BULK01", "INC-BULK02"]
+
+
+def test_iter_incidents_scans_all_keys():
+    """Vérifie que iter_incidents parcourt tous les incidents, sans doublon."""
+    saveJSONFile({"id": "INC-SCAN01", "title": "Scan"})
+
+    ids = [inc["id"] for inc in iter_incidents(batch_size=2)]
+    assert "INC-SCAN01" in ids
+    assert len(ids) == len(set(ids))
+
+
+# === TESTS DE PAGINATION ===
+
+def test_paginate_incidents_with_cursor(client):
+    """Parcourt les incidents d'une fenêtre temporelle page par page grâce au curseur."""
+    for i in range(5):
+        incident = {"id": f"INC-PAGE0{i}", "title": f"Page {i}", "status": "open", "started_at": 1000 + i // 2}
+        saveJSONFile(incident)
+        indexIncident(incident)
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/v1/incidents?since=1000&until=1002&limit=2'
+        if cursor:
+            url += f'&cursor={cursor}'
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["count"] <= 2
+        seen.extend(inc["id"] for inc in body["data"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"INC-PAGE0{i}" for i in range(5)]
+
+    desc = client.get('/api/v1/incidents?since=1000&until=1002&limit=3&order=desc').get_json()
+    assert [inc["id"] for inc in desc["data"]] == ["INC-PAGE04", "INC-PAGE03", "INC-PAGE02"]
+
+
+def test_paginate_filtered_incidents(client):
+    """Pagine une liste filtrée dans l'intersection temporaire (ZINTERSTORE) de l'index temporel et des filtres."""
+    commander = f"pages-{uuid.uuid4().hex[:8]}"
+    ids = [client.post('/api/v1/incidents', json={"title": f"Filtrée {i}", "sev": "low"}).get_json()["id"]
+           for i in range(5)]
+    for inc_id in ids:
+        client.put(f'/api/v1/incidents/{inc_id}/assign', json={"commander": commander})
+    client.put(f'/api/v1/incidents/{ids[1]}/status', json={"status": "resolved"})
+
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/v1/incidents?commander={commander}&status=open&limit=2'
+        if cursor:
+            url += f'&cursor={cursor}'
+        body = client.get(url).get_json()
+        assert body["count"] <= 2
+        seen.extend(inc["id"] for inc in body["data"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ids[:1] + ids[2:]
+    key = filteredTimeIndex({"commander": commander, "status": "open"})
+    assert 0 < r.ttl(key) <= FILTERED_INDEX_TTL
+
+    # Une écriture change la version de la liste : l'intersection est recalculée
+    client.put(f'/api/v1/incidents/{ids[1]}/status', json={"status": "open"})
+    body = client.get(f'/api/v1/incidents?commander={commander}&status=open&limit=10&order=desc').get_json()
+    assert [inc["id"] for inc in body["data"]] == ids[::-1]
+
+
+def test_paginate_invalid_parameters(client):
+    """Vérifie que des paramètres de pagination invalides renvoient une erreur 400."""
+    assert client.get('/api/v1/incidents?limit=0').status_code == 400
+    assert client.get('/api/v1/incidents?since=hier').status_code == 400
+    assert client.get('/api/v1/incidents?cursor=invalide').status_code == 400
+
+
+# === TESTS DES SCRIPTS LUA ===
+
+def test_lua_transitions_preserve_document(client):
+    """Vérifie que les scripts Lua conservent le reste du document (listes vides comprises)."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Lua transitions", "sev": "low", "services": []}
+    ).get_json()["id"]
+
+    incident = setIncidentStatus(inc_id, "mitigated")
+    assert incident["status"] == "mitigated"
+    assert incident["services"] == []
+    assert "updated_at" in incident
+    assert inc_id in r.smembers("idx:status:mitigated")
+
+    incident = attachPostmortem(inc_id, {"what_happened": "x", "root_cause": "y", "action_items": []})
+    assert incident["postmortem"]["action_items"] == []
+    assert incident["status"] == "mitigated"
+
+    assert loadJSONFile(inc_id) == incident
+
+    # Seuls les champs modifiés sont réécrits : les autres (listes vides, grands entiers,
+    # chaînes échappées) restent tels quels
+    extra = {"tags": [], "meta": {"checks": [], "budget": 2 ** 62}, "note": 'guillemet " et \\ antislash'}
+    saveJSONFile(dict(incident, **extra))
+    assignCommander(inc_id, "lua")
+    bulkUpdateIncidents([inc_id], "status", "resolved")
+    incident = attachPostmortem(inc_id, {"what_happened": "z", "root_cause": "{,}", "action_items": [],
+                                         "cost": 2 ** 62})
+    assert {field: incident[field] for field in extra} == extra
+    assert incident["postmortem"]["cost"] == 2 ** 62
+    assert (incident["status"], incident["commander"]) == ("resolved", "lua")
+    assert loadJSONFile(inc_id) == incident
+
+
+def test_lua_invalid_status_and_missing_incident():
+    """Vérifie la validation côté Redis : statut invalide et incident inexistant."""
+    with pytest.raises(ValueError):
+        setIncidentStatus("INC-UNKNOWN", "closed")
+    assert setIncidentStatus("INC-UNKNOWN", "resolved") is None
+    assert assignCommander("INC-UNKNOWN", "thomas") is None
+
+
+def test_non_incident_keys_are_not_found(client):
+    """Les routes par ID et les scripts ignorent les clés qui ne sont pas des incidents (404, rien de modifié)."""
+    client.post('/api/v1/incidents', json={"title": "Index", "sev": "low"})
+    version = r.get(LIST_VERSION_KEY)
+    for key in ("idx:status:open", LIST_VERSION_KEY, STATS_SEVERITY_KEY):
+        assert client.put(f'/api/v1/incidents/{key}/assign', json={"commander": "mallory"}).status_code == 404
+        assert client.put(f'/api/v1/incidents/{key}/status', json={"status": "resolved"}).status_code == 404
+        assert client.put(f'/api/v1/incidents/{key}/timeline', json={"type": "note", "message": "x"}).status_code == 404
+        assert client.get(f'/api/v1/incidents/{key}').status_code == 404
+    assert r.get(LIST_VERSION_KEY) == version
+
+    # Clé au format d'un ID mais qui ne contient pas un document d'incident
+    broken = f"INC-CASSE-{uuid.uuid4().hex}"
+    r.set(broken, "pas un document")
+    assert assignCommander(broken, "mallory") is None
+    assert client.put(f'/api/v1/incidents/{broken}/status', json={"status": "resolved"}).status_code == 404
+    assert r.get(broken) == "pas un document"
+    r.delete(broken)
+
+
+# === TESTS DU STREAM DES MODIFICATIONS ===
+
+def test_changes_stream_records_updates(client):
+    """Vérifie que création, statut, assignation et timeline publient dans incidents:changes."""
+    last_id = r.xrevrange("incidents:changes", count=1)
+    last_id = last_id[0][0] if last_id else "0"
+
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Changes stream", "sev": "low"}
+    ).get_json()["id"]
+    client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "mitigated"})
+    client.put(f'/api/v1/incidents/{inc_id}/assign', json={"commander": "thomas"})
+    client.put(f'/api/v1/incidents/{inc_id}/timeline', json={"type": "note", "message": "ok"})
+
+    changes = [c for c in readChanges(last_id) if c["incident"] == inc_id]
+    assert [c["op"] for c in changes] == ["create", "status", "assign", "timeline"]
+    assert changes[1]["data"] == {"status": "mitigated"}
+    assert changes[2]["data"] == {"commander": "thomas"}
+    ids = [c["id"] for c in changes]
+    assert ids == sorted(ids, key=lambda entry_id: tuple(map(int, entry_id.split("-"))))
+
+
+# === TESTS DU CACHE LOCAL ===
+
+def test_cache_hits_and_invalidation(client):
+    """Vérifie que les lectures répétées sont servies par le cache et qu'une écriture l'invalide."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Cache", "sev": "low"}
+    ).get_json()["id"]
+
+    client.get(f'/api/v1/incidents/{inc_id}')
+    hits = cache.stats()["hits"]
+    client.get(f'/api/v1/incidents/{inc_id}')
+    assert cache.stats()["hits"] == hits + 1
+
+    client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "resolved"})
+    assert client.get(f'/api/v1/incidents/{inc_id}').get_json()["status"] == "resolved"
+
+    stats = client.get('/api/v1/incidents/health').get_json()["cache"]
+    assert stats["hits"] >= hits + 1
+    assert stats["misses"] >= 1
+
+
+def test_cache_ignores_stale_read():
+    """Un résultat lu avant une invalidation ne doit pas être mis en cache."""
+    generation = cache.generation
+    cache.invalidate("INC-STALE1")
+    cache.put("INC-STALE1", {"id": "INC-STALE1"}, generation)
+    assert cache.get("INC-STALE1") is None
+
+
+# === TESTS DES ETAGS ===
+
+def test_incident_etag_and_conditional_get(client):
+    """Vérifie l'ETag d'un incident et la réponse 304 tant qu'il n'est pas modifié."""
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "ETag", "sev": "low"}
+    ).get_json()["id"]
+
+    response = client.get(f'/api/v1/incidents/{inc_id}')
+    etag = response.headers["ETag"]
+    assert etag
+
+    not_modified = client.get(f'/api/v1/incidents/{inc_id}', headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    client.put(f'/api/v1/incidents/{inc_id}/assign', json={"commander": "thomas"})
+    modified = client.get(f'/api/v1/incidents/{inc_id}', headers={"If-None-Match": etag})
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != etag
+    assert modified.get_json()["commander"] == "thomas"
+
+    # ID inconnu : pas de version, donc jamais de 304 mais un 404
+    missing = client.get('/api/v1/incidents/INC-NOPE', headers={"If-None-Match": '"INC-NOPE-0"'})
+    assert missing.status_code == 404
+
+
+def test_list_etag_and_conditional_get(client):
+    """Vérifie que la liste répond 304 tant qu'aucun incident n'est créé ou modifié."""
+    etag = client.get('/api/v1/incidents?limit=1').headers["ETag"]
+    assert client.get('/api/v1/incidents?limit=1', headers={"If-None-Match": etag}).status_code == 304
+
+    client.post('/api/v1/incidents', json={"title": "ETag list", "sev": "low"})
+    assert client.get('/api/v1/incidents?limit=1', headers={"If-None-Match": etag}).status_code == 200
+
+
+# === TESTS DE LA COMPRESSION ===
+
+BIG_POSTMORTEM = {
+    "what_happened": "Saturation du pool de connexions. " * 200,
+    "root_cause": "Requête non indexée. " * 200,
+    "action_items": ["Ajouter un index"] * 50
+}
+
+
+def test_large_incident_is_compressed_transparently(client):
+    """Vérifie qu'un gros document est compressé dans Redis et relu à l'identique."""
+    if STORAGE_MODE != "json":
+        pytest.skip("La compression ne concerne que le mode de stockage 'json'")
+    inc_id = client.post(
+        '/api/v1/incidents',
+        json={"title": "Compression", "sev": "low"}
+    ).get_json()["id"]
+
+    # Le postmortem est écrit par un script Lua puis le document est recompressé
+    response = client.put(f'/api/v1/incidents/{inc_id}/postmortem', json=BIG_POSTMORTEM)
+    assert response.status_code == 200
+    assert compression.is_compressed(rb.get(inc_id))
+
+    # Un script Lua sur un document compressé : décompression puis recompression,
+    # sans toucher aux champs non modifiés
+    extra = {"tags": [], "meta": {"checks": [], "budget": 2 ** 62}}
+    saveJSONFile(dict(loadJSONFile(inc_id), **extra))
+    assert compression.is_compressed(rb.get(inc_id))
+    response = client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "resolved"})
+    assert response.status_code == 200
+    assert response.get_json()["postmortem"]["root_cause"] == BIG_POSTMORTEM["root_cause"]
+    assert compression.is_compressed(rb.get(inc_id))
+    assert {field: loadJSONFile(inc_id)[field] for field in extra} == extra
+
+    # Modification groupée : les documents modifiés sont recompressés en un seul pipeline
+    response = client.patch('/api/v1/incidents/bulk', json={"ids": [inc_id], "operation": "assign", "value": "zoe"})
+    assert response.get_json()["changed"] == [inc_id]
+    assert compression.is_compressed(rb.get(inc_id))
+
+    incident = client.get(f'/api/v1/incidents/{inc_id}').get_json()
+    assert incident["status"] == "resolved"
+    assert incident["commander"] == "zoe"
+    assert incident["postmortem"]["what_happened"] == BIG_POSTMORTEM["what_happened"]
+    listed = client.get('/api/v1/incidents?status=resolved').get_json()
+    assert any(inc["id"] == inc_id for inc in listed)
+
+
+def test_compression_roundtrip_and_threshold():
+    """Vérifie l'octet d'en-tête et le seuil de compression."""
+    small = b'{"id":"INC-SMALL1"}'
+    assert compression.compress(small, "zlib", 4096) is small
+    large = b'{"summary":"' + b"x" * 10000 + b'"}'
+    compressed = compression.compress(large, "zlib", 4096)
+    assert compression.is_compressed(compressed)
+    assert len(compressed) < len(large)
+    assert compression.decompress(compressed) == large
+    assert compression.decompress(small) == small
+
+
+# === TESTS DE CRÉATION PAR LOT ===
+
+def test_create_incidents_batch(client):
+    """Teste la création d'un lot d'incidents avec un résultat par élément."""
+    response = client.post('/api/v1/incidents/batch', json=[
+        {"title": "Batch 1", "sev": "high", "services": ["api-gateway"]},
+        {"title": "Batch invalide"},
+        {"title": "Batch 2", "sev": "low"}
+    ])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert body["created"] == 2
+    assert body["failed"] == 1
+    assert [result["status"] for result in body["results"]] == [201, 400, 201]
+
+    for result in (body["results"][0], body["results"][2]):
+        inc_id = result["incident"]["id"]
+        stored = client.get(f'/api/v1/incidents/{inc_id}').get_json()
+        assert stored["title"] == result["incident"]["title"]
+        assert inc_id in r.smembers("idx:status:open")
+
+
+def test_create_incidents_batch_invalid(client):
+    """Vérifie les cas invalides : pas un tableau, tableau vide, aucun élément valide."""
+    assert client.post('/api/v1/incidents/batch', json={"title": "x", "sev": 1}).status_code == 400
+    assert client.post('/api/v1/incidents/batch', json=[]).status_code == 400
+    response = client.post('/api/v1/incidents/batch', json=[{"title": "x"}])
+    assert response.status_code == 400
+    assert response.get_json()["created"] == 0
+
+
+# === TESTS DE MODIFICATION GROUPÉE ===
+
+def test_bulk_update_by_ids(client):
+    """Teste le changement de statut groupé par IDs (modifiés, inchangés, introuvables)."""
+    ids = [client.post('/api/v1/incidents', json={"title": f"Bulk {i}", "sev": "high"}).get_json()["id"]
+           for i in range(3)]
+    client.put(f'/api/v1/incidents/{ids[2]}/status', json={"status": "resolved"})
+
+    response = client.patch('/api/v1/incidents/bulk', json={
+        "ids": ids + ["INC-NOPE00"], "operation": "status", "value": "resolved"
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert sorted(body["changed"]) == sorted(ids[:2])
+    assert body["unchanged"] == [ids[2]]
+    assert body["not_found"] == ["INC-NOPE00"]
+    assert body["matched"] == 3
+    for inc_id in ids:
+        assert client.get(f'/api/v1/incidents/{inc_id}').get_json()["status"] == "resolved"
+        assert inc_id in r.smembers("idx:status:resolved")
+        assert inc_id not in r.smembers("idx:status:open")
+
+
+def test_bulk_assign_by_filter(client):
+    """Teste l'assignation groupée des incidents filtrés par service."""
+    # Services propres à l'exécution : les incidents des exécutions précédentes ne sont pas ciblés
+    billing, search = f"bulk-billing-{uuid.uuid4().hex[:8]}", f"bulk-search-{uuid.uuid4().hex[:8]}"
+    target = client.post('/api/v1/incidents', json={
+        "title": "Bulk service", "sev": "low", "services": [billing]
+    }).get_json()["id"]
+    other = client.post('/api/v1/incidents', json={
+        "title": "Bulk autre", "sev": "low", "services": [search]
+    }).get_json()["id"]
+
+    response = client.patch('/api/v1/incidents/bulk', json={
+        "filter": {"status": "open", "services": [billing]}, "operation": "assign", "value": "camille"
+    })
+    assert response.status_code == 200
+    assert response.get_json()["changed"] == [target]
+    assert client.get(f'/api/v1/incidents/{target}').get_json()["commander"] == "camille"
+    assert client.get(f'/api/v1/incidents/{other}').get_json().get("commander") != "camille"
+    assert target in r.smembers("idx:commander:camille")
+
+
+def test_bulk_update_invalid(client):
+    """Vérifie les requêtes groupées invalides."""
+    inc_id = client.post('/api/v1/incidents', json={"title": "Bulk invalide", "sev": "low"}).get_json()["id"]
+    invalid = [
+        {"ids": [inc_id], "operation": "delete", "value": "x"},
+        {"ids": [inc_id], "operation": "status"},
+        {"ids": [inc_id], "filter": {"status": "open"}, "operation": "status", "value": "resolved"},
+        {"filter": {"sev": "low"}, "operation": "status", "value": "resolved"},
+        {"ids": [inc_id], "operation": "status", "value": "closed"},
+        {"filter": {"services": 5}, "operation": "status", "value": "resolved"},
+        {"filter": {"services": ["api", 5]}, "operation": "status", "value": "resolved"},
+        {"filter": {"status": ["open"]}, "operation": "status", "value": "resolved"},
+        {"filter": {"commander": {"id": "zoe"}}, "operation": "status", "value": "resolved"},
+        [{"ids": [inc_id], "operation": "status", "value": "resolved"}],
+        {"ids": [inc_id, "idempotency:/api/v1/incidents:k1"], "operation": "assign", "value": "mallory"},
+        {"ids": [f"{inc_id}:timeline"], "operation": "assign", "value": "mallory"},
+    ]
+    for payload in invalid:
+        assert client.patch('/api/v1/incidents/bulk', json=payload).status_code == 400
+    assert client.get(f'/api/v1/incidents/{inc_id}').get_json()["status"] == "open"
+
+    # Les clés qui ne sont pas des incidents (autre type Redis) ne sont jamais modifiées
+    other = f"INC-AUTRE-{uuid.uuid4().hex}"
+    if STORAGE_MODE == "hash":
+        r.set(other, "pas un incident")
+    else:
+        r.hset(other, "champ", "valeur")
+    changed, unchanged, missing = bulkUpdateIncidents([other, STATS_SEVERITY_KEY], "assign", "mallory")
+    assert (changed, unchanged, sorted(missing)) == ([], [], sorted([other, STATS_SEVERITY_KEY]))
+    assert not r.sismember("idx:commander:mallory", other)
+    r.delete(other)
+
+
+# === TESTS DE RECHERCHE PLEIN TEXTE ===
+
+def test_search_ranks_and_updates(client):
+    """Teste la recherche : classement titre > résumé, postmortem indexé, anciens termes retirés."""
+    term, rare = f"zorglub{uuid.uuid4().hex[:8]}", f"flibustier{uuid.uuid4().hex[:8]}"
+    in_title = client.post('/api/v1/incidents', json={
+        "title": f"Latence {term} sur la passerelle", "sev": "high", "summary": "Requêtes lentes"
+    }).get_json()["id"]
+    in_summary = client.post('/api/v1/incidents', json={
+        "title": "Erreurs 500", "sev": "low", "summary": f"La passerelle {term.capitalize()} répond mal"
+    }).get_json()["id"]
+
+    body = client.get(f'/api/v1/incidents/search?q={term}').get_json()
+    assert [result["id"] for result in body["data"]] == [in_title, in_summary]
+    body = client.get(f'/api/v1/incidents/search?q=PASSERELLE {term} latence').get_json()
+    assert [result["id"] for result in body["data"]] == [in_title]
+
+    client.put(f'/api/v1/incidents/{in_summary}/postmortem', json={
+        "what_happened": "Certificat expiré", "root_cause": f"Renouvellement {rare} oublié",
+        "action_items": ["Alerter avant expiration"]
+    })
+    body = client.get(f'/api/v1/incidents/search?q={rare}').get_json()
+    assert [result["id"] for result in body["data"]] == [in_summary]
+
+    incident = loadJSONFile(in_title)
+    incident["title"] = "Latence sur la passerelle"
+    saveJSONFile(incident)
+    body = client.get(f'/api/v1/incidents/search?q={term}').get_json()
+    assert [result["id"] for result in body["data"]] == [in_summary]
+
+
+def test_search_invalid_parameters(client):
+    """Vérifie les paramètres de recherche invalides et les requêtes sans terme utile."""
+    assert client.get('/api/v1/incidents/search').status_code == 400
+    assert client.get('/api/v1/incidents/search?q=panne&limit=0').status_code == 400
+    response = client.get('/api/v1/incidents/search?q=le la')
+    assert response.status_code == 200
+    assert response.get_json()["data"] == []
+
+
+# === TESTS DES STATISTIQUES ===
+
+def test_stats_follow_creations_and_transitions(client):
+    """Vérifie les compteurs par sévérité et statut et le MTTR après création, résolution et réouverture."""
+    before = client.get('/api/v1/incidents/stats').get_json()
+    ids = [client.post('/api/v1/incidents', json={"title": f"Stats {i}", "sev": "stats-sev"}).get_json()["id"]
+           for i in range(2)]
+    incident = client.put(f'/api/v1/incidents/{ids[0]}/status', json={"status": "resolved"}).get_json()
+    assert incident["resolved_at"] >= incident["started_at"]
+
+    stats = client.get('/api/v1/incidents/stats').get_json()
+    assert stats["by_severity"]["stats-sev"] == before["by_severity"].get("stats-sev", 0) + 2
+    assert stats["total"] == before["total"] + 2
+    assert stats["by_status"]["open"] == before["by_status"].get("open", 0) + 1
+    assert stats["by_status"]["resolved"] == before["by_status"].get("resolved", 0) + 1
+    assert stats["resolved"] == before["resolved"] + 1
+    assert stats["mttr_seconds"] is not None
+
+    client.put(f'/api/v1/incidents/{ids[0]}/status', json={"status": "open"})
+    stats = client.get('/api/v1/incidents/stats').get_json()
+    assert stats["resolved"] == before["resolved"]
+    assert stats["by_status"]["open"] == before["by_status"].get("open", 0) + 2
+    assert loadJSONFile(ids[0])["resolved_at"] is None
+
+
+def test_stats_days(client):
+    """Vérifie les compteurs par jour et les paramètres invalides."""
+    client.post('/api/v1/incidents', json={"title": "Stats du jour", "sev": "low"})
+    stats = client.get('/api/v1/incidents/stats?days=3').get_json()
+    assert len(stats["days"]) == 3
+    assert stats["days"][-1]["date"] == statsDay(time.time())
+    assert stats["days"][-1]["created"] >= 1
+    assert client.get('/api/v1/incidents/stats?days=-1').status_code == 400
+    assert client.get('/api/v1/incidents/stats?days=x').status_code == 400
+
+
+def test_stats_rebuild(client, isolated_db):
+    """Vérifie le recalcul complet des statistiques (dans une base séparée : il efface les compteurs)."""
+    shared = r.hgetall(STATS_STATUS_KEY)
+    ids = [client.post('/api/v1/incidents', json={"title": f"Recalcul {i}", "sev": "low"}).get_json()["id"]
+           for i in range(3)]
+    client.put(f'/api/v1/incidents/{ids[0]}/status', json={"status": "resolved"})
+    isolated_db.delete(STATS_SEVERITY_KEY, STATS_STATUS_KEY, STATS_RESOLUTION_KEY)
+
+    assert rebuildStats() == 3
+    stats = loadStats()
+    assert stats["total"] == 3
+    assert stats["by_severity"] == {"low": 3}
+    assert stats["by_status"] == {"open": 2, "resolved": 1}
+    assert stats["resolved"] == 1
+    assert r.hgetall(STATS_STATUS_KEY) == shared
+
+
+# === TESTS DE L'ARCHIVE ===
+
+@pytest.fixture
+def cold_archive(tmp_path, monkeypatch):
+    """Archive SQLite temporaire, propre au test."""
+    store = IncidentArchive(str(tmp_path / "archive.db"))
+    monkeypatch.setattr(redis_link, "archive", store)
+    return store
+
+
+def old_resolved_incident():
+    # Incident résolu en 1970 : seul concerné par un archivage à plus de 10000 jours
+    incident = {
+        "id": f"INC-{uuid.uuid4().hex[:6].upper()}", "title": "Vieil incident", "sev": "low",
+        "services": ["legacy"], "summary": "", "status": "resolved", "started_at": 500,
+        "resolved_at": 1000, "commander": "archiviste"
+    }
+    createIncident(incident)
+    return incident["id"]
+
+
+def test_archive_and_read_through(client, cold_archive):
+    """Teste l'archivage, la lecture au travers de l'archive et la remise dans Redis à la modification."""
+    inc_id = old_resolved_incident()
+    client.put(f'/api/v1/incidents/{inc_id}/timeline', json={"type": "note", "message": "Clôture"})
+
+    assert archiveResolvedIncidents(older_than_days=10000) >= 1
+    assert not r.exists(inc_id)
+    assert inc_id not in r.smembers("idx:status:resolved")
+    assert inc_id in cold_archive.ids()
+
+    assert client.get(f'/api/v1/incidents/{inc_id}').get_json()["title"] == "Vieil incident"
+    timeline = client.get(f'/api/v1/incidents/{inc_id}/timeline').get_json()
+    assert [event["message"] for event in timeline["data"]] == ["Clôture"]
+
+    page = client.get('/api/v1/incidents?since=400&until=600&include_archived=true').get_json()
+    assert inc_id in [incident["id"] for incident in page["data"]]
+    page = client.get('/api/v1/incidents?since=400&until=600').get_json()
+    assert inc_id not in [incident["id"] for incident in page["data"]]
+    listing = client.get('/api/v1/incidents?commander=archiviste&include_archived=true').get_json()
+    assert inc_id in [incident["id"] for incident in listing]
+
+    response = client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "open"})
+    assert response.status_code == 200
+    assert r.exists(inc_id)
+    assert inc_id not in cold_archive.ids()
+    timeline = client.get(f'/api/v1/incidents/{inc_id}/timeline').get_json()
+    assert [event["message"] for event in timeline["data"]] == ["Clôture"]
+
+
+def test_archive_skips_concurrent_update(client, cold_archive, monkeypatch):
+    """Un incident modifié pendant l'archivage reste dans Redis et n'est pas gardé dans l'archive."""
+    inc_id = old_resolved_incident()
+    load = redis_link.loadJSONFiles
+
+    def load_then_update(ids):
+        client.put(f'/api/v1/incidents/{inc_id}/timeline', json={"type": "note", "message": "Concurrent"})
+        return load(ids)
+
+    monkeypatch.setattr(redis_link, "loadJSONFiles", load_then_update)
+    archiveResolvedIncidents(older_than_days=10000)
+    assert r.exists(inc_id)
+    assert inc_id not in cold_archive.ids()
+
+
+
+def test_archive_requires_explicit_path(client, monkeypatch):
+    """Sans INCIDENT_ARCHIVE_PATH, l'archive est vide et l'archivage est refusé (rien ne quitte Redis)."""
+    monkeypatch.setattr(redis_link, "archive", IncidentArchive(None))
+    inc_id = old_resolved_incident()
+    with pytest.raises(ValueError):
+        archiveResolvedIncidents(older_than_days=10000)
+    assert r.exists(inc_id)
+    assert client.get('/api/v1/incidents/INC-NOPE00').status_code == 404
+    assert client.get('/api/v1/incidents?since=400&until=600&include_archived=true').status_code == 200
+
+# === TESTS DE L'ATTENTE DES MODIFICATIONS ===
+
+def test_poll_changes(client):
+    """Teste la lecture des modifications après un ID, sans attente puis à expiration du délai."""
+    after = lastChangeId()
+    inc_id = client.post('/api/v1/incidents', json={"title": "Poll", "sev": "low"}).get_json()["id"]
+
+    body = client.get(f'/api/v1/incidents/changes?after={after}&timeout=0').get_json()
+    assert [change["incident"] for change in body["data"]] == [inc_id]
+    assert body["data"][0]["op"] == "create"
+
+    body = client.get(f'/api/v1/incidents/changes?after={body["last_id"]}&timeout=0.2').get_json()
+    assert body["data"] == []
+    assert client.get('/api/v1/incidents/changes?after=pas-un-id&timeout=0').status_code == 400
+
+
+# === TESTS DE L'EXPORT NDJSON ===
+
+def test_export_ndjson(client):
+    """Teste l'export en flux : une ligne JSON par incident, avec les filtres de la liste."""
+    ids = [client.post('/api/v1/incidents', json={"title": f"Export {i}", "sev": "low"}).get_json()["id"]
+           for i in range(3)]
+    commander = f"exportateur-{uuid.uuid4().hex[:8]}"
+    client.put(f'/api/v1/incidents/{ids[0]}/assign', json={"commander": commander})
+
+    response = client.get('/api/v1/incidents/export?format=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.get_data().splitlines()]
+    assert set(ids) <= {incident["id"] for incident in exported}
+
+    response = client.get(f'/api/v1/incidents/export?commander={commander}')
+    assert [json.loads(line)["id"] for line in response.get_data().splitlines()] == [ids[0]]
+
+    started_at = loadJSONFile(ids[1])["started_at"]
+    response = client.get(f'/api/v1/incidents/export?status=open&since={started_at}&until={started_at}')
+    assert ids[1] in [json.loads(line)["id"] for line in response.get_data().splitlines()]
+    response = client.get(f'/api/v1/incidents/export?since={started_at}&until={started_at}')
+    assert ids[1] in [json.loads(line)["id"] for line in response.get_data().splitlines()]
+
+
+def test_export_invalid_parameters(client):
+    """Vérifie les paramètres d'export invalides."""
+    assert client.get('/api/v1/incidents/export?format=csv').status_code == 400
+    assert client.get('/api/v1/incidents/export?since=hier').status_code == 400
+
+
+# === TESTS DES CHAMPS DEMANDÉS (fields) ===
+
+def test_sparse_fieldsets(client):
+    """Vérifie que 'fields' limite les champs renvoyés par la liste et la lecture par ID."""
+    inc_id = client.post('/api/v1/incidents', json={
+        "title": "Champs", "sev": "high", "summary": "Long résumé " * 50, "services": ["api"]
+    }).get_json()["id"]
+
+    response = client.get(f'/api/v1/incidents/{inc_id}?fields=title,status')
+    assert response.status_code == 200
+    assert response.get_json() == {"id": inc_id, "title": "Champs", "status": "open"}
+    assert client.get('/api/v1/incidents/INC-NOPE00?fields=title').status_code == 404
+
+    response = client.get('/api/v1/incidents?fields=id,title,sev,status&status=open')
+    incidents = {incident["id"]: incident for incident in response.get_json()}
+    assert incidents[inc_id] == {"id": inc_id, "title": "Champs", "sev": "high", "status": "open"}
+
+    page = client.get('/api/v1/incidents?limit=500&fields=sev').get_json()
+    assert {"id": inc_id, "sev": "high"} in page["data"]
+    assert all(set(incident) <= {"id", "sev"} for incident in page["data"])
+
+    assert all(set(incident) <= {"id", "title"} for incident in client.get('/api/v1/incidents?fields=title').get_json())
+    assert client.get('/api/v1/incidents?fields=,').status_code == 400
+    assert client.get(f'/api/v1/incidents/{inc_id}?fields=').status_code == 400
+
+
+# === TESTS DES IDS D'INCIDENTS ===
+
+def test_incident_ids_are_sortable(client):
+    """Vérifie que les nouveaux IDs sont triés par date de création et portent leur horodatage."""
+    ids = [client.post('/api/v1/incidents', json={"title": f"Tri {i}", "sev": "low"}).get_json()["id"]
+           for i in range(5)]
+    assert all(identifiers.SORTABLE_ID.match(inc_id) for inc_id in ids)
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    incident = loadJSONFile(ids[0])
+    assert identifiers.timestamp(ids[0]) // 1000 == incident["started_at"]
+    assert identifiers.timestamp("INC-A1B2C3") is None
+
+
+def test_create_never_overwrites_existing_id():
+    """Un ID déjà pris (ancien format compris) n'écrase pas l'incident existant."""
+    legacy_id = f"INC-{uuid.uuid4().hex[:6].upper()}"
+    original = {"id": legacy_id, "title": "Ancien", "sev": "low", "services": [], "summary": "",
+                "status": "open", "started_at": 1, "commander": None}
+    createIncident(dict(original))
+    assert loadJSONFile(legacy_id)["title"] == "Ancien"
+
+    duplicate = createIncident(dict(original, title="Doublon"))
+    assert duplicate["id"] != legacy_id
+    assert identifiers.SORTABLE_ID.match(duplicate["id"])
+    assert loadJSONFile(legacy_id)["title"] == "Ancien"
+    assert loadJSONFile(duplicate["id"])["title"] == "Doublon"
+
+
+# === TESTS DE L'IDEMPOTENCE ===
+
+def test_idempotent_create(client):
+    """Une création rejouée avec la même Idempotency-Key renvoie la première réponse sans rien créer."""
+    key = {"Idempotency-Key": uuid.uuid4().hex}
+    first = client.post('/api/v1/incidents', json={"title": "Idempotent", "sev": "low"}, headers=key)
+    assert first.status_code == 201
+    before = lastChangeId()
+
+    replay = client.post('/api/v1/incidents', json={"title": "Idempotent", "sev": "low"}, headers=key)
+    assert replay.status_code == 201
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.get_json() == first.get_json()
+    assert lastChangeId() == before
+
+    other = client.post('/api/v1/incidents', json={"title": "Idempotent", "sev": "low"},
+                        headers={"Idempotency-Key": uuid.uuid4().hex})
+    assert other.get_json()["id"] != first.get_json()["id"]
+
+    # La clé est propre à la route ; une erreur 4xx est aussi rejouée
+    batch = client.post('/api/v1/incidents/batch', json=[], headers=key)
+    assert batch.status_code == 400
+    assert client.post('/api/v1/incidents/batch', json=[{"title": "Lot", "sev": "low"}], headers=key).status_code == 400
+
+
+def test_idempotent_replay_keeps_headers(client, monkeypatch):
+    """Une réponse rejouée garde ses en-têtes, comme le nombre d'occurrences d'une création regroupée."""
+    monkeypatch.setattr(redis_link, "COALESCE_WINDOW", 60)
+    payload = {"title": f"Rejeu regroupé {uuid.uuid4().hex}", "sev": "low"}
+    inc_id = client.post('/api/v1/incidents', json=payload).get_json()["id"]
+    key = {"Idempotency-Key": uuid.uuid4().hex}
+    duplicate = client.post('/api/v1/incidents', json=payload, headers=key)
+    assert duplicate.status_code == 200
+    assert duplicate.headers["Incident-Occurrences"] == "2"
+
+    replay = client.post('/api/v1/incidents', json=payload, headers=key)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.headers["Incident-Occurrences"] == "2"
+    assert replay.headers["Content-Type"] == duplicate.headers["Content-Type"]
+    assert replay.get_json()["id"] == inc_id
+    events = client.get(f'/api/v1/incidents/{inc_id}/timeline').get_json()["data"]
+    assert [event["count"] for event in events if event["type"] == "duplicate"] == [2]
+
+
+def test_idempotency_key_in_progress(client):
+    """Une requête dont la clé est encore réservée reçoit un 409 ; une clé trop longue un 400."""
+    key = uuid.uuid4().hex
+    assert reserveIdempotencyKey(f"/api/v1/incidents:{key}") is None
+    response = client.post('/api/v1/incidents', json={"title": "En cours", "sev": "low"},
+                           headers={"Idempotency-Key": key})
+    assert response.status_code == 409
+    response = client.post('/api/v1/incidents', json={"title": "Trop long", "sev": "low"},
+                           headers={"Idempotency-Key": "k" * 300})
+    assert response.status_code == 400
+
+
+# === TESTS DU REGROUPEMENT DES CRÉATIONS EN DOUBLE ===
+
+def test_duplicate_creates_are_coalesced(client, monkeypatch):
+    """Les créations de même empreinte sont regroupées dans l'incident ouvert, avec un compteur."""
+    monkeypatch.setattr(redis_link, "COALESCE_WINDOW", 60)
+    service = f"svc-{uuid.uuid4().hex[:8]}"
+    first = client.post('/api/v1/incidents', json={"title": "Base de données injoignable", "sev": "high",
+                                                   "services": [service, "api"]})
+    assert first.status_code == 201
+    inc_id = first.get_json()["id"]
+
+    for occurrence in (2, 3):
+        duplicate = client.post('/api/v1/incidents', json={"title": "  base de DONNÉES injoignable ", "sev": "high",
+                                                           "services": ["api", service]})
+        assert duplicate.status_code == 200
+        assert duplicate.get_json()["id"] == inc_id
+        assert duplicate.headers["Incident-Occurrences"] == str(occurrence)
+    events = client.get(f'/api/v1/incidents/{inc_id}/timeline').get_json()["data"]
+    assert [event["count"] for event in events if event["type"] == "duplicate"] == [2, 3]
+
+    # Autres services : nouvel incident ; incident résolu : plus de regroupement
+    other = client.post('/api/v1/incidents', json={"title": "Base de données injoignable", "sev": "high",
+                                                   "services": [service]})
+    assert other.status_code == 201
+    client.put(f'/api/v1/incidents/{inc_id}/status', json={"status": "resolved"})
+    again = client.post('/api/v1/incidents', json={"title": "Base de données injoignable", "sev": "high",
+                                                   "services": [service, "api"]})
+    assert again.status_code == 201
+    assert again.get_json()["id"] != inc_id
+
+
+def test_concurrent_duplicate_creates_make_one_incident(monkeypatch):
+    """Des créations simultanées de même empreinte ne créent qu'un incident : l'empreinte est réservée atomiquement."""
+    monkeypatch.setattr(redis_link, "COALESCE_WINDOW", 60)
+    payload = {"title": f"Créations simultanées {uuid.uuid4().hex}", "sev": "high", "services": ["api"]}
+    start = threading.Barrier(20)
+    responses = []
+
+    def create():
+        with app.test_client() as concurrent:
+            start.wait()
+            responses.append(concurrent.post('/api/v1/incidents', json=payload))
+
+    workers = [threading.Thread(target=create) for _ in range(20)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(response.status_code for response in responses) == [200] * 19 + [201]
+    assert len({response.get_json()["id"] for response in responses}) == 1
+    occurrences = sorted(int(response.headers["Incident-Occurrences"]) for response in responses
+                         if response.status_code == 200)
+    assert occurrences == list(range(2, 21))
+
+
+def test_coalescing_never_answers_a_missing_incident(client, monkeypatch):
+    """Une création échouée ne laisse pas d'empreinte ; une empreinte orpheline n'est pas suivie."""
+    monkeypatch.setattr(redis_link, "COALESCE_WINDOW", 60)
+    payload = {"title": f"Création échouée {uuid.uuid4().hex}", "sev": "high"}
+
+    def unavailable(objs):
+        raise redis.exceptions.ConnectionError("Redis indisponible")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(redis_link, "reserveIncidentIds", unavailable)
+        assert client.post('/api/v1/incidents', json=payload).status_code == 503
+    first = client.post('/api/v1/incidents', json=payload)
+    assert first.status_code == 201
+
+    # Incident disparu de Redis : la création suivante crée un nouvel incident
+    r.delete(first.get_json()["id"])
+    again = client.post('/api/v1/incidents', json=payload)
+    assert again.status_code == 201
+    assert again.get_json()["id"] != first.get_json()["id"]
+    assert client.post('/api/v1/incidents', json=payload).get_json()["id"] == again.get_json()["id"]
+
+
+def test_coalescing_disabled_by_default(client):
+    """Sans fenêtre configurée, chaque création crée un incident."""
+    payload = {"title": f"Sans regroupement {uuid.uuid4().hex}", "sev": "low"}
+    ids = {client.post('/api/v1/incidents', json=payload).get_json()["id"] for _ in range(2)}
+    assert len(ids) == 2
+
+
+# === TESTS DU FLUX SSE ===
+
+def test_sse_stream_resumes_with_filters(client):
+    """Le flux SSE reprend après Last-Event-ID et ne garde que les incidents filtrés."""
+    after = lastChangeId()
+    open_id = client.post('/api/v1/incidents', json={"title": "SSE ouvert", "sev": "low"}).get_json()["id"]
+    resolved_id = client.post('/api/v1/incidents', json={"title": "SSE résolu", "sev": "low"}).get_json()["id"]
+    client.put(f'/api/v1/incidents/{resolved_id}/status', json={"status": "resolved"})
+    client.put(f'/api/v1/incidents/{resolved_id}/timeline', json={"type": "note", "message": "Clos"})
+
+    response = client.get('/api/v1/incidents/stream?status=resolved', headers={"Last-Event-ID": after})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry: ")
+    content = next(chunks).decode()
+    response.close()
+    events = [json.loads(line[len("data: "):]) for line in content.splitlines() if line.startswith("data: ")]
+    assert [(event["op"], event["incident"]) for event in events] == [("status", resolved_id), ("timeline", resolved_id)]
+    assert f"id: {events[-1]['id']}" in content
+    assert open_id not in content
+
+    assert client.get('/api/v1/incidents/stream', headers={"Last-Event-ID": "hier"}).status_code == 400
+
+
+def test_change_feed_wakes_waiting_clients(client):
+    """Le lecteur unique du stream réveille les clients en attente et garde les modifications en mémoire."""
+    feed = ChangeFeed(size=2)
+    feed.listen()
+    assert feed.wait("0-0", 5)
+    after = feed.last
+    assert feed.since(after) == []
+    assert not feed.wait(after, 0.05)
+
+    ids = [client.post('/api/v1/incidents', json={"title": f"Lecteur SSE {uuid.uuid4().hex}", "sev": "low"}).get_json()["id"]
+           for _ in range(3)]
+    deadline = time.monotonic() + 5
+    while streamPosition(feed.last) < streamPosition(lastChangeId()) and time.monotonic() < deadline:
+        feed.wait(feed.last, 1)
+    # Seules les 2 dernières modifications sont gardées : la reprise depuis 'after' doit relire le stream
+    assert feed.since(after) is None
+    assert [change["incident"] for change in feed.since(feed.start)] == ids[-2:]
+
+# === TESTS DE L'INDEX DES SERVICES ===
+
+def test_service_index_and_routes(client):
+    """Vérifie l'index des services, la liste des incidents d'un service et le résumé par service."""
+    gateway, billing = f"gateway-{uuid.uuid4().hex[:8]}", f"billing-{uuid.uuid4().hex[:8]}"
+    first = client.post('/api/v1/incidents', json={"title": "Passerelle", "sev": "high",
+                                                   "services": [gateway, billing]}).get_json()["id"]
+    second = client.post('/api/v1/incidents', json={"title": "Passerelle 2", "sev": "low",
+                                                    "services": [gateway]}).get_json()["id"]
+    client.put(f'/api/v1/incidents/{second}/status', json={"status": "mitigated"})
+    assert r.smembers(f"idx:service:{gateway}") == {first, second}
+
+    response = client.get(f'/api/v1/services/{gateway}/incidents')
+    assert sorted(incident["id"] for incident in response.get_json()) == sorted([first, second])
+    response = client.get(f'/api/v1/services/{gateway}/incidents?status=open&fields=title')
+    assert response.get_json() == [{"id": first, "title": "Passerelle"}]
+    page = client.get(f'/api/v1/services/{gateway}/incidents?limit=1').get_json()
+    assert page["count"] == 1 and page["next_cursor"]
+    following = client.get(f'/api/v1/services/{gateway}/incidents?limit=1&cursor={page["next_cursor"]}').get_json()
+    assert [page["data"][0]["id"], following["data"][0]["id"]] == [first, second]
+    assert following["next_cursor"] is None
+    assert r.exists(filteredTimeIndex({"service": gateway}))
+    assert [incident["id"] for incident in client.get(f'/api/v1/incidents?service={billing}').get_json()] == [first]
+    assert client.get(f'/api/v1/services/{gateway}/incidents?include_archived=true').status_code == 400
+
+    summary = {item["service"]: item for item in client.get('/api/v1/services').get_json()["data"]}
+    assert summary[gateway] == {"service": gateway, "total": 2, "open": 1, "mitigated": 1}
+    assert summary[billing] == {"service": billing, "total": 1, "open": 1, "mitigated": 0}
+
+    # Le remplacement des services met l'index à jour ; le filtre 'services' du bulk l'utilise
+    incident = loadJSONFile(first)
+    indexIncident(saveJSONFile(dict(incident, services=[billing])), incident)
+    assert r.smembers(f"idx:service:{gateway}") == {second}
+    assert selectIncidentIds(services=[gateway, billing]) == sorted([first, second])
+    assert selectIncidentIds(services=[gateway, billing], status="open") == [first]
+
+    assert client.post('/api/v1/incidents', json={"title": "Invalide", "sev": "low",
+                                                  "services": "api"}).status_code == 400